@@ -0,0 +1,114 @@
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# порядок байт в машинном слове, см. CRC8.py
+SWAP_BYTES = sys.byteorder == 'little'
+# короче этой длины быстрее обычный побайтовый цикл
+WORD_THRESHOLD = 32
+# длина куска, crc которого numpy считает одной свёрткой,
+# и сколько таких кусков обрабатывается за раз
+CHUNK = 256
+CHUNKS_PER_PASS = 1024
+
+
+def swap(word):
+    return (word & 0xFF) << 8 | word >> 8
+
+
+class CRC16:
+    """
+    CRC-16 футера фрейма flac: полином x^16 + x^15 + x^2 + 1 (0x8005),
+    без отражения бит, начальное значение 0.
+    CRC всего фрейма вместе с футером равна нулю
+    """
+    def __init__(self):
+        self.crcTable = []
+        for i in range(256):
+            crc = i << 8
+            for _ in range(8):
+                crc = (crc << 1 ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xFFFF
+            self.crcTable.append(crc)
+        # таблица на два байта сразу, индекс - слово данных в машинном
+        # порядке с наложенным значением crc (в том же порядке)
+        self.wordTable = None
+        # chunkTable[k][b] - crc байта b, за которым идут k нулевых байт
+        self.chunkTable = None
+        # вклад старшего и младшего байта crc в crc следующего куска
+        self.carryTables = None
+
+    def get_crc(self, data, crc=0):
+        """
+        :param data: bytes, bytearray или memoryview, копия не делается
+        :param crc: значение crc предыдущего куска данных
+        """
+        if len(data) < WORD_THRESHOLD:
+            return self.__bytes_crc(data, crc)
+        view = memoryview(data).cast('B')
+        if np is not None and len(view) >= CHUNK:
+            return self.__numpy_crc(view, crc)
+        return self.__words_crc(view, crc)
+
+    def __bytes_crc(self, data, crc):
+        table = self.crcTable
+        for b in data:
+            crc = (crc << 8 & 0xFFFF) ^ table[crc >> 8 ^ b]
+        return crc
+
+    def __words_crc(self, view, crc):
+        if self.wordTable is None:
+            self.wordTable = self.__make_word_table()
+        words = len(view) // 2
+        table = self.wordTable
+        if SWAP_BYTES:
+            crc = swap(crc)
+        for word in view[:2 * words].cast('H'):
+            crc = table[crc ^ word]
+        if SWAP_BYTES:
+            crc = swap(crc)
+        return self.__bytes_crc(view[2 * words:], crc)
+
+    def __make_word_table(self):
+        table = []
+        for word in range(0x10000):
+            crc = swap(word) if SWAP_BYTES else word
+            crc = self.__bytes_crc(b'\0\0', crc)
+            table.append(swap(crc) if SWAP_BYTES else crc)
+        return table
+
+    def __numpy_crc(self, view, crc):
+        """
+        CRC линейна: crc куска - xor вкладов отдельных байт, вклад байта
+        зависит только от его значения и расстояния до конца куска.
+        Куски по CHUNK байт считаются разом, между собой сцепляются через
+        вклад crc предыдущих данных
+        """
+        if self.chunkTable is None:
+            self.chunkTable = self.__make_chunk_table()
+            self.carryTables = (self.chunkTable[CHUNK - 1].tolist(),
+                                self.chunkTable[CHUNK - 2].tolist())
+        table = self.chunkTable
+        data = np.frombuffer(view, dtype=np.uint8)
+        chunks = len(data) // CHUNK
+        distance = np.arange(CHUNK - 1, -1, -1)
+        first, second = self.carryTables
+        for begin in range(0, chunks, CHUNKS_PER_PASS):
+            end = min(begin + CHUNKS_PER_PASS, chunks)
+            block = data[begin * CHUNK:end * CHUNK].reshape(end - begin, CHUNK)
+            crcs = np.bitwise_xor.reduce(table[distance, block], axis=1)
+            for chunk_crc in crcs.tolist():
+                crc = first[crc >> 8] ^ second[crc & 0xFF] ^ chunk_crc
+        return self.__bytes_crc(view[chunks * CHUNK:], crc)
+
+    def __make_chunk_table(self):
+        crc_table = np.array(self.crcTable, dtype=np.uint16)
+        table = np.empty((CHUNK, 256), dtype=np.uint16)
+        table[0] = crc_table
+        for k in range(1, CHUNK):
+            # дописать нулевой байт: crc = (crc << 8) ^ T[crc >> 8]
+            previous = table[k - 1]
+            table[k] = (previous << 8) ^ crc_table[previous >> 8]
+        return table
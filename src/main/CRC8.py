@@ -1,3 +1,21 @@
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# порядок байт в машинном слове: в слове из двух байт первый байт данных
+# лежит в младших битах на little-endian и в старших на big-endian
+FIRST_BYTE_SHIFT = 0 if sys.byteorder == 'little' else 8
+# короче этой длины быстрее обычный побайтовый цикл
+WORD_THRESHOLD = 32
+# длина куска, crc которого numpy считает одной свёрткой,
+# и сколько таких кусков обрабатывается за раз, как в CRC16.py
+CHUNK = 256
+CHUNKS_PER_PASS = 1024
+
+
 class CRC8:
     def __init__(self):
         self.crcTable = [0x00, 0x07, 0x0E, 0x09, 0x1C, 0x1B, 0x12, 0x15, 0x38,
@@ -32,9 +50,77 @@ class CRC8:
                          0x91, 0x98, 0x9F, 0x8A, 0x8D, 0x84, 0x83,
                          0xDE, 0xD9, 0xD0, 0xD7, 0xC2, 0xC5, 0xCC, 0xCB, 0xE6,
                          0xE1, 0xE8, 0xEF, 0xFA, 0xFD, 0xF4, 0xF3]
+        # таблица на два байта сразу, индекс - слово данных в машинном
+        # порядке с наложенным на первый байт значением crc
+        self.wordTable = None
+        # chunkTable[k][b] - crc байта b, за которым идут k нулевых байт
+        self.chunkTable = None
+        # вклад crc предыдущих данных в crc следующего куска
+        self.carryTable = None
+
+    def get_crc(self, data, crc=0):
+        """
+        :param data: bytes, bytearray или memoryview, копия не делается
+        :param crc: значение crc предыдущего куска данных
+        """
+        if len(data) < WORD_THRESHOLD:
+            return self.__bytes_crc(data, crc)
+        view = memoryview(data).cast('B')
+        if np is not None and len(view) >= CHUNK:
+            return self.__numpy_crc(view, crc)
+        return self.__words_crc(view, crc)
 
-    def get_crc(self, data):
-        crc = 0
+    def __bytes_crc(self, data, crc):
+        table = self.crcTable
         for b in data:
-            crc = self.crcTable[crc ^ b]
+            crc = table[crc ^ b]
         return crc
+
+    def __words_crc(self, view, crc):
+        if self.wordTable is None:
+            self.wordTable = self.__make_word_table()
+        words = len(view) // 2
+        table = self.wordTable
+        crc <<= FIRST_BYTE_SHIFT
+        for word in view[:2 * words].cast('H'):
+            crc = table[crc ^ word]
+        crc >>= FIRST_BYTE_SHIFT
+        return self.__bytes_crc(view[2 * words:], crc)
+
+    def __make_word_table(self):
+        table = self.crcTable
+        second_byte_shift = 8 - FIRST_BYTE_SHIFT
+        return [table[table[word >> FIRST_BYTE_SHIFT & 0xFF]
+                      ^ word >> second_byte_shift & 0xFF] << FIRST_BYTE_SHIFT
+                for word in range(0x10000)]
+
+    def __numpy_crc(self, view, crc):
+        """
+        Куски по CHUNK байт считаются разом через вклады отдельных байт,
+        как в CRC16.__numpy_crc. crc предыдущих данных накладывается
+        на первый байт куска, поэтому ее вклад - строка таблицы для CHUNK - 1
+        """
+        if self.chunkTable is None:
+            self.chunkTable = self.__make_chunk_table()
+            self.carryTable = self.chunkTable[CHUNK - 1].tolist()
+        table = self.chunkTable
+        carry = self.carryTable
+        data = np.frombuffer(view, dtype=np.uint8)
+        chunks = len(data) // CHUNK
+        distance = np.arange(CHUNK - 1, -1, -1)
+        for begin in range(0, chunks, CHUNKS_PER_PASS):
+            end = min(begin + CHUNKS_PER_PASS, chunks)
+            block = data[begin * CHUNK:end * CHUNK].reshape(end - begin, CHUNK)
+            crcs = np.bitwise_xor.reduce(table[distance, block], axis=1)
+            for chunk_crc in crcs.tolist():
+                crc = carry[crc] ^ chunk_crc
+        return self.__bytes_crc(view[chunks * CHUNK:], crc)
+
+    def __make_chunk_table(self):
+        crc_table = np.array(self.crcTable, dtype=np.uint8)
+        table = np.empty((CHUNK, 256), dtype=np.uint8)
+        table[0] = crc_table
+        for k in range(1, CHUNK):
+            # дописать нулевой байт: crc = T[crc]
+            table[k] = crc_table[table[k - 1]]
+        return table
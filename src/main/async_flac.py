@@ -0,0 +1,89 @@
+"""
+Асинхронный интерфейс к AudioFile для asyncio: чтение файлов уходит
+в потоки (asyncio.to_thread), разбор блоков остается прежним,
+число одновременных операций ограничивается семафором
+"""
+import asyncio
+from itertools import islice
+from typing import Final
+
+from decoder import verify_md5
+from flac import AudioFile, FrameIndex
+
+# сколько фреймов разбирается в потоке за один переход
+FRAMES_PER_STEP: Final = 512
+LIMIT: Final = 64
+
+
+class AsyncAudioFile(AudioFile):
+    """
+    Создается через await AsyncAudioFile.open(filename). Метаданные
+    и свойства (tags, picture, ...) те же, что у AudioFile; синхронные
+    методы, читающие файл, имеют асинхронные пары с префиксом a
+    """
+    @classmethod
+    async def open(cls, filename, cache=None, stats=None, limiter=None):
+        """
+        :param limiter: asyncio.Semaphore, общий для многих файлов;
+        каждая операция с файлом выполняется, удерживая его
+        """
+        self = cls.__new__(cls)
+        self.limiter = limiter
+        await self.run(AudioFile.__init__, self, filename, cache, stats)
+        return self
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Выполнение блокирующей функции в потоке под ограничителем
+        """
+        if self.limiter is None:
+            return await asyncio.to_thread(function, *args, **kwargs)
+        async with self.limiter:
+            return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def aiter_frames(self, use_mmap=True, step=FRAMES_PER_STEP):
+        """
+        Фреймы по мере разбора, разбор идет в потоке по step фреймов
+        :return: асинхронный генератор FrameRecord, фреймы копятся в self.frames
+        """
+        self.frames = FrameIndex()
+        frames = self.scan_frames(use_mmap)
+        try:
+            while True:
+                batch = await self.run(lambda: list(islice(frames, step)))
+                if not batch:
+                    return
+                for frame in batch:
+                    self.frames.append(*frame)
+                    yield self.frames[-1]
+        finally:
+            await asyncio.to_thread(frames.close)
+
+    async def aparse_frames(self, use_mmap=True, workers=None):
+        await self.run(self.parse_frames, use_mmap, workers)
+
+    async def averify_frames(self, use_mmap=True, workers=None):
+        return await self.run(self.verify_frames, use_mmap, workers)
+
+    async def aseek(self, sample, use_mmap=True):
+        return await self.run(self.seek, sample, use_mmap)
+
+    async def aread_picture(self, i):
+        return await self.run(self.read_picture, i)
+
+    async def averify_md5(self, progress=None, use_mmap=True):
+        """
+        :param progress: см. decoder.verify_md5, вызывается из потока
+        """
+        return await self.run(verify_md5, self, progress, use_mmap)
+
+
+async def open_many(filenames, limit=LIMIT, **options):
+    """
+    Открытие многих файлов разом, одновременно читается не больше limit
+    :param options: cache, stats для AsyncAudioFile.open
+    :return: список AsyncAudioFile или исключений в порядке filenames
+    """
+    limiter = asyncio.Semaphore(limit)
+    return await asyncio.gather(*(AsyncAudioFile.open(filename, limiter=limiter, **options)
+                                  for filename in filenames), return_exceptions=True)
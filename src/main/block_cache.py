@@ -0,0 +1,198 @@
+"""
+Кэш декодированных фреймов для быстрой перемотки: PCM фрейма хранится
+по ключу (файл, номер фрейма), объем ограничен бюджетом в байтах,
+вытесняются давно не использованные (LRU). После промаха следующие
+фреймы декодируются заранее в фоновом потоке
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from queue import Queue
+from typing import Final
+
+from decoder import decode_frame
+from flac import open_audio_buffer
+
+MAX_BYTES: Final = 64 * 1024 * 1024
+# сколько фреймов после запрошенного декодировать заранее
+READ_AHEAD: Final = 8
+
+
+def block_bytes(channels):
+    return sum(len(samples) * samples.itemsize for samples in channels)
+
+
+class BlockCache:
+    """
+    Один кэш можно делить между файлами. Фреймы берутся из индекса
+    AudioFile.frames, он строится при первом обращении
+    """
+    def __init__(self, max_bytes=MAX_BYTES, read_ahead=READ_AHEAD, use_mmap=True):
+        """
+        :param read_ahead: число фреймов для чтения вперед, 0 - без фонового потока
+        """
+        self.max_bytes = max_bytes
+        self.read_ahead = read_ahead
+        self.use_mmap = use_mmap
+        self.blocks = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.lock = threading.Lock()
+        self.requests = Queue()
+        # поколение содержимого файла: растет при discard файла и при clear,
+        # декодированное в прежнем поколении не сохраняется
+        self.cleared = 0
+        self.discarded = {}
+        # номер последнего запроса чтения вперед по файлу: устаревшие запросы
+        # того же файла пропускаются, чтение вперед других файлов не трогается
+        self.latest = {}
+        self.thread = None
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get(self, audio_file, i):
+        """
+        :param i: номер фрейма в audio_file.frames
+        :return: сэмплы фрейма по каналам (массивы int32)
+        """
+        if not audio_file.frames:
+            audio_file.parse_frames(self.use_mmap)
+        key = (audio_file.filename, i)
+        with self.lock:
+            generation = self.__generation(audio_file.filename)
+            channels = self.blocks.get(key)
+            if channels is not None:
+                self.blocks.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if channels is None:
+            with open_audio_buffer(audio_file.filename, self.use_mmap) as file:
+                channels = self.__decode(file, audio_file, i)
+            self.__store(key, channels, generation)
+        self.__schedule(audio_file, i + 1)
+        return channels
+
+    def get_sample(self, audio_file, sample):
+        """
+        :return: номер первого сэмпла фрейма, содержащего sample, и сэмплы фрейма
+        """
+        if not audio_file.frames:
+            audio_file.parse_frames(self.use_mmap)
+        i = bisect_right(audio_file.frames.sample_numbers, sample) - 1
+        if i < 0 or sample >= audio_file.frames.sample_numbers[i] + audio_file.frames.block_sizes[i]:
+            raise ValueError('sample is out of stream')
+        return audio_file.frames.sample_numbers[i], self.get(audio_file, i)
+
+    def discard(self, filename):
+        """
+        Удаление фреймов файла, например после его изменения
+        """
+        with self.lock:
+            self.discarded[filename] = self.discarded.get(filename, 0) + 1
+            self.latest.pop(filename, None)
+            for key in [key for key in self.blocks if key[0] == filename]:
+                self.size -= block_bytes(self.blocks.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.cleared += 1
+            self.latest.clear()
+            self.blocks.clear()
+            self.size = 0
+
+    def close(self):
+        """
+        Остановка потока чтения вперед
+        """
+        if self.thread is not None:
+            with self.lock:
+                self.latest.clear()
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __generation(self, filename):
+        return self.cleared, self.discarded.get(filename, 0)
+
+    @staticmethod
+    def __decode(file, audio_file, i):
+        _, channels, _ = decode_frame(file, audio_file.frames.offsets[i], audio_file.streaminfo)
+        return channels
+
+    def __store(self, key, channels, generation):
+        """
+        Фрейм, декодированный до discard его файла или clear,
+        в кэш не кладется
+        """
+        size = block_bytes(channels)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.__generation(key[0]) or key in self.blocks:
+                return
+            self.blocks[key] = channels
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.blocks.popitem(last=False)
+                self.size -= block_bytes(evicted)
+
+    def __schedule(self, audio_file, start):
+        stop = min(start + self.read_ahead, len(audio_file.frames))
+        if start >= stop:
+            return
+        with self.lock:
+            if all((audio_file.filename, i) in self.blocks for i in range(start, stop)):
+                return
+            request = self.latest[audio_file.filename] = self.latest.get(audio_file.filename, 0) + 1
+            generation = self.__generation(audio_file.filename)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.__read_ahead, name='block-cache', daemon=True)
+            self.thread.start()
+        self.requests.put((audio_file, start, stop, request, generation))
+
+    def __read_ahead(self):
+        while True:
+            request = self.requests.get()
+            try:
+                if request is None:
+                    return
+                self.__prefetch(*request)
+            finally:
+                self.requests.task_done()
+
+    def __stale(self, filename, request):
+        with self.lock:
+            return self.latest.get(filename) != request
+
+    def __prefetch(self, audio_file, start, stop, request, generation):
+        if self.__stale(audio_file.filename, request):
+            return
+        with open_audio_buffer(audio_file.filename, self.use_mmap) as file:
+            for i in range(start, stop):
+                # новая перемотка в том же файле важнее недочитанного
+                if self.__stale(audio_file.filename, request):
+                    return
+                key = (audio_file.filename, i)
+                if key in self:
+                    continue
+                try:
+                    channels = self.__decode(file, audio_file, i)
+                except (ValueError, IndexError):
+                    continue
+                self.__store(key, channels, generation)
+                self.prefetched += 1
+
+    def wait(self):
+        """
+        Ожидание завершения запрошенного чтения вперед
+        """
+        if self.thread is not None:
+            self.requests.join()
@@ -23,6 +23,9 @@ picture_descr = {0: 'other',
 channels = {8: 'left/side stereo', 9: 'right/side stereo',
             10: 'mid/side stereo'}
 
+block_size = {1: 192, 2: 576, 3: 1152, 4: 2304, 5: 4608, 8: 256, 9: 512,
+              10: 1024, 11: 2048, 12: 4096, 13: 8192, 14: 16384, 15: 32768}
+
 sample_size = {1: 8, 2: 12, 4: 16, 5: 20, 6: 24}
 
 sample_rate = {1: 88.2, 2: 176.4, 3: 192, 4: 8, 5: 16, 6: 22.05, 7: 24, 8: 32,
@@ -0,0 +1,454 @@
+"""
+Декодирование фреймов flac в PCM
+https://xiph.org/flac/format.html#subframe
+"""
+import hashlib
+import sys
+import threading
+import time
+from array import array
+from operator import mul
+from queue import Queue
+from typing import Final
+
+from flac import BITS_PER_SAMPLE, BLOCK_MAXSIZE, CHANNELS, MD5, SAMPLES_IN_FLOW, crc16, \
+    find_sync_codes, open_audio_buffer, parse_frame_header
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# коэффициенты фиксированных предсказателей порядка 0..4
+fixed_coefficients: Final = ((), (1,), (2, -1), (3, -3, 1), (4, -6, 4, -1))
+
+LEFT_SIDE: Final = 8
+RIGHT_SIDE: Final = 9
+MID_SIDE: Final = 10
+
+# фреймов в одном куске PCM для хэширования и кусков в очереди
+FRAMES_PER_CHUNK: Final = 32
+QUEUE_SIZE: Final = 8
+
+# маски окна из 64 бит, в котором значимы только последние n бит
+window_masks: Final = tuple((1 << n) - 1 for n in range(65))
+# с этого числа чисел в части код Райса разбирается через numpy
+RICE_VECTOR_MIN: Final = 64
+
+
+class BitReader:
+    """
+    Чтение битов из буфера (bytes, mmap, memoryview) начиная с байта pos.
+    Биты достаются окнами по 8 байт через int.from_bytes
+    """
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos * 8
+
+    def read(self, bits):
+        if bits == 0:
+            return 0
+        byte = self.pos >> 3
+        shift = self.pos & 7
+        size = (shift + bits + 7) >> 3
+        chunk = self.data[byte:byte + size]
+        if len(chunk) < size:
+            raise ValueError('unexpected end of data')
+        self.pos += bits
+        return int.from_bytes(chunk, byteorder='big') >> (size * 8 - shift - bits) & ((1 << bits) - 1)
+
+    def read_signed(self, bits):
+        value = self.read(bits)
+        if bits and value >> (bits - 1):
+            value -= 1 << bits
+        return value
+
+    def read_unary(self):
+        """
+        :return: число нулей до ближайшей единицы, единица пропускается
+        """
+        zeros = 0
+        while True:
+            byte = self.pos >> 3
+            shift = self.pos & 7
+            chunk = self.data[byte:byte + 8]
+            if not chunk:
+                raise ValueError('unexpected end of data')
+            available = len(chunk) * 8 - shift
+            window = int.from_bytes(chunk, byteorder='big') & ((1 << available) - 1)
+            if window:
+                top = window.bit_length()
+                zeros += available - top
+                self.pos += available - top + 1
+                return zeros
+            zeros += available
+            self.pos += available
+
+    def read_rice(self, count, parameter):
+        """
+        count чисел кода Райса с параметром parameter
+        :return: список знаковых чисел
+        """
+        if np is not None and count >= RICE_VECTOR_MIN:
+            return self.__read_rice_vector(count, parameter)
+        data = self.data
+        pos = self.pos
+        # дальше этой позиции окно из 8 байт выходит за конец данных
+        limit = len(data) - 8
+        mask = (1 << parameter) - 1
+        result = []
+        append = result.append
+        from_bytes = int.from_bytes
+        for _ in range(count):
+            byte = pos >> 3
+            available = 64 - (pos & 7)
+            window = from_bytes(data[byte:byte + 8], 'big') & window_masks[available]
+            top = window.bit_length()
+            # стоп-бит и остаток целиком в окне из полных 8 байт
+            if top > parameter and byte <= limit:
+                value = (available - top) << parameter | window >> (top - 1 - parameter) & mask
+                pos += available - top + 1 + parameter
+            else:
+                self.pos = pos
+                value = self.read_unary() << parameter | self.read(parameter)
+                pos = self.pos
+            append(value >> 1 ^ -(value & 1))
+        self.pos = pos
+        return result
+
+    def __read_rice_vector(self, count, parameter):
+        """
+        read_rice без цикла по числам. Биты распаковываются целиком, для каждой
+        единицы заранее известна единица, которая будет стоп-битом следующего
+        числа, если эта - стоп-бит. Цепочка стоп-битов от первой единицы
+        разворачивается удвоением переходов. Если распакованных бит не хватило,
+        кусок увеличивается вдвое
+        """
+        byte = self.pos >> 3
+        shift = self.pos & 7
+        # в среднем унарная часть хорошо подобранного кода - около двух бит
+        size = ((shift + count * (parameter + 3)) >> 3) + 8
+        while True:
+            chunk = self.data[byte:byte + size]
+            bits = np.unpackbits(np.frombuffer(chunk, dtype=np.uint8))[shift:]
+            ones = np.flatnonzero(bits)
+            # число единиц перед каждой позицией - номер первой единицы не раньше нее
+            before = np.zeros(len(bits) + 1, dtype=np.intp)
+            np.cumsum(bits, out=before[1:])
+            # за концом бит и с фиктивной единицы len(ones) переход в нее же
+            jumps = np.append(before[np.minimum(ones + (parameter + 1), len(bits))], len(ones))
+            stops = np.zeros(1, dtype=np.intp)
+            while len(stops) < count:
+                stops = np.concatenate((stops, jumps[stops]))
+                jumps = jumps[jumps]
+            stops = stops[:count]
+            last = stops[-1]
+            if last < len(ones) and ones[last] + parameter < len(bits):
+                break
+            if len(chunk) < size:
+                raise ValueError('unexpected end of data')
+            size *= 2
+        ends = ones[stops]
+        zeros = ends - np.concatenate(([0], ends[:-1] + (parameter + 1)))
+        values = zeros.astype(np.int64) << parameter
+        if parameter:
+            weights = np.left_shift(1, np.arange(parameter - 1, -1, -1, dtype=np.int64))
+            values |= bits[ends[:, None] + np.arange(1, parameter + 1)] @ weights
+        self.pos += int(ends[-1]) + 1 + parameter
+        return (values >> 1 ^ -(values & 1)).tolist()
+
+    def skip_to_byte(self):
+        self.pos = (self.pos + 7) & ~7
+
+
+def read_residual(reader, block_size, order):
+    """
+    Остаток предсказания, кодированный разбиением на части с кодом Райса
+    """
+    method = reader.read(2)
+    if method > 1:
+        raise ValueError('reserved residual coding method')
+    parameter_bits = 4 if method == 0 else 5
+    escape = (1 << parameter_bits) - 1
+    partition_order = reader.read(4)
+    partition_size = block_size >> partition_order
+    if partition_size << partition_order != block_size or partition_size < order:
+        raise ValueError('wrong partition order')
+    residual = []
+    for partition in range(0, 1 << partition_order):
+        count = partition_size - order if partition == 0 else partition_size
+        parameter = reader.read(parameter_bits)
+        if parameter == escape:
+            bits = reader.read(5)
+            residual.extend(reader.read_signed(bits) for _ in range(count))
+        else:
+            residual.extend(reader.read_rice(count, parameter))
+    return residual
+
+
+def restore_lpc(warmup, residual, coefficients, shift):
+    """
+    Восстановление сигнала по предсказателю: рекурсия, поэтому цикл по сэмплам
+    """
+    samples = list(warmup)
+    order = len(coefficients)
+    coefficients = coefficients[::-1]
+    append = samples.append
+    i = 0
+    for value in residual:
+        append(value + (sum(map(mul, coefficients, samples[i:i + order])) >> shift))
+        i += 1
+    return samples
+
+
+def restore_fixed(warmup, residual, order):
+    """
+    Фиксированный предсказатель порядка n - это n-я разность сигнала,
+    так что сигнал восстанавливается n накопленными суммами
+    """
+    if np is None:
+        return restore_lpc(warmup, residual, fixed_coefficients[order], 0)
+    samples = np.array(residual, dtype=np.int64)
+    warmup = np.array(warmup, dtype=np.int64)
+    for level in range(order - 1, -1, -1):
+        first = np.diff(warmup[:level + 1], n=level)
+        samples = np.cumsum(np.concatenate((first, samples)))
+    return samples
+
+
+def read_subframe(reader, block_size, bits_per_sample):
+    """
+    :return: сэмплы подкадра (список или массив numpy)
+    """
+    header = reader.read(8)
+    if header & 0x80:
+        raise ValueError('subframe padding bit is set')
+    kind = header >> 1 & 0x3F
+    wasted = 0
+    if header & 1:
+        wasted = reader.read_unary() + 1
+        bits_per_sample -= wasted
+    if kind == 0:
+        samples = [reader.read_signed(bits_per_sample)] * block_size
+    elif kind == 1:
+        samples = [reader.read_signed(bits_per_sample) for _ in range(block_size)]
+    elif 8 <= kind <= 12:
+        order = kind & 0x07
+        warmup = [reader.read_signed(bits_per_sample) for _ in range(order)]
+        samples = restore_fixed(warmup, read_residual(reader, block_size, order), order)
+    elif kind >= 32:
+        order = (kind & 0x1F) + 1
+        warmup = [reader.read_signed(bits_per_sample) for _ in range(order)]
+        precision = reader.read(4) + 1
+        if precision == 16:
+            raise ValueError('invalid lpc precision')
+        shift = reader.read_signed(5)
+        if shift < 0:
+            raise ValueError('negative lpc shift')
+        coefficients = [reader.read_signed(precision) for _ in range(order)]
+        samples = restore_lpc(warmup, read_residual(reader, block_size, order),
+                              coefficients, shift)
+    else:
+        raise ValueError('reserved subframe type')
+    if wasted:
+        if np is not None:
+            samples = np.asarray(samples, dtype=np.int64) << wasted
+        else:
+            samples = [sample << wasted for sample in samples]
+    return samples
+
+
+def decorrelate(channels, assignment):
+    """
+    Восстановление левого и правого каналов из стереопар с разностным каналом
+    """
+    if assignment < LEFT_SIDE:
+        return channels
+    first, second = channels
+    if np is not None:
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        if assignment == LEFT_SIDE:
+            return [first, first - second]
+        if assignment == RIGHT_SIDE:
+            return [first + second, second]
+        mid = first << 1 | second & 1
+        return [(mid + second) >> 1, (mid - second) >> 1]
+    if assignment == LEFT_SIDE:
+        return [first, [left - side for left, side in zip(first, second)]]
+    if assignment == RIGHT_SIDE:
+        return [[side + right for side, right in zip(first, second)], second]
+    mids = [mid << 1 | side & 1 for mid, side in zip(first, second)]
+    return [[(mid + side) >> 1 for mid, side in zip(mids, second)],
+            [(mid - side) >> 1 for mid, side in zip(mids, second)]]
+
+
+def to_int32(samples):
+    if np is not None:
+        return np.asarray(samples, dtype=np.int64).astype(np.int32)
+    return array('i', samples)
+
+
+def decode_frame(file, pos, streaminfo, verify=True):
+    """
+    Декодирование фрейма, начинающегося в pos
+    :param verify: проверять CRC-16 фрейма
+    :return: заголовок (как у parse_frame_header), список каналов int32,
+    позиция следующего фрейма
+    """
+    header = parse_frame_header(file, pos, streaminfo)
+    _, _, block_size, _, assignment, bits_per_sample, end = header
+    reader = BitReader(file, end)
+    channels = []
+    for channel in range(0, assignment + 1 if assignment < LEFT_SIDE else 2):
+        side = assignment == LEFT_SIDE and channel == 1 or \
+            assignment == RIGHT_SIDE and channel == 0 or \
+            assignment == MID_SIDE and channel == 1
+        channels.append(read_subframe(reader, block_size, bits_per_sample + side))
+    reader.skip_to_byte()
+    end = (reader.pos >> 3) + 2
+    if end > len(file):
+        raise ValueError('unexpected end of data')
+    if verify and crc16.get_crc(file[pos:end]) != 0:
+        raise ValueError('frame crc mismatch')
+    return header, [to_int32(samples) for samples in decorrelate(channels, assignment)], end
+
+
+def first_sample_of(header, streaminfo):
+    blocking_strategy, number = header[0], header[1]
+    return number if blocking_strategy else number * streaminfo[BLOCK_MAXSIZE]
+
+
+def decode_frames(audio_file, start=None, use_mmap=True, verify=True):
+    """
+    Последовательное декодирование фреймов файла. Следующий фрейм начинается
+    там, где закончился предыдущий, поиск кода синхронизации нужен только
+    после поврежденного фрейма
+    :param start: смещение фрейма, с которого начать (например из AudioFile.seek)
+    :return: генератор (номер первого сэмпла, список каналов int32)
+    """
+    with open_audio_buffer(audio_file.filename, use_mmap) as file:
+        pos = audio_file.first_frame if start is None else start
+        while pos < len(file):
+            try:
+                header, channels, pos = decode_frame(file, pos, audio_file.streaminfo, verify)
+            except (ValueError, IndexError):
+                pos = next(find_sync_codes(file, pos + 1), len(file))
+                continue
+            yield first_sample_of(header, audio_file.streaminfo), channels
+
+
+def decode(audio_file, use_mmap=True, verify=True):
+    """
+    :return: все сэмплы файла, по массиву int32 на канал
+    """
+    blocks = [channels for _, channels in decode_frames(audio_file, use_mmap=use_mmap, verify=verify)]
+    if not blocks:
+        return [to_int32([]) for _ in range(audio_file.streaminfo[CHANNELS])]
+    if np is not None:
+        return [np.concatenate([block[i] for block in blocks]) for i in range(len(blocks[0]))]
+    result = [array('i') for _ in blocks[0]]
+    for block in blocks:
+        for channel, samples in zip(result, block):
+            channel.extend(samples)
+    return result
+
+
+def pcm_bytes(channels, bits_per_sample):
+    """
+    PCM в порядке для MD5 из STREAMINFO: каналы чередуются, сэмплы
+    знаковые little-endian по целому числу байт
+    """
+    width = (bits_per_sample + 7) // 8
+    if np is not None:
+        interleaved = np.stack([np.asarray(channel) for channel in channels], axis=1).astype('<i4')
+        return interleaved.view(np.uint8).reshape(-1, 4)[:, :width].tobytes()
+    interleaved = array('i', [sample for samples in zip(*channels) for sample in samples])
+    if sys.byteorder == 'big':
+        interleaved.byteswap()
+    data = bytearray(interleaved.tobytes())
+    # из каждых size байт убирается старший, пока не останется width
+    for size in range(interleaved.itemsize, width, -1):
+        del data[size - 1::size]
+    return bytes(data)
+
+
+def verify_md5(audio_file, progress=None, use_mmap=True):
+    """
+    Сверка MD5 из STREAMINFO с MD5 декодированного звука.
+    Фреймы декодируются в отдельном потоке и передаются кусками
+    по FRAMES_PER_CHUNK фреймов через очередь из QUEUE_SIZE кусков,
+    хэш считается в вызывающем потоке (hashlib отпускает GIL на больших кусках)
+    :param progress: вызывается после каждого куска с числом проверенных
+    сэмплов, их общим числом и скоростью в байтах PCM в секунду
+    :return: True, если MD5 совпал, сэмплы идут без пропусков и их число
+    совпадает с STREAMINFO
+    """
+    expected = audio_file.streaminfo[MD5]
+    if int(expected, 16) == 0:
+        raise ValueError('streaminfo has no md5')
+    bits_per_sample = audio_file.streaminfo[BITS_PER_SAMPLE]
+    total = audio_file.streaminfo[SAMPLES_IN_FLOW]
+    chunks = Queue(QUEUE_SIZE)
+    stop = threading.Event()
+
+    def produce():
+        """
+        :return: через очередь - (первый сэмпл куска, число сэмплов, байты),
+        исключение или None в конце
+        """
+        try:
+            chunk = []
+            first = None
+            for sample, channels in decode_frames(audio_file, use_mmap=use_mmap):
+                if stop.is_set():
+                    return
+                if first is None:
+                    first = sample
+                if chunk and sample != first + sum(len(block[0]) for block in chunk):
+                    # пропуск сэмплов после поврежденного фрейма - отдельным куском
+                    chunks.put((first, chunk))
+                    chunk = []
+                    first = sample
+                chunk.append(channels)
+                if len(chunk) == FRAMES_PER_CHUNK:
+                    chunks.put((first, chunk))
+                    chunk = []
+                    first = None
+            if chunk:
+                chunks.put((first, chunk))
+            chunks.put(None)
+        except BaseException as e:
+            chunks.put(e)
+
+    producer = threading.Thread(target=produce, name='md5-decoder', daemon=True)
+    md5 = hashlib.md5()
+    position = 0
+    intact = True
+    size = 0
+    start = time.perf_counter()
+    with audio_file.phase('verify_md5'):
+        producer.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                first, blocks = item
+                intact &= first == position
+                data = b''.join(pcm_bytes(channels, bits_per_sample) for channels in blocks)
+                md5.update(data)
+                size += len(data)
+                position = first + sum(len(channels[0]) for channels in blocks)
+                if progress is not None:
+                    progress(position, total, size / max(time.perf_counter() - start, 1e-9))
+        finally:
+            stop.set()
+            # освобождение места в очереди, если поток ждет в put
+            while producer.is_alive():
+                while not chunks.empty():
+                    chunks.get_nowait()
+                producer.join(0.01)
+    return intact and (not total or position == total) and md5.hexdigest() == expected
@@ -0,0 +1,644 @@
+"""
+Кодирование PCM во flac: подкадры CONSTANT, VERBATIM, FIXED и LPC,
+остаток кодом Райса с разбиением на части. Фреймы независимы,
+поэтому кодируются пачками в пуле процессов и пишутся по порядку
+https://xiph.org/flac/format.html#subframe
+"""
+import hashlib
+import math
+import os
+import sys
+import wave
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Final
+
+import constants
+from decoder import LEFT_SIDE, MID_SIDE, RIGHT_SIDE, fixed_coefficients, pcm_bytes
+from flac import FIRST_SAMPLE, NUMBER_OF_SAMPLES, OFFSET, crc8, crc16
+from metadata_writer import PADDING_SIZE, PADDING_TYPE, SEEKTABLE_TYPE, STREAMINFO_TYPE, \
+    VORBIS_COMMENT_TYPE, seektable_body, vorbis_comment_body
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BLOCK_SIZE: Final = 4096
+MAX_LPC_ORDER: Final = 8
+MAX_PARTITION_ORDER: Final = 8
+# шаг точек SEEKTABLE в секундах
+SEEK_INTERVAL: Final = 10
+# фреймов в одной задаче пула и задач в работе на один процесс
+FRAMES_PER_TASK: Final = 16
+TASKS_PER_WORKER: Final = 2
+VENDOR: Final = 'flac.py'
+
+block_size_codes: Final = {size: code for code, size in constants.block_size.items()}
+sample_rate_codes: Final = {round(rate * 1000): code for code, rate in constants.sample_rate.items()}
+sample_size_codes: Final = {size: code for code, size in constants.sample_size.items()}
+
+# параметр Райса: 4 бита (метод 0, 15 - экранирование) или 5 бит (метод 1)
+RICE_PARAMETER_LIMIT: Final = 14
+RICE2_PARAMETER_LIMIT: Final = 30
+
+
+def lpc_precision(block_size):
+    """
+    Точность коэффициентов LPC в битах в зависимости от размера блока
+    """
+    for limit, precision in ((192, 7), (384, 8), (576, 9), (1152, 10), (2304, 11), (4608, 12)):
+        if block_size <= limit:
+            return precision
+    return 13
+
+
+def utf8_number(n):
+    """
+    Номер фрейма в расширенной кодировке UTF-8 (до 36 бит)
+    """
+    if n < 0x80:
+        return bytes([n])
+    length = 2
+    while n >= 1 << (5 * length + 1):
+        length += 1
+    result = [(0xFF << (8 - length)) & 0xFF | n >> 6 * (length - 1)]
+    for i in range(length - 2, -1, -1):
+        result.append(0x80 | n >> 6 * i & 0x3F)
+    return bytes(result)
+
+
+def frame_header(number, block_size, rate, assignment, bits_per_sample):
+    extra = b''
+    if block_size in block_size_codes:
+        block_size_code = block_size_codes[block_size]
+    elif block_size <= 256:
+        block_size_code = 6
+        extra += bytes([block_size - 1])
+    else:
+        block_size_code = 7
+        extra += (block_size - 1).to_bytes(2, byteorder='big')
+    if rate in sample_rate_codes:
+        rate_code = sample_rate_codes[rate]
+    elif rate % 1000 == 0 and rate // 1000 < 256:
+        rate_code = 12
+        extra += bytes([rate // 1000])
+    elif rate < 65536:
+        rate_code = 13
+        extra += rate.to_bytes(2, byteorder='big')
+    elif rate % 10 == 0 and rate // 10 < 65536:
+        rate_code = 14
+        extra += (rate // 10).to_bytes(2, byteorder='big')
+    else:
+        # частота берется из STREAMINFO
+        rate_code = 0
+    header = bytes([0xFF, 0xF8, block_size_code << 4 | rate_code,
+                    assignment << 4 | sample_size_codes.get(bits_per_sample, 0) << 1])
+    header += utf8_number(number) + extra
+    return header + bytes([crc8.get_crc(header)])
+
+
+class BitBuffer:
+    """
+    Поля (значение, ширина в битах) копятся списками и массивами
+    и упаковываются в байты разом в to_bytes
+    """
+    def __init__(self):
+        self.values = []
+        self.widths = []
+        self.pending_values = []
+        self.pending_widths = []
+
+    def write(self, value, bits):
+        self.pending_values.append(value)
+        self.pending_widths.append(bits)
+
+    def extend(self, values, widths):
+        self.__flush()
+        self.values.append(values)
+        self.widths.append(widths)
+
+    def __flush(self):
+        if self.pending_values:
+            self.values.append(self.pending_values)
+            self.widths.append(self.pending_widths)
+            self.pending_values = []
+            self.pending_widths = []
+
+    def to_bytes(self):
+        """
+        :return: байты, последний дополнен нулями
+        """
+        self.__flush()
+        if np is not None:
+            values = np.concatenate([np.asarray(v, dtype=np.int64) for v in self.values])
+            widths = np.concatenate([np.asarray(w, dtype=np.int64) for w in self.widths])
+            ends = np.cumsum(widths)
+            owner = np.repeat(np.arange(len(widths)), widths)
+            # номер бита в поле, считая от младшего; поля шире 64 бит - только
+            # унарные коды с единственной единицей в конце
+            shift = np.minimum(ends[owner] - 1 - np.arange(int(ends[-1]) if len(ends) else 0), 63)
+            return np.packbits((values[owner] >> shift & 1).astype(np.uint8)).tobytes()
+        bits = ''.join(format(value & ((1 << width) - 1), '0{}b'.format(width))
+                       for values, widths in zip(self.values, self.widths)
+                       for value, width in zip(values, widths) if width)
+        bits += '0' * (-len(bits) % 8)
+        return int(bits, 2).to_bytes(len(bits) // 8, byteorder='big') if bits else b''
+
+
+def fold(residual):
+    """
+    Знаковые числа в беззнаковые для кода Райса: 0, -1, 1, -2 -> 0, 1, 2, 3
+    """
+    if np is not None:
+        return residual << 1 ^ residual >> 63
+    return [value << 1 if value >= 0 else -value * 2 - 1 for value in residual]
+
+
+def fixed_residual(samples, order):
+    if np is not None:
+        return np.diff(samples, n=order) if order else samples
+    return lpc_residual(samples, fixed_coefficients[order], 0)
+
+
+def lpc_residual(samples, coefficients, shift):
+    order = len(coefficients)
+    if np is not None:
+        prediction = np.zeros(len(samples) - order, dtype=np.int64)
+        for j, coefficient in enumerate(coefficients):
+            prediction += coefficient * samples[order - 1 - j:len(samples) - 1 - j]
+        return samples[order:] - (prediction >> shift)
+    return [samples[i] - (sum(c * samples[i - 1 - j] for j, c in enumerate(coefficients)) >> shift)
+            for i in range(order, len(samples))]
+
+
+def autocorrelation(samples, max_lag):
+    """
+    Автокорреляция сигнала, взвешенного окном Уэлча
+    """
+    n = len(samples)
+    center = (n - 1) / 2
+    half = (n + 1) / 2
+    if np is not None:
+        window = 1 - ((np.arange(n) - center) / half) ** 2
+        x = samples * window
+        return [float(np.dot(x[:n - lag], x[lag:])) for lag in range(max_lag + 1)]
+    x = [sample * (1 - ((i - center) / half) ** 2) for i, sample in enumerate(samples)]
+    return [sum(a * b for a, b in zip(x, x[lag:])) for lag in range(max_lag + 1)]
+
+
+def levinson(r, max_order):
+    """
+    Коэффициенты предсказателей порядков 1..max_order по автокорреляции
+    (рекурсия Левинсона-Дарбина): x[n] ~ sum(a[j] * x[n - 1 - j])
+    """
+    error = r[0]
+    a = []
+    result = []
+    for i in range(max_order):
+        if error <= 0:
+            break
+        k = (r[i + 1] - sum(a[j] * r[i - j] for j in range(i))) / error
+        a = [a[j] - k * a[i - 1 - j] for j in range(i)] + [k]
+        error *= 1 - k * k
+        result.append(a)
+    return result
+
+
+def quantize(coefficients, precision):
+    """
+    :return: целые коэффициенты и сдвиг, либо None, если сдвиг выходит
+    из допустимого диапазона 0..15
+    """
+    largest = max(abs(c) for c in coefficients)
+    if largest == 0:
+        return None
+    shift = min(15, precision - 1 - math.frexp(largest)[1])
+    if shift < 0:
+        return None
+    limit = 1 << (precision - 1)
+    quantized = []
+    error = 0.0
+    # ошибка округления переносится на следующий коэффициент
+    for c in coefficients:
+        error += c * (1 << shift)
+        value = max(-limit, min(limit - 1, round(error)))
+        error -= value
+        quantized.append(value)
+    return quantized, shift
+
+
+def estimate_bits(folded):
+    """
+    Оценка длины остатка одним параметром Райса около log2 среднего
+    """
+    count = len(folded)
+    if not count:
+        return 0
+    total = int(folded.sum()) if np is not None else sum(folded)
+    guess = max(0, (total // count).bit_length() - 1)
+    best = None
+    for parameter in range(max(0, guess - 1), min(RICE2_PARAMETER_LIMIT, guess + 1) + 1):
+        if np is not None:
+            bits = int((folded >> parameter).sum())
+        else:
+            bits = sum(value >> parameter for value in folded)
+        bits += count * (parameter + 1)
+        if best is None or bits < best:
+            best = bits
+    return best
+
+
+def rice_partitions(folded, block_size, order, max_partition_order):
+    """
+    Выбор порядка разбиения и параметров Райса частей.
+    Суммы (u >> k) считаются для самого мелкого разбиения,
+    для крупных складываются соседние части
+    :return: длина остатка в битах, порядок разбиения, параметры частей
+    """
+    top = 0
+    while top < max_partition_order and block_size % (2 << top) == 0 \
+            and block_size >> (top + 1) >= order:
+        top += 1
+    parts = 1 << top
+    if np is not None:
+        largest = int(folded.max()) if len(folded) else 0
+    else:
+        largest = max(folded, default=0)
+    parameters = range(min(RICE2_PARAMETER_LIMIT, largest.bit_length()) + 1)
+    size = block_size >> top
+    if np is not None:
+        padded = np.concatenate((np.zeros(order, dtype=np.int64), folded)).reshape(parts, size)
+        sums = np.stack([(padded >> k).sum(axis=1) for k in parameters])
+        counts = np.full(parts, size, dtype=np.int64)
+    else:
+        padded = [0] * order + list(folded)
+        sums = [[sum(value >> k for value in padded[i * size:(i + 1) * size]) for i in range(parts)]
+                for k in parameters]
+        counts = [size] * parts
+    counts[0] -= order
+    best = None
+    for partition_order in range(top, -1, -1):
+        if partition_order < top:
+            if np is not None:
+                sums = sums[:, 0::2] + sums[:, 1::2]
+                counts = counts[0::2] + counts[1::2]
+            else:
+                sums = [[row[i] + row[i + 1] for i in range(0, len(row), 2)] for row in sums]
+                counts = [counts[i] + counts[i + 1] for i in range(0, len(counts), 2)]
+        if np is not None:
+            costs = sums + counts * (np.arange(len(parameters))[:, None] + 1)
+            chosen = costs.argmin(axis=0).tolist()
+            bits = int(costs.min(axis=0).sum())
+        else:
+            chosen = []
+            bits = 0
+            for i, count in enumerate(counts):
+                cost, parameter = min((row[i] + count * (k + 1), k) for k, row in enumerate(sums))
+                chosen.append(parameter)
+                bits += cost
+        parameter_bits = 4 if max(chosen) <= RICE_PARAMETER_LIMIT else 5
+        bits += 6 + len(chosen) * parameter_bits
+        if best is None or bits < best[0]:
+            best = (bits, partition_order, chosen)
+    return best
+
+
+def wasted_bits(samples):
+    """
+    :return: число нулевых младших бит у всех сэмплов
+    """
+    if np is not None:
+        combined = int(np.bitwise_or.reduce(samples))
+    else:
+        combined = 0
+        for sample in samples:
+            combined |= sample
+    if not combined:
+        return 0
+    return (combined & -combined).bit_length() - 1
+
+
+def best_subframe(samples, bits_per_sample, max_lpc_order):
+    """
+    Выбор подкадра по оценке длины; остаток разбивается на части
+    только для выбранного
+    :return: оценка длины в битах и план подкадра для write_subframe
+    """
+    block_size = len(samples)
+    if np is not None:
+        constant = bool((samples == samples[0]).all())
+    else:
+        constant = samples.count(samples[0]) == block_size
+    if constant:
+        return 8 + bits_per_sample, ('constant', 0, bits_per_sample, int(samples[0]))
+    wasted = wasted_bits(samples)
+    if wasted:
+        samples = samples >> wasted if np is not None else [sample >> wasted for sample in samples]
+    bits = bits_per_sample - wasted
+    header = 8 + wasted
+    best = (header + bits * block_size, ('verbatim', wasted, bits, samples))
+    candidates = []
+    for order in range(min(4, block_size - 1) + 1):
+        folded = fold(fixed_residual(samples, order))
+        candidates.append((header + order * bits, estimate_bits(folded), order, None, folded))
+    max_order = min(max_lpc_order, block_size - 1)
+    if max_order > 0:
+        precision = lpc_precision(block_size)
+        for coefficients in levinson(autocorrelation(samples, max_order), max_order):
+            quantized = quantize(coefficients, precision)
+            if quantized is None:
+                continue
+            order = len(coefficients)
+            folded = fold(lpc_residual(samples, quantized[0], quantized[1]))
+            candidates.append((header + order * bits + 9 + order * precision, estimate_bits(folded),
+                               order, (precision,) + quantized, folded))
+    fixed_part, estimate, order, lpc, folded = min(
+        candidates, key=lambda candidate: candidate[0] + candidate[1])
+    if fixed_part + estimate >= best[0]:
+        return best
+    residual_bits, partition_order, parameters = rice_partitions(
+        folded, block_size, order, MAX_PARTITION_ORDER)
+    total = fixed_part + residual_bits
+    if total >= best[0]:
+        return best
+    return total, ('fixed' if lpc is None else 'lpc', wasted, bits, samples, order, lpc,
+                   (partition_order, parameters, folded))
+
+
+def write_subframe(buffer, plan):
+    kind, wasted, bits, *data = plan
+    if kind == 'constant':
+        buffer.write(0, 8)
+        buffer.write(data[0], bits)
+        return
+    if kind == 'verbatim':
+        buffer.write(1 << 1 | (1 if wasted else 0), 8)
+    else:
+        order = data[1]
+        buffer.write((8 + order if kind == 'fixed' else 32 + order - 1) << 1 | (1 if wasted else 0), 8)
+    if wasted:
+        # унарный код wasted - 1
+        buffer.write(1, wasted)
+    samples = data[0]
+    if kind == 'verbatim':
+        buffer.extend(samples, [bits] * len(samples))
+        return
+    _, order, lpc, (partition_order, parameters, folded) = data
+    for sample in samples[:order]:
+        buffer.write(int(sample), bits)
+    if lpc is not None:
+        precision, coefficients, shift = lpc
+        buffer.write(precision - 1, 4)
+        buffer.write(shift, 5)
+        for coefficient in coefficients:
+            buffer.write(coefficient, precision)
+    method = 0 if max(parameters) <= RICE_PARAMETER_LIMIT else 1
+    buffer.write(method, 2)
+    buffer.write(partition_order, 4)
+    size = len(samples) >> partition_order
+    pos = 0
+    for i, parameter in enumerate(parameters):
+        count = size - order if i == 0 else size
+        buffer.write(parameter, 4 + method)
+        values = folded[pos:pos + count]
+        pos += count
+        # каждое число - унарная часть (нули и стоп-бит) и parameter младших бит
+        if np is not None:
+            pairs = np.empty(2 * count, dtype=np.int64)
+            pairs[0::2] = 1
+            pairs[1::2] = values & ((1 << parameter) - 1)
+            widths = np.empty(2 * count, dtype=np.int64)
+            widths[0::2] = (values >> parameter) + 1
+            widths[1::2] = parameter
+            buffer.extend(pairs, widths)
+        else:
+            buffer.extend([field for value in values for field in (1, value)],
+                          [field for value in values for field in ((value >> parameter) + 1, parameter)])
+
+
+def encode_frame(number, channels, rate, bits_per_sample, max_lpc_order=MAX_LPC_ORDER):
+    """
+    :param number: номер фрейма
+    :param channels: сэмплы блока по каналам
+    :return: байты фрейма
+    """
+    if len(channels) == 2 and bits_per_sample < 32:
+        left, right = channels
+        if np is not None:
+            side = left - right
+            mid = (left + right) >> 1
+        else:
+            side = [a - b for a, b in zip(left, right)]
+            mid = [(a + b) >> 1 for a, b in zip(left, right)]
+        left = best_subframe(left, bits_per_sample, max_lpc_order)
+        right = best_subframe(right, bits_per_sample, max_lpc_order)
+        side = best_subframe(side, bits_per_sample + 1, max_lpc_order)
+        mid = best_subframe(mid, bits_per_sample, max_lpc_order)
+        _, assignment, subframes = min((left[0] + right[0], 1, (left, right)),
+                                       (left[0] + side[0], LEFT_SIDE, (left, side)),
+                                       (side[0] + right[0], RIGHT_SIDE, (side, right)),
+                                       (mid[0] + side[0], MID_SIDE, (mid, side)),
+                                       key=lambda variant: variant[0])
+    else:
+        assignment = len(channels) - 1
+        subframes = [best_subframe(samples, bits_per_sample, max_lpc_order) for samples in channels]
+    frame = frame_header(number, len(channels[0]), rate, assignment, bits_per_sample)
+    buffer = BitBuffer()
+    for _, plan in subframes:
+        write_subframe(buffer, plan)
+    frame += buffer.to_bytes()
+    return frame + crc16.get_crc(frame).to_bytes(2, byteorder='big')
+
+
+def encode_frames(blocks, rate, bits_per_sample, max_lpc_order):
+    """
+    Задача для процесса пула
+    :param blocks: список (номер фрейма, сэмплы по каналам)
+    """
+    return [encode_frame(number, channels, rate, bits_per_sample, max_lpc_order)
+            for number, channels in blocks]
+
+
+def encoded_frames(blocks, rate, bits_per_sample, max_lpc_order, workers):
+    """
+    :param blocks: итератор (номер фрейма, сэмплы по каналам)
+    :return: генератор байтов фреймов по порядку; в работе не больше
+    TASKS_PER_WORKER задач на процесс, так что память не растет с длиной файла
+    """
+    if workers == 1:
+        for number, channels in blocks:
+            yield encode_frame(number, channels, rate, bits_per_sample, max_lpc_order)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        limit = TASKS_PER_WORKER * workers
+        pending = deque()
+        while True:
+            task = list(islice(blocks, FRAMES_PER_TASK))
+            if task:
+                pending.append(executor.submit(encode_frames, task, rate, bits_per_sample,
+                                               max_lpc_order))
+            if pending and (len(pending) >= limit or not task):
+                yield from pending.popleft().result()
+            elif not task:
+                return
+
+
+def streaminfo_body(block_min, block_max, frame_min, frame_max, rate, channels,
+                    bits_per_sample, total_samples, md5):
+    data = rate << 44 | (channels - 1) << 41 | (bits_per_sample - 1) << 36 | total_samples
+    return block_min.to_bytes(2, byteorder='big') + block_max.to_bytes(2, byteorder='big') + \
+        frame_min.to_bytes(3, byteorder='big') + frame_max.to_bytes(3, byteorder='big') + \
+        data.to_bytes(8, byteorder='big') + md5
+
+
+def metadata_block(type_of_block, body, is_last=False):
+    return bytes([(0x80 if is_last else 0) | type_of_block]) + \
+        len(body).to_bytes(3, byteorder='big') + body
+
+
+def encode(filename, samples, rate, bits_per_sample, block_size=BLOCK_SIZE, tags=None,
+           seek_interval=SEEK_INTERVAL, padding=PADDING_SIZE, workers=None,
+           max_lpc_order=MAX_LPC_ORDER):
+    """
+    Запись файла flac. STREAMINFO и SEEKTABLE сначала пишутся заготовками
+    нужной длины и заполняются после кодирования фреймов
+    :param samples: сэмплы по каналам (списки, array или массивы numpy)
+    :param tags: имя тега -> строка или набор строк, как для MetadataEditor.set_tags
+    :param seek_interval: шаг точек SEEKTABLE в секундах, None - без SEEKTABLE
+    :param workers: число процессов, 1 - кодирование в текущем процессе
+    """
+    if not 1 <= len(samples) <= 8:
+        raise ValueError('flac supports 1 to 8 channels')
+    if not 4 <= bits_per_sample <= 32:
+        raise ValueError('bits per sample must be between 4 and 32')
+    if not 0 < rate < 1 << 20:
+        raise ValueError('wrong sample rate')
+    if not 16 <= block_size <= 65535:
+        raise ValueError('block size must be between 16 and 65535')
+    if not 0 <= max_lpc_order <= 32:
+        raise ValueError('lpc order must be between 0 and 32')
+    if np is not None:
+        samples = [np.asarray(channel, dtype=np.int64) for channel in samples]
+    else:
+        samples = [list(channel) for channel in samples]
+    total = len(samples[0])
+    if any(len(channel) != total for channel in samples):
+        raise ValueError('channels have different length')
+    if total >= 1 << 36:
+        raise ValueError('too many samples')
+    limit = 1 << (bits_per_sample - 1)
+    if np is not None:
+        out_of_range = total and any(channel.min() < -limit or channel.max() >= limit
+                                     for channel in samples)
+    else:
+        out_of_range = total and any(min(channel) < -limit or max(channel) >= limit
+                                     for channel in samples)
+    if out_of_range:
+        raise ValueError('sample does not fit into {} bits'.format(bits_per_sample))
+
+    seek_frames = []
+    if seek_interval and total:
+        step = seek_interval * rate
+        seek_frames = sorted({int(i * step) // block_size for i in range(math.ceil(total / step))})
+    md5 = hashlib.md5()
+
+    def blocks():
+        for number, start in enumerate(range(0, total, block_size)):
+            channels = [channel[start:start + block_size] for channel in samples]
+            md5.update(pcm_bytes(channels, bits_per_sample))
+            yield number, channels
+
+    header = [(STREAMINFO_TYPE, bytes(34))]
+    if seek_frames:
+        header.append((SEEKTABLE_TYPE, bytes(18 * len(seek_frames))))
+    header.append((VORBIS_COMMENT_TYPE, vorbis_comment_body(tags or {}, VENDOR)))
+    if padding:
+        header.append((PADDING_TYPE, bytes(padding)))
+    with open(filename, 'wb') as f:
+        f.write(b'fLaC')
+        for i, (type_of_block, body) in enumerate(header):
+            f.write(metadata_block(type_of_block, body, i == len(header) - 1))
+        offset = 0
+        frame_sizes = []
+        points = []
+        for number, frame in enumerate(encoded_frames(blocks(), rate, bits_per_sample,
+                                                      max_lpc_order, workers)):
+            if len(points) < len(seek_frames) and seek_frames[len(points)] == number:
+                points.append({FIRST_SAMPLE: number * block_size, OFFSET: offset,
+                               NUMBER_OF_SAMPLES: min(block_size, total - number * block_size)})
+            f.write(frame)
+            offset += len(frame)
+            frame_sizes.append(len(frame))
+
+        f.seek(4)
+        f.write(metadata_block(STREAMINFO_TYPE, streaminfo_body(
+            block_size, block_size, min(frame_sizes, default=0), max(frame_sizes, default=0),
+            rate, len(samples), bits_per_sample, total, md5.digest())))
+        if seek_frames:
+            f.write(metadata_block(SEEKTABLE_TYPE, seektable_body(points)))
+
+
+def read_wav(filename):
+    """
+    :return: сэмплы по каналам, частота, бит на сэмпл
+    """
+    with wave.open(filename, 'rb') as f:
+        channels = f.getnchannels()
+        width = f.getsampwidth()
+        rate = f.getframerate()
+        data = f.readframes(f.getnframes())
+    # 8-битные сэмплы беззнаковые, остальные знаковые little-endian
+    if np is not None:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, width).astype(np.int64)
+        pcm = np.zeros(len(raw), dtype=np.int64)
+        for i in range(width):
+            pcm |= raw[:, i] << 8 * i
+        sign = 1 << (8 * width - 1)
+        pcm = pcm - 128 if width == 1 else (pcm ^ sign) - sign
+        return [pcm[i::channels] for i in range(channels)], rate, width * 8
+    pcm = [int.from_bytes(data[i:i + width], byteorder='little', signed=width > 1)
+           for i in range(0, len(data), width)]
+    if width == 1:
+        pcm = [sample - 128 for sample in pcm]
+    return [pcm[i::channels] for i in range(channels)], rate, width * 8
+
+
+def encode_wav(wav_filename, filename, **options):
+    """
+    :param options: параметры encode
+    """
+    samples, rate, bits_per_sample = read_wav(wav_filename)
+    encode(filename, samples, rate, bits_per_sample, **options)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='wav to flac encoder',
+                            usage='python encoder.py INPUT.wav OUTPUT.flac [-w N] [-b SIZE] '
+                                  '[-l ORDER] [-t NAME=VALUE ...]')
+    parser.add_argument('input', help='PCM wav file')
+    parser.add_argument('output', help='Flac file to write')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('-b', '--block-size', dest='block_size', type=int, default=BLOCK_SIZE,
+                        help='Samples per frame (default: {})'.format(BLOCK_SIZE))
+    parser.add_argument('-l', '--max-lpc-order', dest='max_lpc_order', type=int,
+                        default=MAX_LPC_ORDER,
+                        help='Maximum LPC order, 0 - FIXED only (default: {})'.format(MAX_LPC_ORDER))
+    parser.add_argument('-t', '--tag', dest='tags', action='append', default=[], metavar='NAME=VALUE',
+                        help='Vorbis comment (can be repeated)')
+    args = parser.parse_args(argv)
+    tags = {}
+    for tag in args.tags:
+        name, _, value = tag.partition('=')
+        tags.setdefault(name, []).append(value)
+    encode_wav(args.input, args.output, workers=args.workers, block_size=args.block_size,
+               max_lpc_order=args.max_lpc_order, tags=tags)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,27 @@
+import json
+import mmap
+import os
 import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import cached_property
+
 import constants
+import instrumentation
 from CRC8 import CRC8
+from CRC16 import CRC16
 from typing import Final
 
 crc8: Final = CRC8()
+crc16: Final = CRC16()
 ext_regex: Final = re.compile('.+?/(.+)')
 tag_regex: Final = re.compile('(.+?)=(.+)')
+# код синхронизации фрейма: 14 единиц, нулевой бит и бит стратегии
+sync_regex: Final = re.compile(rb'\xff[\xf8-\xfb]')
 
 # streaminfo
 STREAMINFO = 'streaminfo'
@@ -22,6 +38,8 @@ FRAME_MAXSIZE = 'frame_maxsize'
 CHANNELS = 'channels'
 BITS_PER_SAMPLE = 'bits per sample'
 SAMPLES_IN_FLOW = 'samples in flow'
+# MD5 несжатого звука, строка из 32 шестнадцатеричных цифр; нули - не задан
+MD5: Final = 'md5'
 
 # cuesheet
 MEDIA_CATALOG_NUMBER = 'media catalog number'
@@ -36,6 +54,11 @@ PRE_EMPHASIS = 'pre-emphasis'
 TRACK_INDEX = 'track index'
 INDEX_POINT_NUMBER = 'index point number'
 
+# seektable
+FIRST_SAMPLE = 'first sample'
+NUMBER_OF_SAMPLES = 'number of samples'
+PLACEHOLDER: Final = 0xFFFFFFFFFFFFFFFF
+
 # frames
 BLOCK_SIZE = 'block size'
 SAMPLE_RATE = 'sample rate'
@@ -43,50 +66,507 @@ SAMPLE_SIZE = 'sample size'
 SAMPLE_NUMBER = 'sample number'
 
 
+# Таблицы разбора заголовка фрейма, индекс - байт заголовка.
+# 0 - значение берется из STREAMINFO, отрицательные значения -
+# число лежит в конце заголовка (-1: 8 бит, -2: 16 бит, -3: 16 бит в десятках Гц),
+# None - запрещенный код
+frame_block_sizes: Final = tuple(
+    constants.block_size.get(b >> 4, -(b >> 4) + 5 if b >> 4 in (6, 7) else 0)
+    for b in range(256))
+frame_sample_rates: Final = tuple(
+    round(constants.sample_rate[b & 0x0F] * 1000) if b & 0x0F in constants.sample_rate
+    else {0: 0, 12: -1, 13: -2, 14: -3}.get(b & 0x0F)
+    for b in range(256))
+frame_channel_assignments: Final = tuple(b >> 4 if b >> 4 <= 10 else None
+                                         for b in range(256))
+frame_sample_sizes: Final = tuple(
+    constants.sample_size.get(b >> 1 & 0x07, 0 if b >> 1 & 0x07 == 0 else None)
+    for b in range(256))
+# длина числа в кодировке UTF-8 по первому байту и маска значащих бит в нём
+utf8_lengths: Final = tuple(1 if b < 0x80 else 0 if b < 0xC0 or b == 0xFF
+                            else 8 - (~b & 0xFF).bit_length()
+                            for b in range(256))
+utf8_masks: Final = tuple((1 << 7 - length) - 1 if length > 1 else 0x7F
+                          for length in utf8_lengths)
+
+
+def hz_to_khz(rate):
+    return rate // 1000 if rate % 1000 == 0 else rate / 1000
+
+
+def channel_description(channels):
+    """
+    :param channels: назначение каналов из заголовка фрейма
+    :return: число независимых каналов или описание стерео из constants
+    """
+    if channels <= 7:
+        return channels + 1
+    return constants.channels[channels]
+
+
+def decode_utf8_number(file, pos):
+    """
+    Номер фрейма или первого сэмпла в расширенной кодировке UTF-8 (до 7 байт)
+    :return: длина в байтах, число
+    """
+    first_byte = file[pos]
+    length = utf8_lengths[first_byte]
+    if length == 0:
+        raise ValueError()
+    number = first_byte & utf8_masks[first_byte]
+    for i in range(pos + 1, pos + length):
+        byte = file[i]
+        if byte & 0xC0 != 0x80:
+            raise ValueError()
+        number = number << 6 | byte & 0x3F
+    return length, number
+
+
+def parse_frame_header(file, pos, streaminfo):
+    """
+    Разбор заголовка фрейма, начинающегося с кода синхронизации в pos,
+    с проверкой CRC-8. Поля достаются из таблиц, без строк
+    :return: стратегия блокировки, номер фрейма (или первого сэмпла),
+    размер блока, частота дискретизации в Гц, назначение каналов,
+    бит на сэмпл, позиция сразу за заголовком
+    """
+    block_size = frame_block_sizes[file[pos + 2]]
+    sample_rate = frame_sample_rates[file[pos + 2]]
+    channels = frame_channel_assignments[file[pos + 3]]
+    sample_size = frame_sample_sizes[file[pos + 3]]
+    if sample_rate is None or channels is None or sample_size is None:
+        raise ValueError()
+    length, number = decode_utf8_number(file, pos + 4)
+    end = pos + 4 + length
+    if block_size <= 0:
+        if block_size == 0:
+            block_size = streaminfo[BLOCK_MAXSIZE]
+        elif block_size == -1:
+            block_size = file[end] + 1
+            end += 1
+        else:
+            block_size = (file[end] << 8 | file[end + 1]) + 1
+            end += 2
+    if sample_rate <= 0:
+        if sample_rate == 0:
+            sample_rate = streaminfo[RATE]
+        elif sample_rate == -1:
+            sample_rate = file[end] * 1000
+            end += 1
+        elif sample_rate == -2:
+            sample_rate = file[end] << 8 | file[end + 1]
+            end += 2
+        else:
+            sample_rate = (file[end] << 8 | file[end + 1]) * 10
+            end += 2
+    if sample_size == 0:
+        sample_size = streaminfo[BITS_PER_SAMPLE]
+    if file[end] != crc8.get_crc(file[pos:end]):
+        raise ValueError()
+    return file[pos + 1] & 1, number, block_size, sample_rate, channels, sample_size, end + 1
+
+
+def read_exactly(f, size):
+    """
+    Чтение size байт из файла или потока. Каналы и сокеты могут отдавать
+    данные частями, поэтому читаем, пока не наберется size или не кончится поток
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = f.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+def skip_bytes(f, size):
+    """
+    Пропуск size байт: перемотка, если файл ее поддерживает,
+    иначе чтение кусками без накопления
+    """
+    if f.seekable():
+        f.seek(size, 1)
+        return
+    while size > 0:
+        chunk = f.read(min(size, 1 << 16))
+        if not chunk:
+            raise ValueError('metadata is truncated')
+        size -= len(chunk)
+
+
+def find_sync_codes(file, start=0, end=None):
+    """
+    Поиск кандидатов в начала фреймов: пар 0xFF 0xF8..0xFB.
+    Поиск идет регулярным выражением по всему буферу (bytes, mmap,
+    memoryview) без побайтового цикла на питоне
+    :return: генератор смещений
+    """
+    if end is None:
+        end = len(file)
+    for match in sync_regex.finditer(file, start, end):
+        yield match.start()
+
+
+@contextmanager
+def open_audio_buffer(filename, use_mmap=True):
+    """
+    Открывает файл целиком для разбора фреймов.
+    По умолчанию файл отображается в память и отдается memoryview,
+    срезы которого не копируют данные, а страницы берутся из кэша ОС.
+    Пустые и неотображаемые файлы (каналы и т.п.) читаются обычным образом
+    """
+    with open(filename, 'rb') as f:
+        mapped = None
+        if use_mmap:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                mapped = None
+        if mapped is None:
+            yield memoryview(f.read())
+            return
+        try:
+            with memoryview(mapped) as view:
+                yield view
+        finally:
+            mapped.close()
+
+
+def scan_frame_range(filename, streaminfo, blocking_strategy, start, end, use_mmap=True):
+    """
+    Заголовки фреймов, код синхронизации которых начинается в [start, end).
+    Выполняется в процессах parse_frames(workers=N): каждый процесс сам
+    отображает файл в память, страницы у них общие через кэш ОС.
+    Заголовки внутри уже найденных и номера фреймов здесь не проверяются,
+    это делается при слиянии диапазонов по порядку
+    :return: колонки array по всем кандидатам: смещение, номер фрейма (или первого
+    сэмпла), размер блока, частота в Гц, назначение каналов, бит на сэмпл,
+    конец заголовка и 1, если заголовок разобран (иначе остальные колонки нулевые)
+    """
+    columns = tuple(array(code) for code in 'QQIIBBQB')
+    rejected = (0, 0, 0, 0, 0, 0, 0)
+    with open_audio_buffer(filename, use_mmap) as file:
+        # код синхронизации из двух байт, последний может лежать за end
+        for candidate in find_sync_codes(file, start, min(end + 1, len(file))):
+            try:
+                if file[candidate + 1] & 1 != blocking_strategy:
+                    raise ValueError()
+                row = (candidate,) + parse_frame_header(file, candidate, streaminfo)[1:] + (1,)
+            except (ValueError, IndexError):
+                row = (candidate,) + rejected
+            for column, value in zip(columns, row):
+                column.append(value)
+    return columns
+
+
+def check_frame_range(filename, offsets, end=None, use_mmap=True):
+    """
+    Проверка CRC-16 подряд идущих фреймов
+    :param offsets: смещения фреймов, каждый заканчивается там, где начинается
+    следующий, последний - в end (None - конец файла)
+    :return: номера фреймов с неверной контрольной суммой, считая от начала offsets
+    """
+    corrupted = []
+    with open_audio_buffer(filename, use_mmap) as file:
+        if end is None:
+            end = len(file)
+        for i in range(0, len(offsets)):
+            frame_end = offsets[i + 1] if i + 1 < len(offsets) else end
+            if crc16.get_crc(file[offsets[i]:frame_end]) != 0:
+                corrupted.append(i)
+    return corrupted
+
+
+class FrameRecord(Mapping):
+    """
+    Представление одного фрейма FrameIndex в виде словаря
+    с прежними ключами (OFFSET, BLOCK_SIZE, ...), значения читаются из колонок
+    """
+    __slots__ = ('index', 'i')
+    keys_order = (OFFSET, BLOCK_SIZE, SAMPLE_RATE, CHANNELS, SAMPLE_SIZE, SAMPLE_NUMBER)
+
+    def __init__(self, index, i):
+        self.index = index
+        self.i = i
+
+    def __getitem__(self, key):
+        if key == OFFSET:
+            return self.index.offsets[self.i]
+        if key == BLOCK_SIZE:
+            return self.index.block_sizes[self.i]
+        if key == SAMPLE_RATE:
+            return hz_to_khz(self.index.sample_rates[self.i])
+        if key == CHANNELS:
+            return channel_description(self.index.channels[self.i])
+        if key == SAMPLE_SIZE:
+            return self.index.sample_sizes[self.i]
+        if key == SAMPLE_NUMBER:
+            return self.index.sample_numbers[self.i]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.keys_order)
+
+    def __len__(self):
+        return len(self.keys_order)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Picture(Mapping):
+    """
+    Описание картинки из блока PICTURE. Само изображение ('pic')
+    в память заранее не читается и достается из файла при обращении
+    """
+    __slots__ = ('audio_file', 'i', 'descriptor')
+
+    def __init__(self, audio_file, i, descriptor):
+        self.audio_file = audio_file
+        self.i = i
+        self.descriptor = descriptor
+
+    def __getitem__(self, key):
+        if key == 'pic':
+            return self.audio_file.read_picture(self.i)
+        return self.descriptor[key]
+
+    def __iter__(self):
+        yield from self.descriptor
+        yield 'pic'
+
+    def __len__(self):
+        return len(self.descriptor) + 1
+
+    def __repr__(self):
+        return repr(self.descriptor)
+
+
+class FrameIndex:
+    """
+    Индекс фреймов по колонкам array вместо списка словарей:
+    смещение, размер блока, частота в Гц, назначение каналов, бит на сэмпл,
+    номер первого сэмпла фрейма. Около 26 байт на фрейм.
+    Колонки поддерживают буферный протокол, так что их можно без копирования
+    обернуть в numpy.frombuffer
+    """
+    def __init__(self):
+        self.offsets = array('Q')
+        self.block_sizes = array('I')
+        self.sample_rates = array('I')
+        self.channels = array('B')
+        self.sample_sizes = array('B')
+        self.sample_numbers = array('Q')
+
+    def columns(self):
+        return (self.offsets, self.block_sizes, self.sample_rates,
+                self.channels, self.sample_sizes, self.sample_numbers)
+
+    def append(self, offset, block_size, sample_rate, channels, sample_size,
+               sample_number):
+        self.offsets.append(offset)
+        self.block_sizes.append(block_size)
+        self.sample_rates.append(sample_rate)
+        self.channels.append(channels)
+        self.sample_sizes.append(sample_size)
+        self.sample_numbers.append(sample_number)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            index = FrameIndex()
+            for column, source in zip(index.columns(), self.columns()):
+                column.extend(source[i])
+            return index
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('frame index out of range')
+        return FrameRecord(self, i)
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield FrameRecord(self, i)
+
+    def __eq__(self, other):
+        if not isinstance(other, FrameIndex):
+            return NotImplemented
+        return self.columns() == other.columns()
+
+
+def format_frames_text(frames, blocking_strategy):
+    for i, (offset, block_size, sample_rate, channels, sample_size, sample_number) in frames:
+        text = constants.frames_text.format(i, offset, block_size, hz_to_khz(sample_rate),
+                                            channel_description(channels), sample_size)
+        if blocking_strategy:
+            text += constants.sample_number_text.format(sample_number)
+        yield text + '\n\n'
+
+
+def format_frames_csv(frames, blocking_strategy):
+    # все поля - числа, экранирование модуля csv не нужно
+    yield ','.join(('frame',) + FRAME_REPORT_FIELDS) + '\n'
+    for i, frame in frames:
+        yield '{},{},{},{},{},{},{}\n'.format(i, *frame)
+
+
+def format_frames_jsonl(frames, blocking_strategy):
+    for i, frame in frames:
+        record = dict(zip(FRAME_REPORT_FIELDS, frame))
+        record['frame'] = i
+        yield json.dumps(record) + '\n'
+
+
+def format_frames_binary(frames, blocking_strategy):
+    yield FRAME_REPORT_MAGIC
+    pack = FRAME_RECORD.pack
+    for _, frame in frames:
+        yield pack(*frame)
+
+
+# поля машиночитаемых отчетов: частота в Гц, назначение каналов - код из заголовка фрейма
+FRAME_REPORT_FIELDS: Final = (OFFSET, BLOCK_SIZE, SAMPLE_RATE, CHANNELS, SAMPLE_SIZE, SAMPLE_NUMBER)
+# двоичный отчет: сигнатура, затем записи по 26 байт в порядке колонок FrameIndex
+FRAME_REPORT_MAGIC: Final = b'FLFR\x01'
+FRAME_RECORD: Final = struct.Struct('<QIIBBQ')
+frame_report_formats: Final = {'text': format_frames_text,
+                               'csv': format_frames_csv,
+                               'jsonl': format_frames_jsonl,
+                               'binary': format_frames_binary}
+# сколько фреймов форматируется перед одной записью в приемник
+REPORT_CHUNK: Final = 1024
+
+
+def write_frames_report(frames, out, report_format='text', blocking_strategy=0):
+    """
+    Запись отчета о фреймах кусками по REPORT_CHUNK фреймов,
+    так что память не зависит от числа фреймов
+    :param frames: итерируемые кортежи в порядке колонок FrameIndex
+    (AudioFile.scan_frames или zip(*FrameIndex.columns()))
+    :param out: приемник с методом write: текстовый для 'text', 'csv', 'jsonl',
+    двоичный для 'binary'
+    :param blocking_strategy: для 'text' - печатать ли номер сэмпла
+    """
+    if report_format not in frame_report_formats:
+        raise ValueError('unknown report format')
+    chunks = []
+    empty = b'' if report_format == 'binary' else ''
+    for chunk in frame_report_formats[report_format](enumerate(frames), blocking_strategy):
+        chunks.append(chunk)
+        if len(chunks) >= REPORT_CHUNK:
+            out.write(empty.join(chunks))
+            chunks.clear()
+    if chunks:
+        out.write(empty.join(chunks))
+
+
 class AudioFile:
     """
     Разбор метаданных файла flac
     https://xiph.org/flac/format.html
     https://www.the-roberts-family.net/metadata/flac.html
     """
-    def __init__(self, filename):
+    def __init__(self, filename, cache=None, stats=None):
+        """
+        :param cache: кэш индекса фреймов (index_cache.IndexCache); при попадании
+        метаданные и фреймы берутся из него, файл не читается
+        :param stats: объект instrumentation.Stats для замеров, без него замеров нет
+        """
         self.filename = filename
-        self.file_is_flac()
-        self.frames = []
+        self.cache = cache
+        self.stats = stats
+        with self.phase('open'):
+            if cache is not None:
+                hit = cache.load(self)
+                self.count(instrumentation.CACHE_HITS if hit else instrumentation.CACHE_MISSES)
+                if hit:
+                    return
+            with open(self.filename, 'rb') as f:
+                self.read_metadata(f)
+                self.blocking_strategy = self.__get_blocking_strategy(f)
+
+    def phase(self, name):
+        """
+        Замер времени фазы name, если замеры включены
+        """
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.phase(name)
+
+    def count(self, name, value=1):
+        if self.stats is not None:
+            self.stats.count(name, value)
+
+    def read_metadata(self, f, picture_payloads=None):
+        """
+        Разбор маркера 'fLaC' и всех блоков метаданных. Теги, картинки,
+        CUESHEET и SEEKTABLE разбираются при первом обращении к ним
+        :param f: двоичный файл или поток, стоящий в начале данных flac,
+        после разбора стоит на первом фрейме
+        :param picture_payloads: расположение изображений в файле, если
+        f - сохраненный self.metadata, в котором их нет (см. index_cache)
+        """
+        self.frames = FrameIndex()
         self.positions = {}
-        self.first_frame = self.parse_metadata()
-        self.streaminfo = {}
-        self.parse_streaminfo()
-        self.blocking_strategy = self.__get_blocking_strategy()
-        self.tags = None
-        self.picture = []
-        self.cuesheet = {}
-        self.seektable = []
-        if VORBIS_COMMENT in self.positions:
-            self.tags = self.parse_vorbis_comment()
-        if PICTURE in self.positions:
-            for i in range(0, len(self.positions[PICTURE])):
-                self.picture.append(self.parse_picture(i))
-        if CUESHEET in self.positions:
-            self.cuesheet = self.parse_cuesheet()
-        if SEEKTABLE in self.positions:
-            self.seektable = self.parse_seektable()
+        # буфер с маркером 'fLaC' и цепочкой блоков метаданных без изображений
+        # из блоков PICTURE, позиции в self.positions совпадают со смещениями в нём
+        self.metadata = b''
+        # (смещение в файле, длина) изображения каждого блока PICTURE
+        self.picture_payloads = []
+        for name in ('tags', 'picture', 'cuesheet', 'seektable'):
+            self.__dict__.pop(name, None)
+        with self.phase('parse_metadata'):
+            self.file_is_flac(f)
+            self.first_frame = self.parse_metadata(f, picture_payloads)
+            self.streaminfo = {}
+            self.parse_streaminfo()
+        if self.stats is not None:
+            self.count(instrumentation.BYTES_READ, len(self.metadata))
+            if picture_payloads is None:
+                self.count(instrumentation.BYTES_SKIPPED, sum(length for _, length in self.picture_payloads))
+
+    @cached_property
+    def tags(self):
+        if VORBIS_COMMENT not in self.positions:
+            return None
+        with self.phase('parse_vorbis_comment'):
+            return self.parse_vorbis_comment()
+
+    @cached_property
+    def picture(self):
+        with self.phase('parse_picture'):
+            return [self.parse_picture(i) for i in range(0, len(self.positions.get(PICTURE, ())))]
+
+    @cached_property
+    def cuesheet(self):
+        if CUESHEET not in self.positions:
+            return {}
+        with self.phase('parse_cuesheet'):
+            return self.parse_cuesheet()
+
+    @cached_property
+    def seektable(self):
+        if SEEKTABLE not in self.positions:
+            return []
+        with self.phase('parse_seektable'):
+            return self.parse_seektable()
 
     """
     Проверка на то является ли файл формата flac
     """
 
-    def file_is_flac(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            if file[0:4].decode() != 'fLaC':
-                raise ValueError('file is not flac')
+    @staticmethod
+    def file_is_flac(f):
+        if read_exactly(f, 4) != b'fLaC':
+            raise ValueError('file is not flac')
 
     @staticmethod
     def parse_metadata_block_header(header):
-        flag_and_type = bin(header[0])[2:].zfill(8)  # заполняем строку 8 нулями
-        is_last = int(flag_and_type[0])
-        type_of_block = int(flag_and_type[1:], 2)
+        is_last = header[0] >> 7
+        type_of_block = header[0] & 0x7F
         size = int.from_bytes(header[1:], byteorder='big')
         return is_last, type_of_block, size
 
@@ -102,10 +582,8 @@ class AudioFile:
         :return:
         """
         tags = {}
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            begin, end = self.positions[VORBIS_COMMENT]
-            block = file[begin:end]
+        begin, end = self.positions[VORBIS_COMMENT]
+        block = self.metadata[begin:end]
         vendor_length = int.from_bytes(block[0:4], byteorder='little')
         vendor = block[4:4 + vendor_length].decode()
         tags['vendor'] = vendor
@@ -126,29 +604,25 @@ class AudioFile:
         return tags
 
     def parse_streaminfo(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            begin, end = self.positions[STREAMINFO]
-            block = file[begin:end]
+        begin, end = self.positions[STREAMINFO]
+        block = self.metadata[begin:end]
         self.streaminfo[BLOCK_MINSIZE] = int.from_bytes(block[0:2], byteorder='big')
         self.streaminfo[BLOCK_MAXSIZE] = int.from_bytes(block[2:4], byteorder='big')
         self.streaminfo[FRAME_MINSIZE] = int.from_bytes(block[4:7], byteorder='big')
         self.streaminfo[FRAME_MAXSIZE] = int.from_bytes(block[7:10], byteorder='big')
-        data = bin(int.from_bytes(block[10:18], byteorder='big'))[2:].zfill(64)
-        self.streaminfo[RATE] = int(data[0:20], 2)
-        self.streaminfo[CHANNELS] = int(data[20:23], 2) + 1
-        self.streaminfo[BITS_PER_SAMPLE] = int(data[23:28], 2) + 1
-        self.streaminfo[SAMPLES_IN_FLOW] = int(data[28:64], 2)
+        data = int.from_bytes(block[10:18], byteorder='big')
+        self.streaminfo[RATE] = data >> 44
+        self.streaminfo[CHANNELS] = (data >> 41 & 0x07) + 1
+        self.streaminfo[BITS_PER_SAMPLE] = (data >> 36 & 0x1F) + 1
+        self.streaminfo[SAMPLES_IN_FLOW] = data & 0xFFFFFFFFF
+        self.streaminfo[MD5] = block[18:34].hex()
 
     def parse_picture(self, i):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            begin, end = self.positions[PICTURE][i]
-            block = file[begin:end]
+        begin, end = self.positions[PICTURE][i]
+        block = self.metadata[begin:end]
 
         ext_len = int.from_bytes(block[4:8], byteorder='big')
         descr_len = int.from_bytes(block[8 + ext_len:12 + ext_len], byteorder='big')
-        pic_len = int.from_bytes(block[28 + ext_len + descr_len: 32 + ext_len + descr_len], byteorder='big')
 
         pic_type = self.__get_pic_type(block)
         mime_type = self.__get_mime_type(block, ext_len)
@@ -156,16 +630,64 @@ class AudioFile:
         descr = self.__get_description(block, ext_len, descr_len)
         width, height = self.__get_sizes(block, ext_len, descr_len)
         color_depth, number_of_colors = self.__get_colors(block, ext_len, descr_len)
-        pic = self.__get_picture(block, ext_len, descr_len, pic_len)
-        return {'picture type': pic_type,
-                'mime type': mime_type,
-                'extension': ext,
-                'description': descr,
-                'width': width,
-                'height': height,
-                'color depth': color_depth,
-                'number of colors': number_of_colors,
-                'pic': pic}
+        return Picture(self, i, {'picture type': pic_type,
+                                 'mime type': mime_type,
+                                 'extension': ext,
+                                 'description': descr,
+                                 'width': width,
+                                 'height': height,
+                                 'color depth': color_depth,
+                                 'number of colors': number_of_colors})
+
+    def picture_range(self, i):
+        """
+        :return: смещение изображения i-го блока PICTURE в файле и его длина
+        """
+        return self.picture_payloads[i]
+
+    def check_file(self):
+        """
+        Проверка перед чтением заново по имени файла: у FlacStream
+        из канала или сокета его нет
+        """
+        if self.filename is None:
+            raise ValueError('operation is not available without a file')
+
+    def read_picture(self, i):
+        """
+        Чтение изображения i-го блока PICTURE из файла
+        """
+        self.check_file()
+        offset, length = self.picture_payloads[i]
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            data = read_exactly(f, length)
+        if len(data) < length:
+            raise ValueError('picture is truncated')
+        self.count(instrumentation.BYTES_READ, length)
+        return data
+
+    @staticmethod
+    def read_picture_descriptor(f, size):
+        """
+        Чтение начала блока PICTURE до изображения: тип, MIME-тип,
+        описание, размеры, цвета и длина изображения
+        :param size: длина всего блока
+        """
+        chunks = []
+        length = 0
+        # длина следующего поля лежит в последних 4 байтах прочитанного
+        for extra in (8, 4, 20):
+            if chunks:
+                extra += int.from_bytes(chunks[-1][-4:], byteorder='big')
+            if length + extra > size:
+                raise ValueError('picture block is corrupted')
+            chunk = read_exactly(f, extra)
+            if len(chunk) < extra:
+                raise ValueError('metadata is truncated')
+            chunks.append(chunk)
+            length += extra
+        return b''.join(chunks)
 
     @staticmethod
     def __get_pic_type(block):
@@ -200,69 +722,87 @@ class AudioFile:
                                           byteorder='big')
         return color_depth, number_of_colors
 
-    @staticmethod
-    def __get_picture(block, ext_len, descr_len, pic_len):
-        return block[32 + ext_len + descr_len:32 + ext_len + descr_len + pic_len]
-
-    def parse_metadata(self):
+    def parse_metadata(self, f, picture_payloads=None):
         """
-        Парсинг метаданных, растановка индексов
+        Парсинг метаданных, растановка индексов.
+        Из файла читаются только заголовки и содержимое блоков метаданных,
+        они складываются в self.metadata. Изображения блоков PICTURE
+        пропускаются, в self.picture_payloads запоминается, где они лежат
+        :param f: файл, стоящий сразу после маркера 'fLaC'
+        :param picture_payloads: см. read_metadata
+        :return: позиция первого фрейма
         """
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            pos = 4  # первые 4 байта занимает 'fLaC'
-            is_last = False
-            while not is_last:
-                is_last, type_of_block, size = self.parse_metadata_block_header(file[pos:pos + 4])
-                positions = (pos + 4, pos + 4 + size)
-                if type_of_block == 0:
-                    """
-                    Этот блок содержит информацию обо всем потоке, такую как частота дискретизации, 
-                    количество каналов, общее количество отсчетов и т.д. Он должен присутствовать в качестве 
-                    первого блока метаданных в потоке. 
-                    Могут последовать и другие блоки метаданных, а те, которые декодер не понимает, он пропустит.
-                    """
-                    self.positions[STREAMINFO] = positions
-                elif type_of_block == 4:
-                    """
-                    Этот блок предназначен для хранения списка понятных человеку пар имя/значение. 
-                    Значения кодируются с использованием UTF-8. Это реализация спецификации комментария 
-                    Vorbis (без бита кадрирования). Это единственный официально поддерживаемый механизм тегирования 
-                    во FLAC. В потоке может быть только один блок VORBIS_COMMENT. В некоторой внешней документации 
-                    комментарии Vorbis называются тегами FLAC, чтобы избежать путаницы.
-                    """
-                    self.positions[VORBIS_COMMENT] = positions
-                elif type_of_block == 6:
-                    """
-                    Этот блок предназначен для хранения изображений, связанных с файлом, чаще всего обложек 
-                    с компакт-дисков. В файле может быть более одного блока PICTURE. Формат изображения аналогичен 
-                    кадру APIC в ID3v2. Блок PICTURE имеет тип, MIME-тип и описание UTF-8, например ID3v2, 
-                    и поддерживает внешние ссылки через URL (хотя это не рекомендуется). Различия заключаются 
-                    в том, что для поля описания нет ограничения уникальности, а тип MIME является обязательным. 
-                    Блок FLAC PICTURE также включает в себя разрешение, глубину цвета и размер палитры, 
-                    чтобы клиент мог искать подходящее изображение без необходимости сканировать их все.
-                    """
-                    if PICTURE not in self.positions:
-                        self.positions[PICTURE] = [positions]
-                    else:
-                        self.positions[PICTURE].append(positions)
-                elif type_of_block == 5:
-                    self.positions[CUESHEET] = positions
-                elif type_of_block == 3:
-                    self.positions[SEEKTABLE] = positions
-                pos += size + 4
-        return pos
+        chunks = [b'fLaC']
+        pos = 4  # первые 4 байта занимает 'fLaC'
+        file_pos = 4
+        is_last = False
+        while not is_last:
+            header = read_exactly(f, 4)
+            if len(header) < 4:
+                raise ValueError('metadata is truncated')
+            is_last, type_of_block, size = self.parse_metadata_block_header(header)
+            if type_of_block == 6:
+                block = self.read_picture_descriptor(f, size)
+                if picture_payloads is None:
+                    self.picture_payloads.append((file_pos + 4 + len(block), size - len(block)))
+                    skip_bytes(f, size - len(block))
+                else:
+                    self.picture_payloads.append(tuple(picture_payloads[len(self.picture_payloads)]))
+            else:
+                block = read_exactly(f, size)
+                if len(block) < size:
+                    raise ValueError('metadata is truncated')
+            chunks.append(header)
+            chunks.append(block)
+            positions = (pos + 4, pos + 4 + len(block))
+            if type_of_block == 0:
+                """
+                Этот блок содержит информацию обо всем потоке, такую как частота дискретизации, 
+                количество каналов, общее количество отсчетов и т.д. Он должен присутствовать в качестве 
+                первого блока метаданных в потоке. 
+                Могут последовать и другие блоки метаданных, а те, которые декодер не понимает, он пропустит.
+                """
+                self.positions[STREAMINFO] = positions
+            elif type_of_block == 4:
+                """
+                Этот блок предназначен для хранения списка понятных человеку пар имя/значение. 
+                Значения кодируются с использованием UTF-8. Это реализация спецификации комментария 
+                Vorbis (без бита кадрирования). Это единственный официально поддерживаемый механизм тегирования 
+                во FLAC. В потоке может быть только один блок VORBIS_COMMENT. В некоторой внешней документации 
+                комментарии Vorbis называются тегами FLAC, чтобы избежать путаницы.
+                """
+                self.positions[VORBIS_COMMENT] = positions
+            elif type_of_block == 6:
+                """
+                Этот блок предназначен для хранения изображений, связанных с файлом, чаще всего обложек 
+                с компакт-дисков. В файле может быть более одного блока PICTURE. Формат изображения аналогичен 
+                кадру APIC в ID3v2. Блок PICTURE имеет тип, MIME-тип и описание UTF-8, например ID3v2, 
+                и поддерживает внешние ссылки через URL (хотя это не рекомендуется). Различия заключаются 
+                в том, что для поля описания нет ограничения уникальности, а тип MIME является обязательным. 
+                Блок FLAC PICTURE также включает в себя разрешение, глубину цвета и размер палитры, 
+                чтобы клиент мог искать подходящее изображение без необходимости сканировать их все.
+                """
+                if PICTURE not in self.positions:
+                    self.positions[PICTURE] = [positions]
+                else:
+                    self.positions[PICTURE].append(positions)
+            elif type_of_block == 5:
+                self.positions[CUESHEET] = positions
+            elif type_of_block == 3:
+                self.positions[SEEKTABLE] = positions
+            pos += len(block) + 4
+            file_pos += size + 4
+        self.metadata = b''.join(chunks)
+        return file_pos
 
     def parse_cuesheet(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            begin, end = self.positions[CUESHEET]
-            block = file[begin:end]
+        begin, end = self.positions[CUESHEET]
+        block = self.metadata[begin:end]
         cuesheet = {}
         cuesheet[MEDIA_CATALOG_NUMBER] = block[0:128].decode()
         cuesheet[LEAD_IN_SAMPLES] = int.from_bytes(block[128:136],
                                                      byteorder='big')
-        cuesheet[CORRESPONDS_TO_CD] = int(bin(block[136])[2])
+        cuesheet[CORRESPONDS_TO_CD] = block[136] >> 7
         number_of_tracks = block[395]
         cuesheet[TRACKS] = []
         pos = 396
@@ -272,10 +812,8 @@ class AudioFile:
                                                              byteorder='big')
             cuesheet[TRACKS][i][TRACK_NUMBER] = block[pos + 8]
             cuesheet[TRACKS][i][ISRC] = block[pos + 9:pos + 21].decode()
-            cuesheet[TRACKS][i][IS_AUDIO] = int(bin(block[pos + 21])
-                                                    .zfill(8)[2])
-            cuesheet[TRACKS][i][PRE_EMPHASIS] = int(bin(block[pos + 21])
-                                                        .zfill(8)[3])
+            cuesheet[TRACKS][i][IS_AUDIO] = block[pos + 21] >> 7
+            cuesheet[TRACKS][i][PRE_EMPHASIS] = block[pos + 21] >> 6 & 1
             number_of_track_points = block[pos + 35]
             pos += 36
             cuesheet[TRACKS][i][TRACK_INDEX] = []
@@ -287,160 +825,300 @@ class AudioFile:
         return cuesheet
 
     def parse_seektable(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-            begin, end = self.positions[SEEKTABLE]
-            block = file[begin:end]
+        begin, end = self.positions[SEEKTABLE]
+        block = self.metadata[begin:end]
         pos = 0
         seektable = []
         counter = 0
-        while pos + 17 < len(block):
+        while pos + 18 <= len(block):
             seektable.append({})
-            seektable[counter]['first sample'] = block[pos:pos + 8]
-            seektable[counter][OFFSET] = block[pos + 8:pos + 16]
-            seektable[counter]['number of samples'] = block[pos + 16:pos + 18]
+            seektable[counter][FIRST_SAMPLE] = int.from_bytes(block[pos:pos + 8], byteorder='big')
+            seektable[counter][OFFSET] = int.from_bytes(block[pos + 8:pos + 16], byteorder='big')
+            seektable[counter][NUMBER_OF_SAMPLES] = int.from_bytes(block[pos + 16:pos + 18],
+                                                                   byteorder='big')
             pos += 18
             counter += 1
         return seektable
 
-    def __get_blocking_strategy(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
-        return bin(file[self.first_frame + 1])[-1]
+    def build_seektable(self, seconds=None, count=None, placeholders=0):
+        """
+        Точки SEEKTABLE по разобранным фреймам (parse_frames вызывается,
+        если фреймов еще нет). Точка ставится на начало фрейма, содержащего
+        целевой сэмпл; точки, попавшие на один фрейм, не повторяются
+        :param seconds: шаг между целевыми сэмплами в секундах
+        :param count: число равномерно расставленных целевых сэмплов
+        :param placeholders: сколько точек-заполнителей добавить в конец,
+        чтобы позже дописать точки без перезаписи файла
+        :return: список точек в формате AudioFile.seektable
+        """
+        if (seconds is None) == (count is None):
+            raise ValueError('exactly one of seconds and count is required')
+        if not self.frames:
+            self.parse_frames()
+        total = sum(self.frames.block_sizes)
+        if seconds is not None:
+            if seconds <= 0:
+                raise ValueError('seconds must be positive')
+            step = seconds * self.streaminfo[RATE]
+            targets = (int(i * step) for i in range(int(total // step) + 1 if total else 0))
+        else:
+            targets = (i * total // count for i in range(count if total else 0))
+        seektable = []
+        for target in targets:
+            i = bisect_right(self.frames.sample_numbers, target) - 1
+            if i < 0 or seektable and seektable[-1][FIRST_SAMPLE] == self.frames.sample_numbers[i]:
+                continue
+            seektable.append({FIRST_SAMPLE: self.frames.sample_numbers[i],
+                              OFFSET: self.frames.offsets[i] - self.first_frame,
+                              NUMBER_OF_SAMPLES: self.frames.block_sizes[i]})
+        seektable += [{FIRST_SAMPLE: PLACEHOLDER, OFFSET: 0, NUMBER_OF_SAMPLES: 0}
+                      for _ in range(placeholders)]
+        return seektable
 
-    def parse_frames(self):
-        with open(self.filename, 'rb') as f:
-            file = f.read()
+    @staticmethod
+    def __get_blocking_strategy(f):
+        """
+        :param f: файл, стоящий на начале первого фрейма
+        """
+        header = f.read(2)
+        if len(header) < 2:
+            return 0
+        return header[1] & 1
+
+    def parse_frames(self, use_mmap=True, workers=None):
+        """
+        Разбор заголовков всех фреймов
+        :param use_mmap: отобразить файл в память вместо чтения целиком,
+        фреймы проверяются через memoryview без копирования
+        :param workers: число процессов; больше одного - файл делится
+        на диапазоны, которые разбираются параллельно и затем сливаются.
+        С кэшем уже загруженный из него индекс не пересобирается,
+        а новый сохраняется в кэш
+        """
+        if self.cache is not None and self.frames:
+            return
+        self.check_file()
+        with self.phase('parse_frames'):
+            if workers is not None and workers > 1:
+                self.__parse_frames_parallel(use_mmap, workers)
+            else:
+                self.__parse_frames_serial(use_mmap)
+        self.count(instrumentation.FRAMES_ACCEPTED, len(self.frames))
+        if self.cache is not None:
+            with self.phase('cache_store'):
+                self.cache.store(self)
+            self.count(instrumentation.CACHE_STORES)
+
+    def __parse_frames_serial(self, use_mmap):
+        self.frames = FrameIndex()
+        for frame in self.scan_frames(use_mmap):
+            self.frames.append(*frame)
+
+    def scan_frames(self, use_mmap=True):
+        """
+        Последовательный разбор заголовков фреймов без сохранения в self.frames
+        :return: генератор кортежей в порядке колонок FrameIndex: смещение,
+        размер блока, частота в Гц, назначение каналов, бит на сэмпл, номер первого сэмпла
+        """
+        counter = candidates = in_header = errors = 0
+        with open_audio_buffer(self.filename, use_mmap) as file:
             pos = self.first_frame
-            counter = -1
-            while pos < len(file):
-                if not (b'\xff\xfb' >= file[pos:pos + 2] >= b'\xff\xf8'):
-                    pos += 1
-                else:
-                    counter += 1
+            try:
+                # на проверку заголовка идут только позиции кода синхронизации,
+                # всё, что внутри уже разобранного фрейма, пропускается
+                for candidate in find_sync_codes(file, self.first_frame):
+                    candidates += 1
+                    if candidate < pos:
+                        in_header += 1
+                        continue
                     try:
-                        # TODO исправить говнокод по обработке фрейма
-                        block_size, sample_rate, channels, sample_size, offset, frame_sample_number \
-                            = self.parse_one_frame(file, pos, counter)
-                    except ValueError:
-                        counter -= 1
-                        pos += 1
+                        _, frame_sample_number, block_size, sample_rate, channels, sample_size, pos \
+                            = self.read_frame_header(file, candidate, counter)
+                    except (ValueError, IndexError):
+                        errors += 1
                         continue
-                    self.frames.append({})
-                    self.frames[counter][BLOCK_SIZE] = block_size
-                    self.frames[counter][SAMPLE_RATE] = sample_rate
-                    self.frames[counter][CHANNELS] = channels
-                    self.frames[counter][SAMPLE_SIZE] = sample_size
-                    self.frames[counter][OFFSET] = pos
-                    pos = offset
-                    if self.blocking_strategy:
-                        self.frames[counter][SAMPLE_NUMBER] = frame_sample_number
-
-    @staticmethod
-    def __decode_utf8(file, pos):
-        number_of_bytes = 1
-        first_byte = bin(file[pos])[2:].zfill(8)
-        while first_byte[number_of_bytes - 1] == '1':
-            number_of_bytes += 1
-            if number_of_bytes == 8:
-                raise ValueError()
-        if number_of_bytes == 1:
-            number = first_byte[1:]
-        else:
-            number_of_bytes -= 1
-            number = first_byte[number_of_bytes + 1:]
-        for i in range(pos + 1, pos + number_of_bytes):
-            number += bin(file[i])[4:]
-        return number_of_bytes, int(number, 2)
-
-    def __get_block_size(self, file, pos, length, block_size):
-        block_size_len = 0
-        if block_size == 0:
-            block_size = self.streaminfo[BLOCK_MAXSIZE]
-        if block_size == 1:
-            block_size = 192
-        if 2 <= block_size <= 5:
-            block_size = 576 * 2 ** (block_size - 2)
-        if 8 <= block_size <= 15:
-            block_size = 256 * 2 ** (block_size - 8)
-        if block_size == 6:
-            block_size = file[pos + 4 + length] + 1
-            block_size_len = 1
-        if block_size == 7:
-            block_size = int.from_bytes(file[pos + 4 + length:
-                                             pos + 6 + length],
-                                        byteorder='big') + 1
-            block_size_len = 2
-        return block_size, block_size_len
-
-    def __get_sample_rate(self, file, pos, length, block_size_len,
-                          sample_rate):
-        sample_rate_len = 0
-        if sample_rate == 15:
-            raise ValueError()
-        if sample_rate == 0:
-            sample_rate = self.streaminfo[RATE]
-        if 1 <= sample_rate <= 11:
-            sample_rate = constants.sample_rate[sample_rate]
-        if sample_rate == 12:
-            sample_rate = file[pos + 4 + length + block_size_len]
-            sample_rate_len = 1
-        if sample_rate == 13:
-            sample_rate = int.from_bytes(file[pos + 4 + length + block_size_len:
-                                              pos + 6 + length + block_size_len],
-                                         byteorder='big') / 1000
-            sample_rate_len = 2
-        if sample_rate == 14:
-            sample_rate = int.from_bytes(file[pos + 4 + length + block_size_len:
-                                              pos + 6 + length + block_size_len],
-                                         byteorder='big') / 100
-            sample_rate_len = 2
-        return sample_rate, sample_rate_len
+                    if not self.blocking_strategy:
+                        frame_sample_number *= self.streaminfo[BLOCK_MAXSIZE]
+                    counter += 1
+                    yield candidate, block_size, sample_rate, channels, sample_size, frame_sample_number
+            finally:
+                if self.stats is not None:
+                    self.count(instrumentation.BYTES_SCANNED, len(file) - self.first_frame)
+                    self.count(instrumentation.SYNC_CANDIDATES, candidates)
+                    self.count(instrumentation.CANDIDATES_IN_HEADER, in_header)
+                    self.count(instrumentation.HEADER_ERRORS, errors)
 
-    def parse_one_frame(self, file, pos, counter):
-        if bin(file[pos + 1])[-1] != self.blocking_strategy:
-            raise ValueError()
-        length, frame_sample_number = self.__decode_utf8(file, pos + 4)
-        data = bin(file[pos + 2])[2:].zfill(8)
-        block_size = int(data[:4], 2)
-        block_size, block_size_len = self.__get_block_size(file, pos, length,
-                                                           block_size)
+    def split_points(self, size, parts):
+        """
+        Границы диапазонов для параллельного разбора: файл делится на равные
+        части, границы сдвигаются к ближайшим точкам SEEKTABLE, если они есть
+        :param size: размер файла
+        :return: возрастающие смещения, первое - начало первого фрейма, последнее - size
+        """
+        first = self.first_frame
+        bounds = {first + (size - first) * i // parts for i in range(0, parts)}
+        points = sorted(first + point[OFFSET] for point in self.seektable
+                        if point[FIRST_SAMPLE] != PLACEHOLDER and first + point[OFFSET] < size)
+        if points:
+            nearest = set()
+            for bound in bounds:
+                i = bisect_left(points, bound)
+                near = points[max(i - 1, 0):i + 1]
+                nearest.add(min(near, key=lambda point: abs(point - bound)))
+            bounds = nearest
+        bounds.add(first)
+        return sorted(bounds) + [size]
 
-        sample_rate = int(data[4:], 2)
+    def __parse_frames_parallel(self, use_mmap, workers):
+        bounds = self.split_points(os.path.getsize(self.filename), workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(scan_frame_range, self.filename, self.streaminfo,
+                                       self.blocking_strategy, start, end, use_mmap)
+                       for start, end in zip(bounds, bounds[1:])]
+            results = [future.result() for future in futures]
+        # слияние повторяет последовательный разбор: пропуск кандидатов
+        # внутри принятого заголовка и проверка номера фрейма; счетчики те же
+        self.frames = FrameIndex()
+        pos = self.first_frame
+        candidates = in_header = errors = 0
+        for offsets, numbers, block_sizes, sample_rates, channels, sample_sizes, ends, parsed in results:
+            candidates += len(offsets)
+            for i in range(0, len(offsets)):
+                if offsets[i] < pos:
+                    in_header += 1
+                    continue
+                frame_sample_number = numbers[i]
+                if not parsed[i] or not self.blocking_strategy and frame_sample_number != len(self.frames):
+                    errors += 1
+                    continue
+                if not self.blocking_strategy:
+                    frame_sample_number *= self.streaminfo[BLOCK_MAXSIZE]
+                self.frames.append(offsets[i], block_sizes[i], sample_rates[i], channels[i],
+                                   sample_sizes[i], frame_sample_number)
+                pos = ends[i]
+        if self.stats is not None:
+            self.count(instrumentation.BYTES_SCANNED, bounds[-1] - self.first_frame)
+            self.count(instrumentation.SYNC_CANDIDATES, candidates)
+            self.count(instrumentation.CANDIDATES_IN_HEADER, in_header)
+            self.count(instrumentation.HEADER_ERRORS, errors)
 
-        sample_rate, sample_rate_len = self.__get_sample_rate(file, pos,
-                                                              length,
-                                                              block_size_len,
-                                                              sample_rate)
+    def seek(self, sample, use_mmap=True):
+        """
+        Поиск фрейма, содержащего сэмпл.
+        Если фреймы уже разобраны - двоичный поиск по индексу, иначе
+        двоичный поиск по точкам SEEKTABLE и просмотр фреймов вперед
+        от ближайшей точки (без SEEKTABLE - от первого фрейма)
+        :param sample: номер сэмпла от начала потока
+        :return: смещение фрейма в файле, номер его первого сэмпла
+        """
+        total = self.streaminfo[SAMPLES_IN_FLOW]
+        if sample < 0 or total and sample >= total:
+            raise ValueError('sample is out of stream')
+        if self.frames:
+            i = bisect_right(self.frames.sample_numbers, sample) - 1
+            if i >= 0 and sample < self.frames.sample_numbers[i] + self.frames.block_sizes[i]:
+                return self.frames.offsets[i], self.frames.sample_numbers[i]
+            raise ValueError('sample is out of stream')
+        self.check_file()
+        points = [point for point in self.seektable if point[FIRST_SAMPLE] != PLACEHOLDER]
+        i = bisect_right([point[FIRST_SAMPLE] for point in points], sample) - 1
+        # точка может указывать мимо своего фрейма, тогда берется предыдущая,
+        # в крайнем случае - первый фрейм
+        starts = [(self.first_frame + point[OFFSET], point[FIRST_SAMPLE]) for point in reversed(points[:i + 1])]
+        if (self.first_frame, 0) not in starts:
+            starts.append((self.first_frame, 0))
+        with self.phase('seek_scan'), open_audio_buffer(self.filename, use_mmap) as file:
+            for start, first_sample in starts:
+                found = self.__scan_to_sample(file, start, first_sample, sample)
+                if found is not None:
+                    return found
+        raise ValueError('sample is out of stream')
 
-        data = bin(file[pos + 3])[2:].zfill(8)
-        channels = int(data[:4], 2)
+    def __scan_to_sample(self, file, pos, first_sample, sample):
+        """
+        Просмотр фреймов от pos, где должен начинаться фрейм с первым
+        сэмплом first_sample, до фрейма, содержащего sample
+        :return: смещение и первый сэмпл фрейма или None, если первый найденный
+        фрейм - не тот, что ожидался (точка SEEKTABLE неверна)
+        """
+        block_size = self.streaminfo[BLOCK_MAXSIZE]
+        checked = False
+        for candidate in find_sync_codes(file, pos):
+            if candidate < pos:
+                continue
+            if self.blocking_strategy:
+                expected = first_sample
+            else:
+                expected = first_sample // block_size
+            try:
+                if file[candidate + 1] & 1 != self.blocking_strategy:
+                    continue
+                _, number, frame_block_size, _, _, _, end = parse_frame_header(file, candidate, self.streaminfo)
+            except (ValueError, IndexError):
+                continue
+            if number != expected:
+                if not checked:
+                    return None
+                continue
+            checked = True
+            pos = end
+            if sample < first_sample + frame_block_size:
+                return candidate, first_sample
+            first_sample += frame_block_size
+        if not checked:
+            return None
+        raise ValueError('sample is out of stream')
 
-        if channels >= 11:
-            raise ValueError()
-        if 0 <= channels <= 7:
-            channels += 1
-        else:
-            channels = constants.channels[channels]
+    def verify_frames(self, use_mmap=True, workers=None):
+        """
+        Проверка CRC-16 всех фреймов. Фрейм заканчивается там,
+        где начинается следующий, последний - в конце файла.
+        С numpy CRC считается кусками (порядка 100 МБ/с), без него -
+        циклом на чистом питоне, примерно в десять раз медленнее
+        :param workers: число процессов, по которым делятся фреймы
+        :return: номера фреймов с неверной контрольной суммой
+        """
+        self.check_file()
+        if not self.frames:
+            self.parse_frames(use_mmap, workers)
+        with self.phase('verify_frames'):
+            corrupted = self.__check_frames(use_mmap, workers)
+        if self.stats is not None and self.frames:
+            self.count(instrumentation.CRC_BYTES, os.path.getsize(self.filename) - self.frames.offsets[0])
+            self.count(instrumentation.CRC_FAILURES, len(corrupted))
+        return corrupted
 
-        sample_size = int(data[4:7], 2)
+    def __check_frames(self, use_mmap, workers):
+        offsets = self.frames.offsets
+        if workers is None or workers < 2 or len(offsets) < 2:
+            return check_frame_range(self.filename, offsets, None, use_mmap)
+        bounds = [len(offsets) * i // workers for i in range(0, workers + 1)]
+        ranges = [(begin, end) for begin, end in zip(bounds, bounds[1:]) if begin < end]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(check_frame_range, self.filename, offsets[begin:end],
+                                       offsets[end] if end < len(offsets) else None, use_mmap)
+                       for begin, end in ranges]
+            return [begin + i for (begin, _), future in zip(ranges, futures) for i in future.result()]
 
-        if sample_size == 3 or sample_size == 7:
+    def read_frame_header(self, file, pos, counter):
+        """
+        Заголовок фрейма с проверкой стратегии блокировки и,
+        для фиксированного размера блока, номера фрейма
+        :return: то же, что parse_frame_header
+        """
+        if file[pos + 1] & 1 != self.blocking_strategy:
             raise ValueError()
-        if sample_size == 0:
-            sample_size = self.streaminfo[BITS_PER_SAMPLE]
-        else:
-            sample_size = constants.sample_size[sample_size]
-
+        header = parse_frame_header(file, pos, self.streaminfo)
         if self.blocking_strategy == 0:
-            if frame_sample_number != counter:
+            if header[1] != counter:
                 raise ValueError()
+        return header
 
-        end_pos = pos + 4 + block_size_len + sample_rate_len + length
-        if file[end_pos] != crc8.get_crc(file[pos:end_pos]):
-            raise ValueError()
-        pos += 5 + block_size_len + sample_rate_len + length
-        return block_size, sample_rate, channels, sample_size, pos, frame_sample_number
+    def parse_one_frame(self, file, pos, counter):
+        _, frame_sample_number, block_size, sample_rate, channels, sample_size, pos \
+            = self.read_frame_header(file, pos, counter)
+        return block_size, hz_to_khz(sample_rate), channel_description(channels), \
+            sample_size, pos, frame_sample_number
 
     def save_picture(self):
         """
@@ -515,17 +1193,17 @@ class AudioFile:
             text += cuesheet_text
         return text
 
+    def save_frames_report(self, out, report_format='text', use_mmap=True):
+        """
+        Отчет о фреймах в приемник out (см. write_frames_report). Если фреймы
+        еще не разобраны, записи пишутся по ходу разбора и в self.frames не копятся
+        """
+        if self.frames:
+            frames = zip(*self.frames.columns())
+        else:
+            frames = self.scan_frames(use_mmap)
+        write_frames_report(frames, out, report_format, self.blocking_strategy)
+
     def save_frames_text(self):
-        text = ''
-        for i in range(0, len(self.frames)):
-            text += constants.frames_text.format(i,
-                                                 self.frames[i][OFFSET],
-                                                 self.frames[i][BLOCK_SIZE],
-                                                 self.frames[i][SAMPLE_RATE],
-                                                 self.frames[i][CHANNELS],
-                                                 self.frames[i][SAMPLE_SIZE])
-            if self.blocking_strategy:
-                text += constants.sample_number_text.format(self.frames[i][SAMPLE_NUMBER])
-            text += '\n\n'
         with open(self.filename.split('.')[0] + ' frames.txt', 'w') as f:
-            f.write(text)
+            self.save_frames_report(f, 'text')
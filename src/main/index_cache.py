@@ -0,0 +1,209 @@
+"""
+Кэш индекса фреймов на диске: метаданные и колонки FrameIndex
+хранятся в каталоге, по файлу на каждый flac. Ключ - путь, размер
+и время изменения файла, при необходимости сверяется и MD5 из STREAMINFO
+"""
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+from typing import Final
+
+from flac import FrameIndex
+
+# сигнатура, версия формата, стратегия блокировки, число фреймов,
+# длина метаданных, число картинок
+ENTRY_HEADER: Final = struct.Struct('<4sBBQII')
+# смещение и длина изображения картинки в файле
+PICTURE_RANGE: Final = struct.Struct('<QQ')
+MAGIC: Final = b'FLIX'
+VERSION: Final = 2
+SUFFIX: Final = '.idx'
+# пирамида пиков для обзора звука (waveform.py), вытесняется вместе с индексами
+PEAKS_SUFFIX: Final = '.peaks'
+# MD5 несжатого звука в STREAMINFO: 'fLaC', заголовок блока и 18 байт до MD5
+MD5_OFFSET: Final = 26
+MD5_END: Final = 42
+MAX_BYTES: Final = 256 * 1024 * 1024
+# вытеснение при записи освобождает место до этой доли max_bytes,
+# чтобы каталог просматривался не при каждой записи
+EVICT_TO: Final = 0.9
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'flac')
+
+
+class IndexCache:
+    """
+    Записи вытесняются по давности использования (LRU), когда их
+    суммарный размер превышает max_bytes. Время последнего использования -
+    время изменения файла записи, оно обновляется при каждом попадании.
+    Суммарный размер записей считается при первой записи одним просмотром
+    каталога и дальше ведется по ходу; каталог просматривается снова, только
+    когда сумма превысит max_bytes (тогда же учитываются записи других процессов)
+    """
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, check_md5=False):
+        """
+        :param check_md5: дополнительно сверять MD5 из STREAMINFO файла
+        с сохраненным, на случай подмены файла с тем же размером и временем
+        """
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.check_md5 = check_md5
+        # суммарный размер записей, None - каталог еще не просматривался
+        self.total = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry_path(self, filename, suffix=SUFFIX):
+        """
+        :return: путь к записи для текущего состояния файла
+        """
+        stat = os.stat(filename)
+        key = '{}\0{}\0{}'.format(os.path.realpath(filename), stat.st_size, stat.st_mtime_ns)
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + suffix)
+
+    def load(self, audio_file):
+        """
+        Заполнение audio_file (метаданные, стратегия блокировки, фреймы)
+        из записи кэша
+        :return: нашлась ли подходящая запись
+        """
+        path = self.entry_path(audio_file.filename)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        try:
+            blocking_strategy, frames, metadata, picture_payloads = self.__unpack(data)
+        except (ValueError, struct.error):
+            self.remove_entry(path, len(data))
+            return False
+        if self.check_md5:
+            with open(audio_file.filename, 'rb') as f:
+                head = f.read(MD5_END)
+            if head[MD5_OFFSET:MD5_END] != metadata[MD5_OFFSET:MD5_END]:
+                return False
+        audio_file.read_metadata(io.BytesIO(metadata), picture_payloads)
+        audio_file.blocking_strategy = blocking_strategy
+        audio_file.frames = frames
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def store(self, audio_file):
+        """
+        Запись метаданных и индекса фреймов audio_file, затем вытеснение
+        старых записей. Запись идет во временный файл с атомарной заменой,
+        так что каталог можно делить между процессами
+        """
+        path = self.entry_path(audio_file.filename)
+        columns = audio_file.frames.columns()
+        chunks = [ENTRY_HEADER.pack(MAGIC, VERSION, audio_file.blocking_strategy,
+                                    len(audio_file.frames), len(audio_file.metadata),
+                                    len(audio_file.picture_payloads)),
+                  audio_file.metadata]
+        chunks.extend(PICTURE_RANGE.pack(offset, length)
+                      for offset, length in audio_file.picture_payloads)
+        for column in columns:
+            if sys.byteorder == 'big':
+                column = column[:]
+                column.byteswap()
+            chunks.append(column.tobytes())
+        self.write_entry(path, b''.join(chunks))
+
+    def write_entry(self, path, data):
+        """
+        Атомарная запись data в path каталога кэша и вытеснение, если
+        суммарный размер превысил max_bytes
+        """
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            self.__remove(temporary)
+            raise
+        if self.total is None:
+            self.evict()
+            return
+        self.total += len(data) - replaced
+        if self.total > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICT_TO))
+
+    def remove_entry(self, path, size):
+        """
+        Удаление испорченной записи размера size
+        """
+        self.__remove(path)
+        if self.total is not None:
+            self.total = max(0, self.total - size)
+
+    def evict(self, limit=None):
+        """
+        Удаление давно не использованных записей, пока их суммарный
+        размер больше limit (по умолчанию max_bytes)
+        """
+        if limit is None:
+            limit = self.max_bytes
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((SUFFIX, PEAKS_SUFFIX)):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            self.__remove(path)
+            total -= size
+        self.total = total
+
+    @staticmethod
+    def __unpack(data):
+        magic, version, blocking_strategy, count, metadata_size, pictures \
+            = ENTRY_HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not an index cache entry')
+        pos = ENTRY_HEADER.size
+        metadata = data[pos:pos + metadata_size]
+        if len(metadata) < metadata_size:
+            raise ValueError('index cache entry is truncated')
+        pos += metadata_size
+        picture_payloads = [PICTURE_RANGE.unpack_from(data, pos + i * PICTURE_RANGE.size)
+                            for i in range(0, pictures)]
+        pos += pictures * PICTURE_RANGE.size
+        frames = FrameIndex()
+        for column in frames.columns():
+            size = count * column.itemsize
+            if pos + size > len(data):
+                raise ValueError('index cache entry is truncated')
+            column.frombytes(data[pos:pos + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            pos += size
+        return blocking_strategy, frames, metadata, picture_payloads
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
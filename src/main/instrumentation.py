@@ -0,0 +1,78 @@
+"""
+Необязательные замеры работы AudioFile: время фаз, прочитанные байты,
+кандидаты в начала фреймов, ошибки заголовков, попадания в кэш.
+Без объекта Stats AudioFile ничего не замеряет
+"""
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Final
+
+logger: Final = logging.getLogger('flac')
+
+PHASE: Final = 'phase'
+COUNT: Final = 'count'
+
+# счетчики
+BYTES_READ: Final = 'bytes read'
+BYTES_SKIPPED: Final = 'bytes skipped'
+BYTES_SCANNED: Final = 'bytes scanned'
+SYNC_CANDIDATES: Final = 'sync candidates'
+CANDIDATES_IN_HEADER: Final = 'candidates inside header'
+FRAMES_ACCEPTED: Final = 'frames accepted'
+HEADER_ERRORS: Final = 'header errors'
+CRC_BYTES: Final = 'crc bytes'
+CRC_FAILURES: Final = 'crc failures'
+CACHE_HITS: Final = 'cache hits'
+CACHE_MISSES: Final = 'cache misses'
+CACHE_STORES: Final = 'cache stores'
+
+
+class Stats:
+    """
+    Таймеры фаз (суммарное время и число вызовов) и счетчики.
+    Каждое событие можно получать через callback(событие, имя, значение),
+    где событие - PHASE (значение - секунды) или COUNT (значение - приращение),
+    и/или в logging на уровне DEBUG
+    """
+    def __init__(self, callback=None, log=False):
+        self.timers = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.callback = callback
+        self.log = log
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.timers[name] += elapsed
+            self.calls[name] += 1
+            self.emit(PHASE, name, elapsed)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        self.emit(COUNT, name, value)
+
+    def emit(self, event, name, value):
+        if self.callback is not None:
+            self.callback(event, name, value)
+        if self.log:
+            logger.debug('%s %s: %s', event, name, value)
+
+    def as_dict(self):
+        return {'timers': dict(self.timers),
+                'calls': dict(self.calls),
+                'counters': dict(self.counters)}
+
+    def reset(self):
+        self.timers.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def __repr__(self):
+        return repr(self.as_dict())
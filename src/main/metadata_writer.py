@@ -0,0 +1,302 @@
+"""
+Изменение метаданных flac: теги VORBIS_COMMENT, картинки, SEEKTABLE.
+Если новые блоки помещаются на место старых вместе с PADDING, переписывается
+только область метаданных, иначе файл переписывается потоком во временный
+файл рядом с исходным
+"""
+import os
+import shutil
+import tempfile
+from typing import Final
+
+from flac import AudioFile, FIRST_SAMPLE, NUMBER_OF_SAMPLES, OFFSET, PLACEHOLDER, read_exactly
+
+STREAMINFO_TYPE: Final = 0
+PADDING_TYPE: Final = 1
+SEEKTABLE_TYPE: Final = 3
+VORBIS_COMMENT_TYPE: Final = 4
+PICTURE_TYPE: Final = 6
+# PADDING, который кладется при полной перезаписи файла
+PADDING_SIZE: Final = 8192
+MAX_BLOCK_SIZE: Final = (1 << 24) - 1
+COPY_SIZE: Final = 1 << 20
+# кусок, которым сравниваются старая и новая область метаданных
+COMPARE_SIZE: Final = 1 << 16
+
+
+class Block:
+    """
+    Блок метаданных: либо лежит в файле без изменений (offset - начало
+    содержимого после заголовка), либо задан новым содержимым body
+    """
+    __slots__ = ('type', 'offset', 'size', 'body')
+
+    def __init__(self, type_of_block, offset=None, size=0, body=None):
+        self.type = type_of_block
+        self.offset = offset
+        self.size = size if body is None else len(body)
+        self.body = body
+
+    def read(self, f):
+        if self.body is not None:
+            return self.body
+        f.seek(self.offset)
+        body = read_exactly(f, self.size)
+        if len(body) < self.size:
+            raise ValueError('metadata is truncated')
+        return body
+
+
+def vorbis_comment_body(tags, vendor):
+    """
+    :param tags: имя тега -> строка или набор строк
+    """
+    comments = []
+    for name, values in tags.items():
+        if isinstance(values, str):
+            values = [values]
+        elif isinstance(values, (set, frozenset)):
+            values = sorted(values)
+        for value in values:
+            comments.append('{}={}'.format(name, value).encode())
+    vendor = vendor.encode()
+    return len(vendor).to_bytes(4, byteorder='little') + vendor + \
+        len(comments).to_bytes(4, byteorder='little') + \
+        b''.join(len(comment).to_bytes(4, byteorder='little') + comment for comment in comments)
+
+
+def picture_body(data, mime_type='image/jpeg', description='', picture_type=3,
+                 width=0, height=0, color_depth=0, number_of_colors=0):
+    """
+    :param picture_type: код типа картинки, см. constants.picture_descr (3 - передняя обложка)
+    """
+    mime_type = mime_type.encode()
+    description = description.encode()
+    return picture_type.to_bytes(4, byteorder='big') + \
+        len(mime_type).to_bytes(4, byteorder='big') + mime_type + \
+        len(description).to_bytes(4, byteorder='big') + description + \
+        width.to_bytes(4, byteorder='big') + \
+        height.to_bytes(4, byteorder='big') + \
+        color_depth.to_bytes(4, byteorder='big') + \
+        number_of_colors.to_bytes(4, byteorder='big') + \
+        len(data).to_bytes(4, byteorder='big') + data
+
+
+def seektable_body(points):
+    """
+    :param points: словари с ключами FIRST_SAMPLE, OFFSET, NUMBER_OF_SAMPLES,
+    как в AudioFile.seektable
+    """
+    return b''.join(point[FIRST_SAMPLE].to_bytes(8, byteorder='big') +
+                    point[OFFSET].to_bytes(8, byteorder='big') +
+                    point[NUMBER_OF_SAMPLES].to_bytes(2, byteorder='big')
+                    for point in points)
+
+
+def padding_blocks(free):
+    """
+    :param free: место под PADDING вместе с заголовками, 0 или не меньше 4
+    :return: блоки PADDING, каждый не больше MAX_BLOCK_SIZE
+    """
+    blocks = []
+    while free:
+        size = min(free - 4, MAX_BLOCK_SIZE)
+        rest = free - 4 - size
+        # остатку нужен хотя бы заголовок следующего блока
+        if 0 < rest < 4:
+            size -= 4 - rest
+        blocks.append(Block(PADDING_TYPE, body=bytes(size)))
+        free -= 4 + size
+    return blocks
+
+
+def common_prefix(first, second):
+    """
+    Длина общего начала двух буферов. Сравниваются куски по COMPARE_SIZE байт,
+    внутри отличающегося куска отличие ищется делением пополам
+    """
+    first = memoryview(first).cast('B')
+    second = memoryview(second).cast('B')
+    size = min(len(first), len(second))
+    start = 0
+    while start < size:
+        end = min(start + COMPARE_SIZE, size)
+        if first[start:end] != second[start:end]:
+            break
+        start = end
+    else:
+        return size
+    while end - start > 1:
+        middle = (start + end) // 2
+        if first[start:middle] == second[start:middle]:
+            start = middle
+        else:
+            end = middle
+    return start
+
+
+class MetadataEditor:
+    """
+    Правка метаданных файла. Изменения копятся в self.blocks
+    и записываются вызовом save
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.blocks = []
+        with open(filename, 'rb') as f:
+            AudioFile.file_is_flac(f)
+            pos = 4
+            is_last = False
+            while not is_last:
+                header = read_exactly(f, 4)
+                if len(header) < 4:
+                    raise ValueError('metadata is truncated')
+                is_last, type_of_block, size = AudioFile.parse_metadata_block_header(header)
+                self.blocks.append(Block(type_of_block, pos + 4, size))
+                pos += 4 + size
+                f.seek(pos)
+        if not self.blocks or self.blocks[0].type != STREAMINFO_TYPE:
+            raise ValueError('streaminfo is not the first block')
+        # начало первого фрейма
+        self.first_frame = pos
+
+    def __replace(self, type_of_block, body):
+        """
+        Замена единственного блока данного типа или добавление нового
+        """
+        new = Block(type_of_block, body=body)
+        indices = [i for i, block in enumerate(self.blocks) if block.type == type_of_block]
+        if indices:
+            self.blocks[indices[0]] = new
+            for i in reversed(indices[1:]):
+                del self.blocks[i]
+        else:
+            self.blocks.append(new)
+
+    def set_tags(self, tags, vendor=None):
+        """
+        Замена всех тегов
+        :param tags: имя тега -> строка или набор строк (как AudioFile.tags,
+        ключ 'vendor' задает строку производителя)
+        """
+        tags = dict(tags)
+        vendor = tags.pop('vendor', vendor)
+        if vendor is None:
+            vendor = self.__current_vendor()
+        self.__replace(VORBIS_COMMENT_TYPE, vorbis_comment_body(tags, vendor))
+
+    def __current_vendor(self):
+        for block in self.blocks:
+            if block.type == VORBIS_COMMENT_TYPE:
+                with open(self.filename, 'rb') as f:
+                    body = block.read(f)
+                length = int.from_bytes(body[0:4], byteorder='little')
+                return body[4:4 + length].decode()
+        return 'flac.py'
+
+    def set_seektable(self, points):
+        """
+        Точки упорядочиваются по первому сэмплу, повторы отбрасываются,
+        заполнители (FIRST_SAMPLE == PLACEHOLDER) ставятся в конец
+        """
+        seektable = []
+        for point in sorted(points, key=lambda point: point[FIRST_SAMPLE]):
+            if point[FIRST_SAMPLE] == PLACEHOLDER or not seektable \
+                    or seektable[-1][FIRST_SAMPLE] != point[FIRST_SAMPLE]:
+                seektable.append(point)
+        self.__replace(SEEKTABLE_TYPE, seektable_body(seektable))
+
+    def __picture_index(self, i):
+        """
+        :return: индекс i-й картинки в self.blocks
+        """
+        return [j for j, block in enumerate(self.blocks) if block.type == PICTURE_TYPE][i]
+
+    def add_picture(self, data, **options):
+        """
+        :param options: см. picture_body
+        """
+        self.blocks.append(Block(PICTURE_TYPE, body=picture_body(data, **options)))
+
+    def replace_picture(self, i, data, **options):
+        self.blocks[self.__picture_index(i)] = Block(PICTURE_TYPE, body=picture_body(data, **options))
+
+    def remove_picture(self, i):
+        del self.blocks[self.__picture_index(i)]
+
+    def save(self, padding=PADDING_SIZE):
+        """
+        Запись изменений
+        :param padding: размер PADDING при перезаписи файла целиком
+        :return: True, если хватило места и файл изменен на месте
+        """
+        blocks = [block for block in self.blocks if block.type != PADDING_TYPE]
+        for block in blocks:
+            if block.size > MAX_BLOCK_SIZE:
+                raise ValueError('metadata block is too large')
+        size = sum(4 + block.size for block in blocks)
+        free = self.first_frame - 4 - size
+        # остаток места уходит в PADDING, ему нужен хотя бы заголовок
+        in_place = free == 0 or free >= 4
+        if in_place:
+            blocks.extend(padding_blocks(free))
+            self.__write_in_place(blocks)
+        else:
+            blocks.extend(padding_blocks(4 + padding))
+            self.__rewrite(blocks)
+        self.__init__(self.filename)
+        return in_place
+
+    @staticmethod
+    def __serialize(blocks, source):
+        """
+        :return: генератор кусков области метаданных после 'fLaC'
+        """
+        for i, block in enumerate(blocks):
+            is_last = 0x80 if i == len(blocks) - 1 else 0
+            yield bytes([is_last | block.type]) + block.size.to_bytes(3, byteorder='big')
+            yield block.read(source)
+
+    def __write_in_place(self, blocks):
+        """
+        Новая область метаданных того же размера. Блоки из файла читаются
+        до начала записи, пишется только часть начиная с первого отличия
+        """
+        with open(self.filename, 'r+b') as f:
+            region = b''.join(self.__serialize(blocks, f))
+            f.seek(4)
+            old = read_exactly(f, len(region))
+            start = common_prefix(region, old)
+            if start == len(region):
+                return
+            f.seek(4 + start)
+            f.write(region[start:])
+
+    def __rewrite(self, blocks):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(self.filename, 'rb') as f:
+                out.write(b'fLaC')
+                for chunk in self.__serialize(blocks, f):
+                    out.write(chunk)
+                f.seek(self.first_frame)
+                shutil.copyfileobj(f, out, COPY_SIZE)
+            shutil.copymode(self.filename, temporary)
+            os.replace(temporary, self.filename)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+
+def write_seektable(filename, seconds=None, count=None, placeholders=0, padding=PADDING_SIZE):
+    """
+    Построение SEEKTABLE по фреймам файла (см. AudioFile.build_seektable)
+    и запись его в файл
+    :return: True, если файл изменен на месте
+    """
+    points = AudioFile(filename).build_seektable(seconds, count, placeholders)
+    editor = MetadataEditor(filename)
+    editor.set_seektable(points)
+    return editor.save(padding)
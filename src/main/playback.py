@@ -0,0 +1,424 @@
+"""
+Воспроизведение без пауз между треками: поток декодирования заполняет
+кольцевой буфер PCM заранее, поток вывода отдает его приемнику.
+Следующий трек очереди открывается и декодируется, пока в буфере еще
+звучит конец текущего, так что треки идут сэмпл в сэмпл.
+Приемник - любой объект с методами open(rate, channels, bits_per_sample),
+write(data) и close(); data - PCM как у decoder.pcm_bytes
+"""
+import threading
+import wave
+from bisect import bisect_right
+from collections import deque
+from time import perf_counter
+from typing import Final
+
+from decoder import decode_frames, pcm_bytes
+from flac import AudioFile, BITS_PER_SAMPLE, CHANNELS, RATE, SAMPLES_IN_FLOW
+
+BUFFER_SIZE: Final = 1 << 20
+# сколько байт поток вывода отдает приемнику за раз
+PERIOD: Final = 16384
+
+
+def frame_bytes(audio_format):
+    """
+    :param audio_format: частота, число каналов, бит на сэмпл
+    :return: размер одного сэмпла всех каналов в PCM
+    """
+    _, channels, bits_per_sample = audio_format
+    return channels * ((bits_per_sample + 7) // 8)
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер байт фиксированного размера, без синхронизации
+    """
+    def __init__(self, capacity):
+        self.data = bytearray(capacity)
+        self.start = 0
+        self.available = 0
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    @property
+    def free(self):
+        return len(self.data) - self.available
+
+    def write(self, data):
+        """
+        :return: сколько байт поместилось
+        """
+        size = min(len(data), self.free)
+        end = (self.start + self.available) % len(self.data)
+        first = min(size, len(self.data) - end)
+        self.data[end:end + first] = data[:first]
+        self.data[:size - first] = data[first:size]
+        self.available += size
+        return size
+
+    def read(self, size):
+        size = min(size, self.available)
+        first = min(size, len(self.data) - self.start)
+        result = bytes(self.data[self.start:self.start + first]) + bytes(self.data[:size - first])
+        self.start = (self.start + size) % len(self.data)
+        self.available -= size
+        return result
+
+    def clear(self):
+        self.start = 0
+        self.available = 0
+
+
+class NullSink:
+    """
+    Отбрасывает звук, считая байты; для работы без звуковой карты
+    """
+    def __init__(self):
+        self.format = None
+        self.written = 0
+        self.opened = 0
+
+    def open(self, rate, channels, bits_per_sample):
+        self.format = (rate, channels, bits_per_sample)
+        self.opened += 1
+
+    def write(self, data):
+        self.written += len(data)
+
+    def close(self):
+        self.format = None
+
+
+class WavSink:
+    """
+    Запись звука в wav. Каждый open (то есть каждая смена формата)
+    начинает новый файл: '{}' в имени заменяется номером файла,
+    без него файл перезаписывается
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.files = []
+        self.file = None
+        self.unsigned = False
+
+    def open(self, rate, channels, bits_per_sample):
+        filename = self.filename.format(len(self.files))
+        self.files.append(filename)
+        self.file = wave.open(filename, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setsampwidth((bits_per_sample + 7) // 8)
+        self.file.setframerate(rate)
+        # 8-битные сэмплы в wav беззнаковые
+        self.unsigned = bits_per_sample <= 8
+
+    def write(self, data):
+        if self.unsigned:
+            data = bytes((byte + 128) & 0xFF for byte in data)
+        self.file.writeframes(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Marker:
+    """
+    Начало трека (или места после перемотки) в потоке байт буфера
+    """
+    __slots__ = ('pos', 'index', 'sample', 'format')
+
+    def __init__(self, pos, index, sample, audio_format):
+        self.pos = pos
+        self.index = index
+        self.sample = sample
+        self.format = audio_format
+
+
+class PlaybackEngine:
+    """
+    Очередь треков и два потока: декодирования и вывода.
+    Счетчики: underruns - сколько раз буфер опустел посреди воспроизведения,
+    decoded_frames, written - байт отдано приемнику, seek_latency - секунд
+    от последней перемотки до первого записанного сэмпла; latency() -
+    сколько секунд звука лежит в буфере. Треки, которые не удалось
+    прочитать, пропускаются и попадают в errors
+    """
+    def __init__(self, sink, buffer_size=BUFFER_SIZE, period=PERIOD, cache=None, on_track=None):
+        """
+        :param cache: block_cache.BlockCache: фреймы декодируются через него,
+        повторная перемотка берет их из памяти
+        :param on_track: вызывается из потока вывода с именем файла,
+        когда начинает звучать другой трек
+        """
+        self.sink = sink
+        self.period = period
+        self.cache = cache
+        self.on_track = on_track
+        self.ring = RingBuffer(buffer_size)
+        self.condition = threading.Condition()
+        self.playlist = []
+        # открытые файлы по номеру в очереди
+        self.files = {}
+        # откуда продолжит поток декодирования
+        self.next_index = 0
+        self.next_sample = 0
+        # номер перемотки, данные прежних перемоток отбрасываются
+        self.generation = 0
+        self.markers = deque()
+        self.written_total = 0
+        self.read_total = 0
+        self.decoding = False
+        self.writing = False
+        self.paused = False
+        self.closed = False
+        self.starving = False
+        self.playing_index = 0
+        self.sink_format = None
+        self.threads = []
+        self.errors = []
+        self.underruns = 0
+        self.decoded_frames = 0
+        self.written = 0
+        self.seek_latency = None
+        self.seek_time = None
+
+    def enqueue(self, filename):
+        with self.condition:
+            self.playlist.append(filename)
+            self.condition.notify_all()
+
+    def play(self):
+        with self.condition:
+            self.paused = False
+            self.condition.notify_all()
+        if not self.threads:
+            self.threads = [threading.Thread(target=self.__decode, name='playback-decoder', daemon=True),
+                            threading.Thread(target=self.__output, name='playback-output', daemon=True)]
+            for thread in self.threads:
+                thread.start()
+
+    def pause(self):
+        """
+        Вывод останавливается, буфер продолжает заполняться
+        """
+        with self.condition:
+            self.paused = True
+            self.condition.notify_all()
+
+    def seek(self, sample, index=None):
+        """
+        Переход к сэмплу трека
+        :param index: номер трека в очереди, по умолчанию звучащий
+        """
+        if index is None:
+            index = self.playing_index
+        if not 0 <= index < len(self.playlist):
+            raise ValueError('track is out of playlist')
+        total = self.__open(index).streaminfo[SAMPLES_IN_FLOW]
+        if sample < 0 or total and sample >= total:
+            raise ValueError('sample is out of stream')
+        with self.condition:
+            self.generation += 1
+            self.ring.clear()
+            self.markers.clear()
+            self.written_total = 0
+            self.read_total = 0
+            self.playing_index = index
+            self.next_index = index
+            self.next_sample = sample
+            self.seek_time = perf_counter()
+            self.condition.notify_all()
+
+    def position(self):
+        """
+        :return: имя звучащего файла и номер сэмпла в нем
+        """
+        with self.condition:
+            self.__advance()
+            if not self.markers:
+                return None, 0
+            marker = self.markers[0]
+            return self.playlist[marker.index], \
+                marker.sample + (self.read_total - marker.pos) // frame_bytes(marker.format)
+
+    def latency(self):
+        """
+        :return: секунд звука в буфере
+        """
+        with self.condition:
+            if not self.markers:
+                return 0.0
+            rate = self.markers[0].format[0]
+            return self.ring.available / (rate * frame_bytes(self.markers[0].format))
+
+    def __finished(self):
+        return not self.decoding and not self.writing and not self.ring.available \
+            and self.next_index >= len(self.playlist)
+
+    def wait(self, timeout=None):
+        """
+        Ожидание конца очереди
+        :return: False, если истек timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.closed or self.__finished(), timeout)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.sink_format is not None:
+            self.sink.close()
+            self.sink_format = None
+
+    def __open(self, index):
+        audio_file = self.files.get(index)
+        if audio_file is None:
+            audio_file = self.files[index] = AudioFile(self.playlist[index])
+        return audio_file
+
+    def __decode(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or self.next_index < len(self.playlist))
+                if self.closed:
+                    return
+                index, sample, generation = self.next_index, self.next_sample, self.generation
+                self.decoding = True
+            try:
+                self.__decode_track(index, sample, generation)
+            except (OSError, ValueError) as e:
+                self.errors.append((self.playlist[index], str(e)))
+            with self.condition:
+                self.decoding = False
+                if generation == self.generation:
+                    self.next_index = index + 1
+                    self.next_sample = 0
+                self.condition.notify_all()
+
+    def __blocks(self, audio_file, sample):
+        """
+        :return: генератор (номер первого сэмпла, каналы) от фрейма с sample
+        """
+        if self.cache is not None:
+            return self.__cached_blocks(audio_file, sample)
+        if not sample:
+            return decode_frames(audio_file)
+        offset, _ = audio_file.seek(sample)
+        return decode_frames(audio_file, offset)
+
+    def __cached_blocks(self, audio_file, sample):
+        """
+        Все фреймы берутся через кэш: его чтение вперед декодирует следующие
+        фреймы, пока звучат текущие, а при повторной перемотке они уже в памяти
+        """
+        yield self.cache.get_sample(audio_file, sample)
+        frames = audio_file.frames
+        for i in range(bisect_right(frames.sample_numbers, sample), len(frames)):
+            try:
+                channels = self.cache.get(audio_file, i)
+            except (ValueError, IndexError):
+                # поврежденный фрейм пропускается, как в decode_frames
+                continue
+            yield frames.sample_numbers[i], channels
+
+    def __decode_track(self, index, sample, generation):
+        audio_file = self.__open(index)
+        streaminfo = audio_file.streaminfo
+        audio_format = (streaminfo[RATE], streaminfo[CHANNELS], streaminfo[BITS_PER_SAMPLE])
+        with self.condition:
+            if generation != self.generation:
+                return
+            self.markers.append(Marker(self.written_total, index, sample, audio_format))
+        for first, channels in self.__blocks(audio_file, sample):
+            if first < sample:
+                channels = [samples[sample - first:] for samples in channels]
+            self.decoded_frames += 1
+            if not self.__put(pcm_bytes(channels, audio_format[2]), generation, frame_bytes(audio_format)):
+                return
+
+    def __put(self, data, generation, size):
+        """
+        Запись в буфер целыми сэмплами, с ожиданием места
+        :return: False, если была перемотка или остановка
+        """
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or generation != self.generation
+                                        or self.ring.free >= size)
+                if self.closed or generation != self.generation:
+                    return False
+                free = self.ring.free
+                written = self.ring.write(view[pos:pos + free - free % size])
+                pos += written
+                self.written_total += written
+                self.condition.notify_all()
+        return True
+
+    def __advance(self):
+        """
+        Переход к следующей метке, когда вывод до нее дошел
+        """
+        while len(self.markers) > 1 and self.markers[1].pos <= self.read_total:
+            self.markers.popleft()
+
+    def __ready(self):
+        if self.closed:
+            return True
+        if self.paused:
+            return False
+        if self.ring.available:
+            return True
+        # буфер пуст, а звук еще будет: считается, если воспроизведение уже шло
+        if self.read_total and not self.starving and not self.__finished():
+            self.starving = True
+            self.underruns += 1
+        return False
+
+    def __output(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(self.__ready)
+                if self.closed:
+                    return
+                self.starving = False
+                self.__advance()
+                marker = self.markers[0]
+                size = self.ring.available
+                if len(self.markers) > 1:
+                    size = min(size, self.markers[1].pos - self.read_total)
+                size = min(size, max(self.period - self.period % frame_bytes(marker.format),
+                                     frame_bytes(marker.format)))
+                data = self.ring.read(size)
+                self.read_total += len(data)
+                changed = marker.index != self.playing_index or self.written == 0
+                self.playing_index = marker.index
+                generation = self.generation
+                self.writing = True
+                self.condition.notify_all()
+            try:
+                if marker.format != self.sink_format:
+                    if self.sink_format is not None:
+                        self.sink.close()
+                    self.sink.open(*marker.format)
+                    self.sink_format = marker.format
+                if changed and self.on_track is not None:
+                    self.on_track(self.playlist[marker.index])
+                self.sink.write(data)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.written += len(data)
+                    if self.seek_time is not None and generation == self.generation:
+                        self.seek_latency = perf_counter() - self.seek_time
+                        self.seek_time = None
+                    self.condition.notify_all()
@@ -5,7 +5,8 @@ from argparse import ArgumentParser
 from PyQt5.QtCore import QUrl, QCoreApplication
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 
-from flac import AudioFile
+from flac import AudioFile, RATE, frame_report_formats
+from index_cache import IndexCache
 
 volume_regex = re.compile(r'v (\d+)')
 position_regex = re.compile(r'p ([-+])(\d+)')
@@ -30,8 +31,21 @@ class Player:
                                  action='store_true', required=False)
         self.parser.add_argument('-fr', '--frames', help="Save frames info",
                                  action='store_true', required=False)
+        self.parser.add_argument('--frames-output', dest='frames_output', action='store',
+                                 required=False, metavar='FILE',
+                                 help="Write frames info to FILE ('-' for stdout) "
+                                      "instead of '<name> frames.txt'")
+        self.parser.add_argument('--frames-format', dest='frames_format', action='store',
+                                 choices=sorted(frame_report_formats), default='text',
+                                 help='Frames info format (default: text)')
+        self.parser.add_argument('--cache', dest='cache', action='store',
+                                 required=False, metavar='DIR',
+                                 help='Frame index cache directory (default ~/.cache/flac)')
+        self.parser.add_argument('--no-cache', dest='no_cache', help="Don't use frame index cache",
+                                 action='store_true', required=False)
         self.args = self.parser.parse_args()
-        self.file = AudioFile(self.args.filename)
+        cache = None if self.args.no_cache else IndexCache(self.args.cache)
+        self.file = AudioFile(self.args.filename, cache)
 
         # нужно ли сохранить картинку
         if self.args.picture:
@@ -41,7 +55,9 @@ class Player:
         media_content = QMediaContent(QUrl.fromLocalFile(self.file.filename))
         self.player.setMedia(media_content)
         print(self.file.make_text())
-        if self.args.frames:
+        if self.args.frames_output:
+            self.save_frames_report(self.args.frames_output, self.args.frames_format)
+        elif self.args.frames:
             self.file.parse_frames()
             self.file.save_frames_text()
 
@@ -71,7 +87,6 @@ class Player:
             if volume:
                 self.player.setVolume(int(volume.group(1)))
             # изменить позицию в секундах
-            # TODO не работает чет
             position = position_regex.match(line)
             if position:
                 if position.group(1) == '+':
@@ -79,9 +94,32 @@ class Player:
                 else:
                     pos = -1*int(position.group(2))
                 self.position = self.player.position()
-                self.position = self.position + pos * 100
+                self.position = self.seek_position(self.position + pos * 1000)
                 self.player.setPosition(self.position)
 
+    def seek_position(self, position):
+        """
+        :param position: желаемая позиция в миллисекундах
+        :return: позиция начала фрейма, содержащего этот момент, в миллисекундах
+        """
+        rate = self.file.streaminfo[RATE]
+        position = max(0, position)
+        try:
+            _, first_sample = self.file.seek(position * rate // 1000)
+        except ValueError:
+            return position
+        return first_sample * 1000 // rate
+
+    def save_frames_report(self, filename, report_format):
+        binary = report_format == 'binary'
+        if filename == '-':
+            out = sys.stdout.buffer if binary else sys.stdout
+            self.file.save_frames_report(out, report_format)
+            out.flush()
+            return
+        with open(filename, 'wb' if binary else 'w') as out:
+            self.file.save_frames_report(out, report_format)
+
     def mediaStateChanged(self):
         if self.player.state() == QMediaPlayer.StoppedState:
             sys.exit()
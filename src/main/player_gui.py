@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import sys
+import threading
 
-from PyQt5.QtCore import QDir, Qt, QUrl
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import QDir, QLineF, Qt, QUrl, pyqtSignal
+from PyQt5.QtGui import QColor, QIcon, QPainter
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
 from PyQt5.QtWidgets import (QApplication, QFileDialog, QHBoxLayout, QLabel,
                              QSizePolicy, QSlider, QStyle,
@@ -11,6 +12,96 @@ from PyQt5.QtWidgets import (QApplication, QFileDialog, QHBoxLayout, QLabel,
 from PyQt5.QtWidgets import QMainWindow, QWidget, QPushButton, QAction
 
 from flac import AudioFile
+from index_cache import IndexCache
+from waveform import pyramid_of
+
+
+class WaveformSlider(QSlider):
+    """
+    Ползунок позиции с обзором звука под ним: min/max и RMS из PeakPyramid.
+    Пирамида строится (или читается из кэша) в фоновом потоке,
+    отрисовка звук не декодирует. Ctrl + колесо мыши меняет масштаб
+    обзора вокруг курсора
+    """
+    pyramidReady = pyqtSignal(str, object)
+    # во сколько раз меняется видимый диапазон за шаг колеса
+    zoomStep = 2
+
+    def __init__(self, orientation, parent=None):
+        super().__init__(orientation, parent)
+        self.pyramid = None
+        self.filename = None
+        # видимый диапазон сэмплов, None - весь файл
+        self.zoom = None
+        self.setMinimumHeight(48)
+        self.pyramidReady.connect(self.setPyramid)
+
+    def loadPyramid(self, audio_file, cache):
+        self.filename = audio_file.filename
+        self.pyramid = None
+        self.zoom = None
+        self.update()
+
+        def build():
+            try:
+                pyramid = pyramid_of(audio_file, cache)
+            except (OSError, ValueError):
+                return
+            self.pyramidReady.emit(audio_file.filename, pyramid)
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def setPyramid(self, filename, pyramid):
+        # результат для ранее открытого файла не нужен
+        if filename == self.filename:
+            self.pyramid = pyramid
+            self.update()
+
+    def clearPyramid(self):
+        self.filename = None
+        self.pyramid = None
+        self.update()
+
+    def setZoom(self, start=None, stop=None):
+        self.zoom = None if start is None else (start, stop)
+        self.update()
+
+    def wheelEvent(self, event):
+        if self.pyramid is None or not self.pyramid.total_samples \
+                or not event.modifiers() & Qt.ControlModifier:
+            super().wheelEvent(event)
+            return
+        total = self.pyramid.total_samples
+        start, stop = self.zoom or (0, total)
+        x = min(max(event.pos().x() / max(self.width(), 1), 0.0), 1.0)
+        center = start + (stop - start) * x
+        if event.angleDelta().y() > 0:
+            span = (stop - start) / self.zoomStep
+        else:
+            span = (stop - start) * self.zoomStep
+        # не мельче сэмпла на пиксель
+        span = max(span, self.width())
+        if span >= total:
+            self.setZoom()
+        else:
+            start = int(min(max(center - span * x, 0), total - span))
+            self.setZoom(start, start + int(span))
+        event.accept()
+
+    def paintEvent(self, event):
+        if self.pyramid is not None and self.pyramid.total_samples:
+            start, stop = self.zoom or (0, self.pyramid.total_samples)
+            mins, maxs, rms = self.pyramid.view(self.width(), start, stop)
+            middle = self.height() / 2
+            painter = QPainter(self)
+            painter.setPen(QColor(170, 170, 170))
+            for x, (low, high) in enumerate(zip(mins, maxs)):
+                painter.drawLine(QLineF(x, middle * (1 - high), x, middle * (1 - low)))
+            painter.setPen(QColor(110, 110, 110))
+            for x, value in enumerate(rms):
+                painter.drawLine(QLineF(x, middle * (1 - value), x, middle * (1 + value)))
+            painter.end()
+        super().paintEvent(event)
 
 
 class AudioWindow(QMainWindow):
@@ -21,6 +112,7 @@ class AudioWindow(QMainWindow):
 
         self.mediaPlayer = QMediaPlayer()
         self.file_info = None
+        self.index_cache = IndexCache()
 
         self.playButton = QPushButton()
         self.playButton.setEnabled(False)
@@ -30,7 +122,7 @@ class AudioWindow(QMainWindow):
         self.volumeSlider = QSlider(Qt.Vertical)
         self.volumeSlider.setRange(0, 0)
         self.volumeSlider.setValue(100)
-        self.positionSlider = QSlider(Qt.Horizontal)
+        self.positionSlider = WaveformSlider(Qt.Horizontal)
         self.positionSlider.setRange(0, 0)
         self.positionSlider.sliderMoved.connect(self.setPosition)
         self.volumeSlider.sliderMoved.connect(self.setVolume)
@@ -94,12 +186,13 @@ class AudioWindow(QMainWindow):
                                                   QDir.homePath())
         if fileName != '':
             try:
-                    self.file_info = AudioFile(fileName)
+                    self.file_info = AudioFile(fileName, self.index_cache)
 
             except ValueError:
                 self.info_action.setEnabled(False)
                 self.errorLabel.setText('Error: file is not flac')
                 self.mediaPlayer.setMedia(QMediaContent())
+                self.positionSlider.clearPyramid()
                 self.playButton.setEnabled(False)
                 self.volumeSlider.setRange(0, 0)
             else:
@@ -108,6 +201,7 @@ class AudioWindow(QMainWindow):
                 self.volumeSlider.setValue(100)
                 self.mediaPlayer.setMedia(
                     QMediaContent(QUrl.fromLocalFile(fileName)))
+                self.positionSlider.loadPyramid(self.file_info, self.index_cache)
                 self.errorLabel.setText('')
                 self.playButton.setEnabled(True)
 
@@ -0,0 +1,168 @@
+"""
+Пакетная проверка библиотеки flac без интерфейса: обход каталогов,
+разбор файлов в пуле процессов, результаты в JSONL или CSV
+"""
+import csv
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Final
+
+from decoder import verify_md5
+from flac import AudioFile, BITS_PER_SAMPLE, CHANNELS, MD5, RATE, SAMPLES_IN_FLOW
+
+PATH: Final = 'path'
+SIZE: Final = 'size'
+ERROR: Final = 'error'
+FRAMES: Final = 'frames'
+CORRUPTED_FRAMES: Final = 'corrupted frames'
+TAGS: Final = 'tags'
+# True/False - результат сверки MD5, None - не проверялся или не задан в файле
+MD5_OK: Final = 'md5 ok'
+FIELDS: Final = (PATH, SIZE, ERROR, RATE, CHANNELS, BITS_PER_SAMPLE, SAMPLES_IN_FLOW,
+                 FRAMES, CORRUPTED_FRAMES, MD5_OK)
+# сколько пачек файлов на процесс может быть в работе одновременно
+CHUNKS_PER_WORKER: Final = 4
+
+
+def find_flac_files(paths):
+    """
+    :param paths: файлы и каталоги, каталоги обходятся рекурсивно
+    :return: генератор путей к файлам .flac
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.flac'):
+                    yield os.path.join(directory, name)
+
+
+def scan_file(filename, frames=False, verify=False, md5=False):
+    """
+    Разбор одного файла. Исключения не выходят наружу, а попадают
+    в поле ERROR, чтобы один плохой файл не останавливал проверку
+    :param frames: разобрать заголовки фреймов
+    :param verify: проверить CRC-16 фреймов
+    :param md5: декодировать звук и сверить MD5 из STREAMINFO
+    :return: словарь с полями FIELDS и тегами
+    """
+    result = dict.fromkeys(FIELDS)
+    result[PATH] = filename
+    try:
+        result[SIZE] = os.path.getsize(filename)
+        audio_file = AudioFile(filename)
+        for key in (RATE, CHANNELS, BITS_PER_SAMPLE, SAMPLES_IN_FLOW):
+            result[key] = audio_file.streaminfo[key]
+        if audio_file.tags:
+            result[TAGS] = {key: sorted(value) if isinstance(value, set) else value
+                            for key, value in audio_file.tags.items()}
+        if frames or verify:
+            audio_file.parse_frames()
+            result[FRAMES] = len(audio_file.frames)
+        if verify:
+            result[CORRUPTED_FRAMES] = len(audio_file.verify_frames())
+        if md5 and int(audio_file.streaminfo[MD5], 16):
+            result[MD5_OK] = verify_md5(audio_file)
+    except Exception as e:
+        result[ERROR] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def scan_files(filenames, frames, verify, md5):
+    return [scan_file(filename, frames, verify, md5) for filename in filenames]
+
+
+def scan(filenames, workers=None, frames=False, verify=False, chunksize=16, md5=False):
+    """
+    :param workers: число процессов, 1 - разбор в текущем процессе
+    :param filenames: итератор имен, читается по мере разбора: в работе не больше
+    CHUNKS_PER_WORKER пачек по chunksize файлов на процесс, так что результаты
+    идут с начала обхода, а память не растет с размером библиотеки
+    :return: генератор результатов scan_file в порядке filenames
+    """
+    if workers == 1:
+        for filename in filenames:
+            yield scan_file(filename, frames, verify, md5)
+        return
+    filenames = iter(filenames)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        limit = CHUNKS_PER_WORKER * workers
+        pending = deque()
+        while True:
+            chunk = list(islice(filenames, chunksize))
+            if chunk:
+                pending.append(executor.submit(scan_files, chunk, frames, verify, md5))
+            if pending and (len(pending) >= limit or not chunk):
+                yield from pending.popleft().result()
+            elif not chunk:
+                return
+
+
+def write_jsonl(results, out):
+    for result in results:
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        yield result
+
+
+def write_csv(results, out):
+    writer = csv.DictWriter(out, FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result)
+        yield result
+
+
+writers: Final = {'jsonl': write_jsonl, 'csv': write_csv}
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='batch flac scanner',
+                            usage='python scanner_cli.py PATH [PATH ...] [-w N] [--frames] '
+                                  '[--verify] [--md5] [--format jsonl|csv] [-o FILE]')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='Flac files or directories to scan recursively')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--frames', help='Parse frame headers',
+                        action='store_true', required=False)
+    parser.add_argument('--verify', help='Check CRC-16 of every frame',
+                        action='store_true', required=False)
+    parser.add_argument('--md5', help='Decode audio and check MD5 from STREAMINFO',
+                        action='store_true', required=False)
+    parser.add_argument('--format', dest='format', choices=sorted(writers), default='jsonl',
+                        help='Output format (default: jsonl)')
+    parser.add_argument('-o', '--output', dest='output', metavar='FILE',
+                        help='Output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    start = time.perf_counter()
+    files = errors = size = 0
+    try:
+        results = scan(find_flac_files(args.paths), args.workers, args.frames, args.verify,
+                       md5=args.md5)
+        for result in writers[args.format](results, out):
+            files += 1
+            size += result[SIZE] or 0
+            errors += result[ERROR] is not None or result[MD5_OK] is False
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print('{} files, {} errors, {:.1f} s, {:.1f} files/s, {:.1f} MB/s'.format(
+        files, errors, elapsed, files / elapsed, size / elapsed / 1e6), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Потоковый разбор flac: данные читаются частями из любого двоичного
+файлового объекта (файл, канал, сокет, BytesIO), в памяти держится
+не больше одного фрейма и одного куска чтения
+"""
+import os
+from typing import Final
+
+from decoder import decode_frame, first_sample_of
+from flac import AudioFile, BITS_PER_SAMPLE, BLOCK_MAXSIZE, CHANNELS, \
+    FRAME_MAXSIZE, sync_regex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# самый длинный заголовок фрейма: 4 байта, 7 байт номера,
+# 2 байта размера блока, 2 байта частоты и CRC-8
+MAX_HEADER_SIZE: Final = 16
+READ_SIZE: Final = 1 << 16
+
+
+def max_frame_size(streaminfo):
+    """
+    Граница размера фрейма: FRAME_MAXSIZE из STREAMINFO, а если он
+    неизвестен (0) - размер фрейма с несжатыми подкадрами
+    """
+    if streaminfo[FRAME_MAXSIZE]:
+        return streaminfo[FRAME_MAXSIZE]
+    # разностный канал стерео на бит шире, плюс заголовки подкадров
+    subframe_bits = 8 + streaminfo[BLOCK_MAXSIZE] * (streaminfo[BITS_PER_SAMPLE] + 1)
+    return MAX_HEADER_SIZE + (streaminfo[CHANNELS] * subframe_bits + 7) // 8 + 2
+
+
+class FlacStream(AudioFile):
+    """
+    Разбор flac по мере поступления данных. Метаданные разбираются
+    при создании, фреймы отдаются генераторами iter_frames и iter_pcm
+    и попадают в self.frames с абсолютными смещениями от начала потока
+    """
+    def __init__(self, f, read_size=READ_SIZE, stats=None):
+        """
+        :param f: двоичный файловый объект, стоящий в начале данных flac
+        :param read_size: сколько байт запрашивать у f за раз
+        :param stats: см. AudioFile
+        """
+        self.f = f
+        name = getattr(f, 'name', None)
+        # у каналов и сокетов name - '<stdin>' или номер дескриптора,
+        # переоткрывать по нему нельзя: методы AudioFile, читающие файл заново,
+        # работают только для существующего пути
+        self.filename = name if isinstance(name, (str, os.PathLike)) and os.path.isfile(name) else None
+        self.cache = None
+        self.stats = stats
+        self.read_size = read_size
+        self.read_metadata(f)
+        self.max_frame_size = max_frame_size(self.streaminfo)
+        self.buffer = bytearray()
+        # смещение начала буфера от начала потока
+        self.buffer_start = self.first_frame
+        self.eof = False
+        self.fill(2)
+        self.blocking_strategy = self.buffer[1] & 1 if len(self.buffer) >= 2 else 0
+
+    def fill(self, size):
+        """
+        Дочитать данные, пока в буфере меньше size байт и поток не кончился
+        """
+        while len(self.buffer) < size and not self.eof:
+            chunk = self.f.read(max(self.read_size, size - len(self.buffer)))
+            if not chunk:
+                self.eof = True
+            else:
+                self.buffer += chunk
+
+    def discard(self, size):
+        """
+        Выбросить первые size байт буфера
+        """
+        if size:
+            del self.buffer[:size]
+            self.buffer_start += size
+
+    def iter_frames(self, decode=False):
+        """
+        Фреймы в порядке поступления. Поврежденные заголовки (а при
+        декодировании и фреймы с неверной CRC-16) пропускаются поиском
+        следующего кода синхронизации
+        :param decode: декодировать фреймы, для этого в буфере держится
+        целый фрейм, иначе только заголовок
+        :return: генератор FrameRecord из self.frames, при decode -
+        пар (FrameRecord, список каналов int32)
+        """
+        need = self.max_frame_size if decode else MAX_HEADER_SIZE
+        pos = 0
+        while True:
+            self.discard(pos)
+            self.fill(need)
+            match = sync_regex.search(self.buffer)
+            if match is None:
+                if self.eof:
+                    return
+                # последний байт может оказаться началом кода синхронизации
+                pos = max(len(self.buffer) - 1, 0)
+                continue
+            if match.start():
+                pos = match.start()
+                continue
+            try:
+                if decode:
+                    header, channels, end = decode_frame(self.buffer, 0, self.streaminfo)
+                    if header[0] != self.blocking_strategy:
+                        raise ValueError()
+                else:
+                    header = self.read_frame_header(self.buffer, 0, len(self.frames))
+                    end = header[-1]
+            except (ValueError, IndexError):
+                pos = 1
+                continue
+            _, _, block_size, sample_rate, assignment, sample_size, _ = header
+            self.frames.append(self.buffer_start, block_size, sample_rate, assignment,
+                               sample_size, first_sample_of(header, self.streaminfo))
+            pos = end
+            if decode:
+                yield self.frames[-1], channels
+            else:
+                yield self.frames[-1]
+
+    def iter_pcm(self, chunk_samples=4096):
+        """
+        Декодированные сэмплы кусками по chunk_samples на канал
+        (последний кусок может быть короче)
+        :return: генератор списков каналов int32
+        """
+        pending = None
+        for _, channels in self.iter_frames(decode=True):
+            if pending is None:
+                pending = channels
+            elif np is not None:
+                pending = [np.concatenate((old, new)) for old, new in zip(pending, channels)]
+            else:
+                pending = [old + new for old, new in zip(pending, channels)]
+            while len(pending[0]) >= chunk_samples:
+                yield [channel[:chunk_samples] for channel in pending]
+                pending = [channel[chunk_samples:] for channel in pending]
+        if pending is not None and len(pending[0]):
+            yield pending
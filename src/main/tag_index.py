@@ -0,0 +1,309 @@
+"""
+Индекс тегов библиотеки в SQLite: vendor, теги VORBIS_COMMENT, поля
+STREAMINFO и описания картинок всех файлов дерева каталогов.
+При обновлении заново читаются только файлы с изменившимися размером
+или временем изменения, и только их метаданные
+"""
+import os
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Final
+
+from flac import AudioFile, BITS_PER_SAMPLE, BLOCK_MAXSIZE, BLOCK_MINSIZE, CHANNELS, \
+    FRAME_MAXSIZE, FRAME_MINSIZE, MD5, RATE, SAMPLES_IN_FLOW
+from index_cache import default_cache_dir
+from scanner_cli import find_flac_files
+
+SCHEMA_VERSION: Final = 1
+DATABASE_NAME: Final = 'tags.sqlite'
+# файлов в одной транзакции при обновлении
+BATCH_SIZE: Final = 500
+
+# ключ STREAMINFO -> столбец таблицы files
+streaminfo_columns: Final = {BLOCK_MINSIZE: 'block_minsize', BLOCK_MAXSIZE: 'block_maxsize',
+                             FRAME_MINSIZE: 'frame_minsize', FRAME_MAXSIZE: 'frame_maxsize',
+                             RATE: 'rate', CHANNELS: 'channels',
+                             BITS_PER_SAMPLE: 'bits_per_sample', SAMPLES_IN_FLOW: 'samples',
+                             MD5: 'md5'}
+# ключ описания картинки -> столбец таблицы pictures
+picture_columns: Final = {'picture type': 'picture_type', 'mime type': 'mime_type',
+                          'description': 'description', 'width': 'width', 'height': 'height',
+                          'color depth': 'color_depth', 'number of colors': 'number_of_colors'}
+
+SCHEMA: Final = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT,
+    vendor TEXT,
+    {streaminfo}
+);
+CREATE TABLE IF NOT EXISTS tags (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_name_value ON tags(name, value);
+CREATE INDEX IF NOT EXISTS tags_file ON tags(file_id);
+CREATE TABLE IF NOT EXISTS pictures (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    {picture},
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS pictures_file ON pictures(file_id);
+'''.format(streaminfo=',\n    '.join(column + (' TEXT' if key == MD5 else ' INTEGER')
+                                     for key, column in streaminfo_columns.items()),
+           picture=',\n    '.join(column + (' TEXT' if column in ('picture_type', 'mime_type', 'description')
+                                             else ' INTEGER')
+                                  for column in picture_columns.values()))
+
+
+def read_entry(filename):
+    """
+    Чтение метаданных одного файла, изображения картинок не читаются.
+    Исключения не выходят наружу, чтобы один плохой файл не останавливал обновление
+    :return: путь, размер, время изменения, ошибка, vendor, STREAMINFO,
+    список тегов (имя, значение), список описаний картинок
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError as e:
+        return filename, 0, 0, '{}: {}'.format(type(e).__name__, e), None, {}, [], []
+    try:
+        audio_file = AudioFile(filename)
+        tags = dict(audio_file.tags or {})
+        vendor = tags.pop('vendor', None)
+        pictures = []
+        for i, picture in enumerate(audio_file.picture):
+            descriptor = {key: picture[key] for key in picture_columns}
+            descriptor['length'] = audio_file.picture_range(i)[1]
+            pictures.append(descriptor)
+        return filename, stat.st_size, stat.st_mtime_ns, None, vendor, dict(audio_file.streaminfo), \
+            [(name.upper(), value) for name, values in tags.items() for value in sorted(values)], pictures
+    except Exception as e:
+        return filename, stat.st_size, stat.st_mtime_ns, '{}: {}'.format(type(e).__name__, e), \
+            None, {}, [], []
+
+
+class TagIndex:
+    """
+    Имена тегов хранятся в верхнем регистре (в vorbis comment они
+    не зависят от регистра), значения - как в файле
+    """
+    def __init__(self, database=None):
+        """
+        :param database: путь к файлу базы, по умолчанию в каталоге кэша
+        """
+        if database is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            database = os.path.join(default_cache_dir(), DATABASE_NAME)
+        # транзакции открываются явно
+        self.connection = sqlite3.connect(database, isolation_level=None)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError('unsupported tag index version {}'.format(version))
+        self.connection.executescript(SCHEMA)
+        self.connection.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def refresh(self, paths, workers=1):
+        """
+        Обновление индекса по файлам и каталогам paths. Файлы с прежними
+        размером и временем изменения не читаются, записи исчезнувших
+        файлов под paths удаляются
+        :param workers: число процессов для чтения метаданных,
+        None - по числу процессоров, 1 - в текущем процессе
+        :return: число прочитанных, неизменившихся и удаленных файлов
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        connection = self.connection
+        connection.execute('CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)')
+        changed = []
+        unchanged = 0
+        connection.execute('BEGIN')
+        connection.execute('DELETE FROM seen')
+        for filename in find_flac_files(paths):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            connection.execute('INSERT OR IGNORE INTO seen VALUES (?)', (filename,))
+            row = connection.execute('SELECT size, mtime_ns FROM files WHERE path = ?',
+                                     (filename,)).fetchone()
+            if row == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+            else:
+                changed.append(filename)
+        connection.execute('COMMIT')
+
+        if workers == 1 or len(changed) < 2:
+            self.__store(map(read_entry, changed))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self.__store(executor.map(read_entry, changed, chunksize=64))
+
+        removed = 0
+        connection.execute('BEGIN')
+        for path in paths:
+            # все пути внутри каталога лежат между path/ и path/ + 1 по порядку строк
+            removed += connection.execute(
+                'DELETE FROM files WHERE (path = ? OR path >= ? AND path < ?) '
+                'AND path NOT IN (SELECT path FROM seen)',
+                (path, path + os.sep, path + chr(ord(os.sep) + 1))).rowcount
+        connection.execute('DELETE FROM seen')
+        connection.execute('COMMIT')
+        return len(changed), unchanged, removed
+
+    def __store(self, entries):
+        connection = self.connection
+        columns = ', '.join(streaminfo_columns.values())
+        insert_file = 'INSERT INTO files (path, size, mtime_ns, error, vendor, {}) VALUES ({})'.format(
+            columns, ', '.join('?' * (5 + len(streaminfo_columns))))
+        insert_picture = 'INSERT INTO pictures (file_id, number, {}, length) VALUES ({})'.format(
+            ', '.join(picture_columns.values()), ', '.join('?' * (3 + len(picture_columns))))
+        count = 0
+        connection.execute('BEGIN')
+        try:
+            for path, size, mtime_ns, error, vendor, streaminfo, tags, pictures in entries:
+                connection.execute('DELETE FROM files WHERE path = ?', (path,))
+                file_id = connection.execute(insert_file, (path, size, mtime_ns, error, vendor) + tuple(
+                    streaminfo.get(key) for key in streaminfo_columns)).lastrowid
+                connection.executemany('INSERT INTO tags VALUES (?, ?, ?)',
+                                       ((file_id, name, value) for name, value in tags))
+                connection.executemany(insert_picture, (
+                    (file_id, i) + tuple(picture[key] for key in picture_columns) + (picture['length'],)
+                    for i, picture in enumerate(pictures)))
+                count += 1
+                if count % BATCH_SIZE == 0:
+                    connection.execute('COMMIT')
+                    connection.execute('BEGIN')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def find(self, tags=None, **streaminfo):
+        """
+        Файлы, у которых есть все заданные теги с заданными значениями
+        :param tags: имя тега -> значение
+        :param streaminfo: условия на столбцы STREAMINFO, например rate=44100
+        :return: отсортированный список путей
+        """
+        conditions = []
+        parameters = []
+        for name, value in (tags or {}).items():
+            conditions.append('id IN (SELECT file_id FROM tags WHERE name = ? AND value = ?)')
+            parameters += [name.upper(), value]
+        for column, value in streaminfo.items():
+            if column not in streaminfo_columns.values():
+                raise ValueError('unknown streaminfo column {}'.format(column))
+            conditions.append('{} = ?'.format(column))
+            parameters.append(value)
+        query = 'SELECT path FROM files'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return [path for path, in self.connection.execute(query + ' ORDER BY path', parameters)]
+
+    def search(self, name, pattern):
+        """
+        :param pattern: шаблон LIKE (% и _), без учета регистра латиницы
+        :return: пути файлов, у которых значение тега подходит под шаблон
+        """
+        return [path for path, in self.connection.execute(
+            'SELECT path FROM files WHERE id IN '
+            '(SELECT file_id FROM tags WHERE name = ? AND value LIKE ?) ORDER BY path',
+            (name.upper(), pattern))]
+
+    def values(self, name):
+        """
+        :return: значения тега и число файлов с каждым, по алфавиту
+        """
+        return self.connection.execute(
+            'SELECT value, COUNT(DISTINCT file_id) FROM tags WHERE name = ? '
+            'GROUP BY value ORDER BY value', (name.upper(),)).fetchall()
+
+    def __file_id(self, path):
+        row = self.connection.execute('SELECT id FROM files WHERE path = ?',
+                                      (os.path.abspath(path),)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return row[0]
+
+    def tags(self, path):
+        """
+        :return: теги файла в виде AudioFile.tags
+        """
+        file_id = self.__file_id(path)
+        vendor, = self.connection.execute('SELECT vendor FROM files WHERE id = ?', (file_id,)).fetchone()
+        tags = {} if vendor is None else {'vendor': vendor}
+        for name, value in self.connection.execute('SELECT name, value FROM tags WHERE file_id = ?',
+                                                   (file_id,)):
+            tags.setdefault(name, set()).add(value)
+        return tags
+
+    def streaminfo(self, path):
+        """
+        :return: STREAMINFO файла в виде AudioFile.streaminfo
+        """
+        row = self.connection.execute('SELECT {} FROM files WHERE id = ?'.format(
+            ', '.join(streaminfo_columns.values())), (self.__file_id(path),)).fetchone()
+        return dict(zip(streaminfo_columns, row))
+
+    def pictures(self, path):
+        """
+        :return: описания картинок файла с ключами Picture и длиной изображения 'length'
+        """
+        rows = self.connection.execute(
+            'SELECT {}, length FROM pictures WHERE file_id = ? ORDER BY number'.format(
+                ', '.join(picture_columns.values())), (self.__file_id(path),))
+        return [dict(zip(tuple(picture_columns) + ('length',), row)) for row in rows]
+
+    def errors(self):
+        """
+        :return: пути файлов, которые не удалось прочитать, и ошибки
+        """
+        return self.connection.execute('SELECT path, error FROM files WHERE error IS NOT NULL '
+                                       'ORDER BY path').fetchall()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='flac tag index',
+                            usage='python tag_index.py [-d DB] (--refresh PATH ... | --find NAME=VALUE ...)')
+    parser.add_argument('-d', '--database', dest='database', help='Index file (default: in cache directory)')
+    parser.add_argument('--refresh', nargs='+', metavar='PATH', default=[],
+                        help='Index flac files and directories')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--find', nargs='+', metavar='NAME=VALUE', default=[],
+                        help='Print files having all these tags')
+    args = parser.parse_args(argv)
+    with TagIndex(args.database) as index:
+        if args.refresh:
+            print('{} read, {} unchanged, {} removed'.format(*index.refresh(args.refresh, args.workers)),
+                  file=sys.stderr)
+        if args.find:
+            for path in index.find(dict(tag.partition('=')[::2] for tag in args.find)):
+                print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
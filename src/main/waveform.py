@@ -0,0 +1,282 @@
+"""
+Обзор звука для отрисовки: пирамида уровней, на каждом уровне для
+корзин по bucket сэмплов хранятся минимум, максимум и RMS (по всем каналам,
+в долях полной шкалы). Нижний уровень считается за один проход декодирования,
+каждый следующий укрупняет предыдущий в FACTOR раз. Пирамида хранится
+в каталоге IndexCache рядом с индексом фреймов
+"""
+import os
+import struct
+import sys
+from array import array
+from math import sqrt
+from typing import Final
+
+from decoder import decode_frames
+from flac import BITS_PER_SAMPLE, CHANNELS, SAMPLES_IN_FLOW
+from index_cache import PEAKS_SUFFIX
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# сэмплов в корзине нижнего уровня
+BUCKET: Final = 512
+FACTOR: Final = 4
+# сигнатура, версия формата, корзина нижнего уровня, множитель, число уровней, число сэмплов
+PEAKS_HEADER: Final = struct.Struct('<4sBIIBQ')
+# число корзин уровня
+LEVEL_HEADER: Final = struct.Struct('<Q')
+MAGIC: Final = b'FLPK'
+VERSION: Final = 1
+
+
+class Level:
+    __slots__ = ('bucket', 'mins', 'maxs', 'rms')
+
+    def __init__(self, bucket, mins, maxs, rms):
+        self.bucket = bucket
+        self.mins = mins
+        self.maxs = maxs
+        self.rms = rms
+
+    def columns(self):
+        return self.mins, self.maxs, self.rms
+
+    def __len__(self):
+        return len(self.mins)
+
+
+class PeakPyramid:
+    def __init__(self, total_samples, levels):
+        """
+        :param levels: уровни от мелкого к крупному, колонки - array('f')
+        """
+        self.total_samples = total_samples
+        self.levels = levels
+
+    def level(self, samples_per_pixel):
+        """
+        :return: самый крупный уровень, корзина которого не больше пикселя
+        """
+        result = self.levels[0]
+        for level in self.levels:
+            if level.bucket <= samples_per_pixel:
+                result = level
+        return result
+
+    def view(self, width, start=0, stop=None):
+        """
+        Обзор диапазона сэмплов [start, stop) шириной width пикселей
+        :return: списки минимумов, максимумов и RMS по пикселям
+        """
+        if stop is None:
+            stop = self.total_samples
+        mins, maxs, rms = [], [], []
+        if width <= 0 or stop <= start:
+            return mins, maxs, rms
+        level = self.level((stop - start) / width)
+        for x in range(width):
+            first = (start + (stop - start) * x // width) // level.bucket
+            last = max(first + 1, -(-(start + (stop - start) * (x + 1) // width) // level.bucket))
+            last = min(last, len(level))
+            if first >= last:
+                mins.append(0.0)
+                maxs.append(0.0)
+                rms.append(0.0)
+                continue
+            mins.append(min(level.mins[first:last]))
+            maxs.append(max(level.maxs[first:last]))
+            rms.append(sqrt(sum(value * value for value in level.rms[first:last]) / (last - first)))
+        return mins, maxs, rms
+
+
+def to_floats(values):
+    if np is not None:
+        result = array('f')
+        result.frombytes(np.asarray(values, dtype=np.float32).tobytes())
+        return result
+    return array('f', values)
+
+
+class PeakBuilder:
+    """
+    Накопление нижнего уровня по блокам сэмплов (каналы блока - одинаковой
+    длины), хвост блока, не заполнивший корзину, переходит в следующий
+    """
+    def __init__(self, channels, bits_per_sample, bucket=BUCKET):
+        self.channels = channels
+        self.scale = float(1 << (bits_per_sample - 1))
+        self.bucket = bucket
+        self.mins = []
+        self.maxs = []
+        # суммы квадратов и число сэмплов в корзинах
+        self.squares = []
+        self.counts = []
+        if np is not None:
+            self.carry = np.zeros((channels, 0), dtype=np.float64)
+        else:
+            self.carry = [[] for _ in range(channels)]
+
+    def add(self, channels):
+        if np is not None:
+            block = np.concatenate([self.carry, np.array(channels, dtype=np.float64)], axis=1)
+            full = block.shape[1] // self.bucket * self.bucket
+            buckets = block[:, :full].reshape(self.channels, -1, self.bucket)
+            self.mins.append(buckets.min(axis=(0, 2)))
+            self.maxs.append(buckets.max(axis=(0, 2)))
+            self.squares.append(np.square(buckets).sum(axis=(0, 2)))
+            self.counts.append(np.full(buckets.shape[1], self.channels * self.bucket, dtype=np.float64))
+            self.carry = block[:, full:]
+            return
+        block = [carry + list(samples) for carry, samples in zip(self.carry, channels)]
+        full = len(block[0]) // self.bucket * self.bucket
+        for pos in range(0, full, self.bucket):
+            self.__add_bucket([samples[pos:pos + self.bucket] for samples in block])
+        self.carry = [samples[full:] for samples in block]
+
+    def __add_bucket(self, samples):
+        self.mins.append(min(min(channel) for channel in samples))
+        self.maxs.append(max(max(channel) for channel in samples))
+        self.squares.append(float(sum(value * value for channel in samples for value in channel)))
+        self.counts.append(len(samples) * len(samples[0]))
+
+    def finish(self, total_samples, factor=FACTOR):
+        """
+        :return: PeakPyramid, все уровни до единственной корзины
+        """
+        if np is not None:
+            if self.carry.shape[1]:
+                self.mins.append(self.carry.min().reshape(1))
+                self.maxs.append(self.carry.max().reshape(1))
+                self.squares.append(np.square(self.carry).sum().reshape(1))
+                self.counts.append(np.array([self.carry.size], dtype=np.float64))
+            mins, maxs, squares, counts = (np.concatenate(column) if column else np.zeros(0)
+                                           for column in (self.mins, self.maxs, self.squares, self.counts))
+        else:
+            if self.carry[0]:
+                self.__add_bucket(self.carry)
+            mins, maxs, squares, counts = self.mins, self.maxs, self.squares, self.counts
+        levels = []
+        bucket = self.bucket
+        while True:
+            levels.append(self.__level(bucket, mins, maxs, squares, counts))
+            if len(mins) <= 1:
+                break
+            if np is not None:
+                starts = np.arange(0, len(mins), factor)
+                mins = np.minimum.reduceat(mins, starts)
+                maxs = np.maximum.reduceat(maxs, starts)
+                squares = np.add.reduceat(squares, starts)
+                counts = np.add.reduceat(counts, starts)
+            else:
+                starts = range(0, len(mins), factor)
+                mins = [min(mins[i:i + factor]) for i in starts]
+                maxs = [max(maxs[i:i + factor]) for i in starts]
+                squares = [sum(squares[i:i + factor]) for i in starts]
+                counts = [sum(counts[i:i + factor]) for i in starts]
+            bucket *= factor
+        return PeakPyramid(total_samples, levels)
+
+    def __level(self, bucket, mins, maxs, squares, counts):
+        if np is not None:
+            return Level(bucket, to_floats(mins / self.scale), to_floats(maxs / self.scale),
+                         to_floats(np.sqrt(squares / np.maximum(counts, 1)) / self.scale))
+        return Level(bucket, to_floats([value / self.scale for value in mins]),
+                     to_floats([value / self.scale for value in maxs]),
+                     to_floats([sqrt(square / count) / self.scale for square, count in zip(squares, counts)]))
+
+
+def build_pyramid(audio_file, bucket=BUCKET, factor=FACTOR, use_mmap=True):
+    """
+    Пирамида за один проход декодирования файла
+    """
+    builder = PeakBuilder(audio_file.streaminfo[CHANNELS], audio_file.streaminfo[BITS_PER_SAMPLE], bucket)
+    total = 0
+    for _, channels in decode_frames(audio_file, use_mmap=use_mmap):
+        builder.add(channels)
+        total += len(channels[0])
+    return builder.finish(audio_file.streaminfo[SAMPLES_IN_FLOW] or total, factor)
+
+
+def pack_pyramid(pyramid):
+    levels = pyramid.levels
+    factor = levels[1].bucket // levels[0].bucket if len(levels) > 1 else FACTOR
+    chunks = [PEAKS_HEADER.pack(MAGIC, VERSION, levels[0].bucket, factor, len(levels), pyramid.total_samples)]
+    for level in levels:
+        chunks.append(LEVEL_HEADER.pack(len(level)))
+        for column in level.columns():
+            if sys.byteorder == 'big':
+                column = column[:]
+                column.byteswap()
+            chunks.append(column.tobytes())
+    return b''.join(chunks)
+
+
+def unpack_pyramid(data):
+    magic, version, bucket, factor, count, total_samples = PEAKS_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a peaks entry')
+    pos = PEAKS_HEADER.size
+    levels = []
+    for _ in range(count):
+        size, = LEVEL_HEADER.unpack_from(data, pos)
+        pos += LEVEL_HEADER.size
+        columns = []
+        for _ in range(3):
+            column = array('f')
+            end = pos + size * column.itemsize
+            if end > len(data):
+                raise ValueError('peaks entry is truncated')
+            column.frombytes(data[pos:end])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            pos = end
+        levels.append(Level(bucket, *columns))
+        bucket *= factor
+    if not levels:
+        raise ValueError('peaks entry is empty')
+    return PeakPyramid(total_samples, levels)
+
+
+def load_pyramid(cache, filename):
+    """
+    :param cache: index_cache.IndexCache
+    :return: сохраненная пирамида текущего состояния файла или None
+    """
+    path = cache.entry_path(filename, PEAKS_SUFFIX)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        pyramid = unpack_pyramid(data)
+    except (ValueError, struct.error):
+        cache.remove_entry(path, len(data))
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return pyramid
+
+
+def store_pyramid(cache, filename, pyramid):
+    cache.write_entry(cache.entry_path(filename, PEAKS_SUFFIX), pack_pyramid(pyramid))
+
+
+def pyramid_of(audio_file, cache=None, bucket=BUCKET, factor=FACTOR):
+    """
+    Пирамида из кэша, а если ее там нет - построенная и сохраненная
+    """
+    if cache is not None:
+        pyramid = load_pyramid(cache, audio_file.filename)
+        if pyramid is not None:
+            return pyramid
+    pyramid = build_pyramid(audio_file, bucket, factor)
+    if cache is not None:
+        store_pyramid(cache, audio_file.filename, pyramid)
+    return pyramid
@@ -0,0 +1,294 @@
+"""
+Замеры производительности разбора flac на синтезированных файлах:
+открытие (метаданные), разбор фреймов, проверка CRC-16, поиск сэмпла,
+декодирование и пиковая память. Результаты сохраняются в JSON и сравниваются с базовыми.
+
+Запуск из корня репозитория:
+    python -m src.test.benchmark --save baseline.json
+    python -m src.test.benchmark --baseline baseline.json
+"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Final
+
+if __name__ == '__main__':
+    # модули src/main импортируют друг друга по коротким именам; тесты,
+    # которые импортируют этот модуль, запускаются с PYTHONPATH=src/main
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main'))
+
+from src.main.decoder import decode  # noqa: E402
+from src.main.encoder import encode  # noqa: E402
+from src.main.flac import AudioFile, SAMPLES_IN_FLOW, crc16  # noqa: E402
+from src.test.fixtures import frame_header, metadata_block, picture_block, \
+    seektable_block, streaminfo_block, vorbis_comment_block  # noqa: E402
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FORMAT_VERSION: Final = 1
+PICTURE_SIZE: Final = 5 * 1024 * 1024
+SEEKS: Final = 200
+SCAN_SEEKS: Final = 20
+
+# параметры файлов при scale=1; variable - диапазон случайных размеров блока,
+# encoded - файл кодируется encoder (LPC и код Райса), для него замеряется декодирование
+CASES: Final = {
+    'cd_fixed': dict(rate=44100, channels=2, bits=16, block_size=4096, seconds=60),
+    'hires_fixed': dict(rate=96000, channels=2, bits=24, block_size=1152, seconds=30),
+    'surround_fixed': dict(rate=48000, channels=6, bits=16, block_size=4608, seconds=30),
+    'small_blocks': dict(rate=44100, channels=2, bits=16, block_size=192, seconds=10),
+    'mono_variable': dict(rate=22050, channels=1, bits=8, variable=(256, 8192), seconds=120,
+                          seekpoints=False),
+    'pictures': dict(rate=44100, channels=2, bits=16, block_size=4096, seconds=10,
+                     pictures=2),
+    'cd_encoded': dict(rate=44100, channels=2, bits=16, block_size=4096, seconds=10,
+                       encoded=True),
+}
+
+
+def synthesize_encoded(path, rate, channels, bits, seconds, block_size=4096, seed=0):
+    """
+    Файл, сжатый encoder: синусоиды с шумом, чтобы подкадры были LPC
+    с остатком в коде Райса, как в обычной музыке
+    """
+    generator = random.Random(seed)
+    amplitude = (1 << (bits - 1)) // 4
+    samples = []
+    for channel in range(channels):
+        step = 2 * math.pi * (220 + 110 * channel) / rate
+        samples.append([int(amplitude * math.sin(step * i)) + generator.randint(-64, 64)
+                        for i in range(int(rate * seconds))])
+    encode(path, samples, rate, bits, block_size, workers=1)
+
+
+def synthesize(path, rate, channels, bits, seconds, block_size=4096, variable=None,
+               seekpoints=True, pictures=0, picture_size=PICTURE_SIZE, seed=0):
+    """
+    Файл из фреймов VERBATIM со случайными сэмплами. Содержимое подкадров
+    не важно для разбора заголовков и CRC, поэтому байты сэмплов берутся
+    случайными целиком, без кодирования по одному сэмплу
+    :param variable: (мин, макс) размера блока - поток с переменным размером блока
+    :param seekpoints: класть SEEKTABLE с точкой на каждые 10 секунд
+    """
+    generator = random.Random(seed)
+    total = int(rate * seconds)
+    sizes = []
+    while sum(sizes) < total:
+        size = generator.randint(*variable) if variable else block_size
+        sizes.append(min(size, total - sum(sizes)))
+    frames = []
+    starts = []
+    sample = 0
+    for number, size in enumerate(sizes):
+        starts.append(sample)
+        frame = frame_header(sample if variable else number, size, rate, channels, bits,
+                             variable is not None)
+        for _ in range(channels):
+            frame += b'\x02' + generator.randbytes(size * bits // 8)
+        frames.append(frame + crc16.get_crc(frame).to_bytes(2, byteorder='big'))
+        sample += size
+
+    block_max = max(sizes) if variable else block_size
+    blocks = [(0, streaminfo_block(min(sizes), block_max, min(map(len, frames)),
+                                   max(map(len, frames)), rate, channels, bits, total))]
+    if seekpoints:
+        points = []
+        offset = 0
+        for start, size, frame in zip(starts, sizes, frames):
+            if start // (rate * 10) >= len(points):
+                points.append((start, offset, size))
+            offset += len(frame)
+        blocks.append((3, seektable_block(points)))
+    blocks.append((4, vorbis_comment_block([('TITLE', 'benchmark'), ('ARTIST', 'fixtures')])))
+    for _ in range(pictures):
+        blocks.append((6, picture_block(generator.randbytes(picture_size))))
+    with open(path, 'wb') as f:
+        f.write(b'fLaC')
+        for i, (type_of_block, body) in enumerate(blocks):
+            f.write(metadata_block(type_of_block, body, i == len(blocks) - 1))
+        for frame in frames:
+            f.write(frame)
+
+
+def best_time(function, repeat):
+    """
+    :return: наименьшее время из repeat запусков, в секундах
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(function):
+    """
+    :return: пик выделенной питоном памяти во время вызова, в КиБ
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def measure(path, repeat, workers, encoded=False):
+    size = os.path.getsize(path)
+    audio_file = AudioFile(path)
+    # скорость разбора и проверки считается по байтам фреймов, без метаданных
+    audio_size = size - audio_file.first_frame
+    result = {'size_bytes': size, 'audio_bytes': audio_size}
+    result['open_s'] = best_time(lambda: AudioFile(path), repeat)
+    result['open_peak_kb'] = peak_memory(lambda: AudioFile(path))
+    result['parse_frames_s'] = best_time(audio_file.parse_frames, repeat)
+    result['parse_frames_mb_s'] = audio_size / result['parse_frames_s'] / 1e6
+    result['frames'] = len(audio_file.frames)
+    result['parse_frames_peak_kb'] = peak_memory(lambda: AudioFile(path).parse_frames())
+    if workers > 1:
+        result['parse_frames_workers_s'] = best_time(
+            lambda: AudioFile(path).parse_frames(workers=workers), repeat)
+    result['verify_frames_s'] = best_time(audio_file.verify_frames, repeat)
+    result['verify_frames_mb_s'] = audio_size / result['verify_frames_s'] / 1e6
+    if encoded:
+        result['decode_s'] = best_time(lambda: decode(audio_file), repeat)
+        result['decode_mb_s'] = audio_size / result['decode_s'] / 1e6
+
+    total = audio_file.streaminfo[SAMPLES_IN_FLOW]
+    generator = random.Random(1)
+    samples = [generator.randrange(total) for _ in range(SEEKS)]
+    start = time.perf_counter()
+    for sample in samples:
+        audio_file.seek(sample)
+    result['seek_index_us'] = (time.perf_counter() - start) / SEEKS * 1e6
+    # без индекса: по SEEKTABLE (если есть) и просмотр фреймов вперед
+    unindexed = AudioFile(path)
+    start = time.perf_counter()
+    for sample in samples[:SCAN_SEEKS]:
+        unindexed.seek(sample)
+    result['seek_scan_ms'] = (time.perf_counter() - start) / SCAN_SEEKS * 1e3
+    return result
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(directory, scale=1.0, repeat=3, workers=0, cases=None):
+    """
+    :param directory: каталог синтезированных файлов; уже существующие
+    файлы с тем же именем используются повторно
+    :return: словарь результатов для сохранения в JSON
+    """
+    results = {'version': FORMAT_VERSION,
+               'commit': commit(),
+               'python': platform.python_version(),
+               'numpy': numpy is not None,
+               'scale': scale,
+               'repeat': repeat,
+               'cases': {}}
+    for name, options in CASES.items():
+        if cases and name not in cases:
+            continue
+        options = dict(options)
+        options['seconds'] *= scale
+        path = os.path.join(directory, '{}-{}.flac'.format(name, scale))
+        encoded = options.pop('encoded', False)
+        if not os.path.exists(path):
+            if encoded:
+                synthesize_encoded(path, **options)
+            else:
+                synthesize(path, picture_size=max(1024, int(PICTURE_SIZE * scale)), **options)
+        results['cases'][name] = measure(path, repeat, workers, encoded)
+    return results
+
+
+def lower_is_better(metric):
+    return metric.endswith(('_s', '_us', '_ms', '_kb')) and not metric.endswith('_mb_s')
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: строки сравнения и список ухудшений (случай, метрика, отношение)
+    """
+    lines = []
+    regressions = []
+    for name, metrics in results['cases'].items():
+        old = baseline.get('cases', {}).get(name)
+        if old is None:
+            continue
+        for metric, value in metrics.items():
+            if metric not in old or not old[metric]:
+                continue
+            ratio = value / old[metric]
+            worse = ratio > 1 + tolerance if lower_is_better(metric) else ratio < 1 - tolerance
+            if lower_is_better(metric) or metric.endswith('_mb_s'):
+                lines.append('{:16} {:24} {:12.4g} {:12.4g} {:7.2f}x{}'.format(
+                    name, metric, old[metric], value, ratio, ' !' if worse else ''))
+            if worse:
+                regressions.append((name, metric, ratio))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='flac parser benchmarks')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier for the duration of synthesized files')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per timing, the best one is kept')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Also time parse_frames(workers=N)')
+    parser.add_argument('--case', dest='cases', action='append', choices=sorted(CASES),
+                        help='Run only this case (can be repeated)')
+    parser.add_argument('--fixtures', metavar='DIR',
+                        help='Keep synthesized files in DIR between runs')
+    parser.add_argument('--save', metavar='FILE', help='Write results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with saved results')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative change reported as a regression (default 0.2)')
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        os.makedirs(args.fixtures, exist_ok=True)
+        results = run(args.fixtures, args.scale, args.repeat, args.workers, args.cases)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(directory, args.scale, args.repeat, args.workers, args.cases)
+
+    for name, metrics in results['cases'].items():
+        print(name)
+        for metric, value in metrics.items():
+            print('    {:24} {:.6g}'.format(metric, value))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print('\n{:16} {:24} {:>12} {:>12} {:>8}'.format('case', 'metric', 'baseline', 'current', 'ratio'))
+        print('\n'.join(lines))
+        if regressions:
+            print('\n{} regressions over {:.0%}'.format(len(regressions), args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
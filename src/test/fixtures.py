@@ -0,0 +1,365 @@
+"""
+Синтез небольших файлов flac для тестов.
+Фреймы кодируются подкадрами VERBATIM, поэтому сэмплы в файле
+совпадают с исходными и их можно сравнивать после декодирования.
+"""
+import hashlib
+import random
+
+block_size_codes = {192: 1, 576: 2, 1152: 3, 2304: 4, 4608: 5,
+                    256: 8, 512: 9, 1024: 10, 2048: 11, 4096: 12,
+                    8192: 13, 16384: 14, 32768: 15}
+sample_rate_codes = {88200: 1, 176400: 2, 192000: 3, 8000: 4, 16000: 5,
+                     22050: 6, 24000: 7, 32000: 8, 44100: 9, 48000: 10,
+                     96000: 11}
+sample_size_codes = {8: 1, 12: 2, 16: 4, 20: 5, 24: 6}
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        self.value = (self.value << bits) | (value & ((1 << bits) - 1))
+        self.bits += bits
+
+    def to_bytes(self):
+        self.write(0, -self.bits % 8)
+        return self.value.to_bytes(self.bits // 8, byteorder='big')
+
+
+def crc8(data):
+    crc = 0
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def crc16(data):
+    crc = 0
+    for b in data:
+        crc ^= b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+
+def utf8_number(n):
+    if n < 0x80:
+        return bytes([n])
+    length = 2
+    while n >= 1 << (7 - length + 6 * (length - 1)):
+        length += 1
+    result = [(0xFF << (8 - length)) & 0xFF | (n >> 6 * (length - 1))]
+    for i in range(length - 2, -1, -1):
+        result.append(0x80 | (n >> 6 * i) & 0x3F)
+    return bytes(result)
+
+
+def metadata_block(type_of_block, body, is_last=False):
+    return bytes([(0x80 if is_last else 0) | type_of_block]) + \
+        len(body).to_bytes(3, byteorder='big') + body
+
+
+def streaminfo_block(block_min, block_max, frame_min, frame_max, rate,
+                     channels, bits_per_sample, total_samples, md5=bytes(16)):
+    data = (rate << 44) | ((channels - 1) << 41) | \
+           ((bits_per_sample - 1) << 36) | total_samples
+    return block_min.to_bytes(2, byteorder='big') + \
+        block_max.to_bytes(2, byteorder='big') + \
+        frame_min.to_bytes(3, byteorder='big') + \
+        frame_max.to_bytes(3, byteorder='big') + \
+        data.to_bytes(8, byteorder='big') + md5
+
+
+def vorbis_comment_block(tags, vendor='fixtures'):
+    vendor = vendor.encode()
+    body = len(vendor).to_bytes(4, byteorder='little') + vendor
+    body += len(tags).to_bytes(4, byteorder='little')
+    for name, value in tags:
+        tag = '{0}={1}'.format(name, value).encode()
+        body += len(tag).to_bytes(4, byteorder='little') + tag
+    return body
+
+
+def picture_block(pic, pic_type=3, mime='image/png', description='cover',
+                  width=1, height=1, depth=24, colors=0):
+    mime = mime.encode()
+    description = description.encode()
+    return pic_type.to_bytes(4, byteorder='big') + \
+        len(mime).to_bytes(4, byteorder='big') + mime + \
+        len(description).to_bytes(4, byteorder='big') + description + \
+        width.to_bytes(4, byteorder='big') + \
+        height.to_bytes(4, byteorder='big') + \
+        depth.to_bytes(4, byteorder='big') + \
+        colors.to_bytes(4, byteorder='big') + \
+        len(pic).to_bytes(4, byteorder='big') + pic
+
+
+def seektable_block(points):
+    body = b''
+    for sample, offset, samples in points:
+        body += sample.to_bytes(8, byteorder='big') + \
+            offset.to_bytes(8, byteorder='big') + \
+            samples.to_bytes(2, byteorder='big')
+    return body
+
+
+def cuesheet_block(tracks, catalog='', lead_in=88200, is_cd=True):
+    body = catalog.encode().ljust(128, b'\0')
+    body += lead_in.to_bytes(8, byteorder='big')
+    body += bytes([0x80 if is_cd else 0]) + bytes(258)
+    body += bytes([len(tracks)])
+    for offset, number, isrc, is_audio, pre_emphasis, indexes in tracks:
+        body += offset.to_bytes(8, byteorder='big') + bytes([number])
+        body += isrc.encode().ljust(12, b'\0')
+        body += bytes([(0 if is_audio else 0x80) | (0x40 if pre_emphasis else 0)])
+        body += bytes(13) + bytes([len(indexes)])
+        for index_offset, index_number in indexes:
+            body += index_offset.to_bytes(8, byteorder='big') + \
+                bytes([index_number]) + bytes(3)
+    return body
+
+
+def frame_header(number, block_size, rate, channels, bits_per_sample,
+                 variable, assignment=None):
+    extra = b''
+    if block_size in block_size_codes:
+        bs_code = block_size_codes[block_size]
+    elif block_size <= 256:
+        bs_code = 6
+        extra += bytes([block_size - 1])
+    else:
+        bs_code = 7
+        extra += (block_size - 1).to_bytes(2, byteorder='big')
+    if rate in sample_rate_codes:
+        rate_code = sample_rate_codes[rate]
+    elif rate % 1000 == 0 and rate // 1000 < 256:
+        rate_code = 12
+        extra += bytes([rate // 1000])
+    elif rate < 65536:
+        rate_code = 13
+        extra += rate.to_bytes(2, byteorder='big')
+    elif rate % 10 == 0 and rate // 10 < 65536:
+        rate_code = 14
+        extra += (rate // 10).to_bytes(2, byteorder='big')
+    else:
+        rate_code = 0
+    size_code = sample_size_codes.get(bits_per_sample, 0)
+    header = bytes([0xFF, 0xF8 | (1 if variable else 0),
+                    bs_code << 4 | rate_code,
+                    (channels - 1 if assignment is None else assignment) << 4
+                    | size_code << 1])
+    header += utf8_number(number) + extra
+    return header + bytes([crc8(header)])
+
+
+def verbatim_frame(number, channel_samples, rate, bits_per_sample, variable):
+    block_size = len(channel_samples[0])
+    frame = frame_header(number, block_size, rate, len(channel_samples),
+                         bits_per_sample, variable)
+    for samples in channel_samples:
+        if bits_per_sample % 8 == 0:
+            width = bits_per_sample // 8
+            frame += b'\x02' + b''.join(s.to_bytes(width, byteorder='big',
+                                                   signed=True)
+                                        for s in samples)
+        else:
+            writer = BitWriter()
+            writer.write(0x02, 8)
+            for s in samples:
+                writer.write(s, bits_per_sample)
+            frame += writer.to_bytes()
+    return frame + crc16(frame).to_bytes(2, byteorder='big')
+
+
+def write_residual(writer, residual, block_size, order, partition_order,
+                   escape):
+    writer.write(0, 2)
+    writer.write(partition_order, 4)
+    pos = 0
+    for partition in range(1 << partition_order):
+        count = (block_size >> partition_order) - (order if partition == 0 else 0)
+        values = residual[pos:pos + count]
+        pos += count
+        if escape:
+            bits = max([abs(v).bit_length() + 1 for v in values] + [0])
+            writer.write(15, 4)
+            writer.write(bits, 5)
+            for v in values:
+                writer.write(v, bits)
+            continue
+        folded = [2 * v if v >= 0 else -2 * v - 1 for v in values]
+        mean = sum(folded) // max(1, len(folded))
+        parameter = min(14, max(0, mean.bit_length() - 1))
+        writer.write(parameter, 4)
+        for u in folded:
+            writer.write(1, (u >> parameter) + 1)
+            writer.write(u, parameter)
+
+
+def predict(samples, coefficients, shift):
+    order = len(coefficients)
+    return [samples[i] - (sum(c * samples[i - 1 - j] for j, c in enumerate(coefficients)) >> shift)
+            for i in range(order, len(samples))]
+
+
+def write_subframe(writer, samples, bits_per_sample, kind, order, wasted,
+                   partition_order, escape):
+    types = {'constant': 0, 'verbatim': 1, 'fixed': 8 + order, 'lpc': 32 + order - 1}
+    writer.write(types[kind] << 1 | (1 if wasted else 0), 8)
+    if wasted:
+        writer.write(1, wasted)
+        samples = [s >> wasted for s in samples]
+        bits_per_sample -= wasted
+    if kind == 'constant':
+        writer.write(samples[0], bits_per_sample)
+        return
+    if kind == 'verbatim':
+        for s in samples:
+            writer.write(s, bits_per_sample)
+        return
+    for s in samples[:order]:
+        writer.write(s, bits_per_sample)
+    if kind == 'fixed':
+        residual = predict(samples, [(1,), (2, -1), (3, -3, 1), (4, -6, 4, -1)][order - 1]
+                           if order else (), 0)
+    else:
+        coefficients = [(-1) ** j * (900 >> j) for j in range(order)]
+        writer.write(11, 4)
+        writer.write(9, 5)
+        for c in coefficients:
+            writer.write(c, 12)
+        residual = predict(samples, coefficients, 9)
+    write_residual(writer, residual, len(samples), order, partition_order, escape)
+
+
+def encoded_frame(number, channel_samples, rate, bits_per_sample, variable,
+                  kind, order=2, stereo=None, wasted=0, partition_order=0,
+                  escape=False):
+    """
+    Фрейм с подкадрами заданного типа и (для стерео) способом
+    декорреляции каналов: 'left_side', 'right_side', 'mid_side'
+    """
+    assignments = {'left_side': 8, 'right_side': 9, 'mid_side': 10}
+    channels = channel_samples
+    sizes = [bits_per_sample] * len(channels)
+    if stereo is not None:
+        left, right = channel_samples
+        side = [a - b for a, b in zip(left, right)]
+        if stereo == 'left_side':
+            channels, sizes = [left, side], [bits_per_sample, bits_per_sample + 1]
+        elif stereo == 'right_side':
+            channels, sizes = [side, right], [bits_per_sample + 1, bits_per_sample]
+        else:
+            mid = [(a + b) >> 1 for a, b in zip(left, right)]
+            channels, sizes = [mid, side], [bits_per_sample, bits_per_sample + 1]
+    block_size = len(channel_samples[0])
+    frame = frame_header(number, block_size, rate, len(channels),
+                         bits_per_sample, variable, assignments.get(stereo))
+    writer = BitWriter()
+    for samples, size in zip(channels, sizes):
+        write_subframe(writer, samples, size, kind, order, wasted,
+                       partition_order, escape)
+    frame += writer.to_bytes()
+    return frame + crc16(frame).to_bytes(2, byteorder='big')
+
+
+def make_samples(channels, total_samples, bits_per_sample, seed=0):
+    rnd = random.Random(seed)
+    limit = 1 << (bits_per_sample - 1)
+    return [[rnd.randrange(-limit, limit) for _ in range(total_samples)]
+            for _ in range(channels)]
+
+
+def md5_of(samples, bits_per_sample):
+    width = (bits_per_sample + 7) // 8
+    md5 = hashlib.md5()
+    for i in range(len(samples[0])):
+        md5.update(b''.join(channel[i].to_bytes(width, byteorder='little',
+                                                signed=True)
+                            for channel in samples))
+    return md5.digest()
+
+
+def make_flac(path=None, rate=44100, channels=2, bits_per_sample=16,
+              block_size=4096, total_samples=20000, block_sizes=None,
+              tags=None, pictures=(), seekpoints=0, placeholders=0,
+              padding=0, cuesheet=None, seed=0, subframe='verbatim',
+              **frame_options):
+    """
+    Собирает файл flac.
+    :param block_sizes: список размеров блоков, если задан - поток
+    с переменным размером блока
+    :param seekpoints: сколько точек SEEKTABLE положить (по одной на фрейм
+    с равным шагом)
+    :param subframe: тип подкадров, для всех кроме 'verbatim'
+    frame_options передаются в encoded_frame
+    :return: байты файла, исходные сэмплы по каналам
+    """
+    variable = block_sizes is not None
+    if not variable:
+        block_sizes = [block_size] * (total_samples // block_size)
+        if total_samples % block_size:
+            block_sizes.append(total_samples % block_size)
+    total_samples = sum(block_sizes)
+    wasted = frame_options.get('wasted', 0)
+    samples = make_samples(channels, total_samples, bits_per_sample - wasted, seed)
+    if wasted:
+        samples = [[s << wasted for s in channel] for channel in samples]
+    if subframe == 'constant':
+        samples = [[channel[0]] * total_samples for channel in samples]
+
+    frames = []
+    starts = []
+    sample = 0
+    for number, size in enumerate(block_sizes):
+        starts.append(sample)
+        channel_samples = [channel[sample:sample + size] for channel in samples]
+        if subframe == 'verbatim':
+            frames.append(verbatim_frame(sample if variable else number,
+                                         channel_samples, rate,
+                                         bits_per_sample, variable))
+        else:
+            frames.append(encoded_frame(sample if variable else number,
+                                        channel_samples, rate,
+                                        bits_per_sample, variable, subframe,
+                                        **frame_options))
+        sample += size
+
+    blocks = [(0, streaminfo_block(
+        min(block_sizes) if variable else block_size,
+        max(block_sizes) if variable else block_size,
+        min(len(f) for f in frames), max(len(f) for f in frames),
+        rate, channels, bits_per_sample, total_samples,
+        md5_of(samples, bits_per_sample)))]
+    if seekpoints or placeholders:
+        points = []
+        step = max(1, len(frames) // max(1, seekpoints))
+        offset = 0
+        for i, frame in enumerate(frames):
+            if i % step == 0 and len(points) < seekpoints:
+                points.append((starts[i], offset, block_sizes[i]))
+            offset += len(frame)
+        points += [(0xFFFFFFFFFFFFFFFF, 0, 0)] * placeholders
+        blocks.append((3, seektable_block(points)))
+    if tags is not None:
+        blocks.append((4, vorbis_comment_block(tags)))
+    for pic in pictures:
+        blocks.append((6, picture_block(pic)))
+    if cuesheet is not None:
+        blocks.append((5, cuesheet_block(cuesheet)))
+    if padding:
+        blocks.append((1, bytes(padding)))
+
+    data = b'fLaC'
+    for i, (type_of_block, body) in enumerate(blocks):
+        data += metadata_block(type_of_block, body, i == len(blocks) - 1)
+    data += b''.join(frames)
+    if path is not None:
+        with open(path, 'wb') as f:
+            f.write(data)
+    return data, samples
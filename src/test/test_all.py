@@ -19,7 +19,7 @@ class TestFlacParser(unittest.TestCase):
         self.assertIsNotNone(self.audio_file)
 
     def test_assert_parsing_is_correct(self):
-        self.assertEqual(len(self.audio_file.streaminfo), 8)
+        self.assertEqual(len(self.audio_file.streaminfo), 9)
 
     def test_assert_frames_count(self):
         self.audio_file.parse_frames()
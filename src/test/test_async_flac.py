@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from src.main.async_flac import AsyncAudioFile, open_many
+from src.main.flac import AudioFile, SAMPLES_IN_FLOW
+from src.test.fixtures import make_flac
+
+
+class TestAsyncAudioFile(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'async.flac')
+        make_flac(self.filename, block_size=1024, total_samples=9000,
+                  tags=[('TITLE', 't')], pictures=[b'cover'])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    async def test_open_and_frames(self):
+        audio_file = await AsyncAudioFile.open(self.filename)
+        self.assertEqual(audio_file.streaminfo[SAMPLES_IN_FLOW], 9000)
+        self.assertEqual(audio_file.tags['TITLE'], {'t'})
+        self.assertEqual(await audio_file.aread_picture(0), b'cover')
+        records = [record async for record in audio_file.aiter_frames(step=2)]
+        expected = AudioFile(self.filename)
+        expected.parse_frames()
+        self.assertEqual(len(records), 9)
+        self.assertEqual(audio_file.frames.columns(), expected.frames.columns())
+        self.assertEqual(await audio_file.averify_frames(), [])
+        self.assertEqual(await audio_file.aseek(5000), expected.seek(5000))
+        self.assertTrue(await audio_file.averify_md5())
+
+    async def test_early_break(self):
+        audio_file = await AsyncAudioFile.open(self.filename)
+        async for _ in audio_file.aiter_frames(step=3):
+            break
+        await audio_file.aparse_frames()
+        self.assertEqual(len(audio_file.frames), 9)
+
+    async def test_open_many_with_limit(self):
+        bad = os.path.join(self.dir.name, 'bad.flac')
+        with open(bad, 'wb') as f:
+            f.write(b'not flac')
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+        read_metadata = AsyncAudioFile.read_metadata
+
+        def slow_read_metadata(audio_file, *args):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+            return read_metadata(audio_file, *args)
+
+        AsyncAudioFile.read_metadata = slow_read_metadata
+        try:
+            results = await open_many([self.filename] * 20 + [bad], limit=3)
+        finally:
+            del AsyncAudioFile.read_metadata
+        self.assertEqual(peak, 3)
+        self.assertTrue(all(isinstance(result, AsyncAudioFile) for result in results[:20]))
+        self.assertIsInstance(results[20], ValueError)
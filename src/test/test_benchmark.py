@@ -0,0 +1,40 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from src.test.benchmark import CASES, compare, main
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_smoke(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(main(['--scale', '0.01', '--repeat', '1', '--fixtures', directory,
+                                       '--save', baseline]), 0)
+            with open(baseline) as f:
+                results = json.load(f)
+            self.assertEqual(set(results['cases']), set(CASES))
+            cd = results['cases']['cd_fixed']
+            self.assertEqual(cd['frames'], 7)
+            for metric in ('open_s', 'parse_frames_s', 'verify_frames_s', 'seek_index_us',
+                           'seek_scan_ms', 'parse_frames_peak_kb'):
+                self.assertGreater(cd[metric], 0)
+            self.assertGreater(results['cases']['cd_encoded']['decode_mb_s'], 0)
+            # изображения не читаются при открытии файла
+            self.assertLess(results['cases']['pictures']['open_peak_kb'], 100)
+
+    def test_compare(self):
+        baseline = {'cases': {'a': {'parse_frames_s': 1.0, 'parse_frames_mb_s': 100.0,
+                                    'frames': 10}}}
+        results = {'cases': {'a': {'parse_frames_s': 1.5, 'parse_frames_mb_s': 70.0,
+                                   'frames': 10}}}
+        lines, regressions = compare(results, baseline, 0.2)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual([(name, metric) for name, metric, _ in regressions],
+                         [('a', 'parse_frames_s'), ('a', 'parse_frames_mb_s')])
+        _, regressions = compare(baseline, baseline, 0.2)
+        self.assertEqual(regressions, [])
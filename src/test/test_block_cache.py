@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from src.main import block_cache
+from src.main.block_cache import BlockCache
+from src.main.flac import AudioFile
+from src.test.fixtures import make_flac
+
+
+class TestBlockCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'cache.flac')
+        _, self.samples = make_flac(self.filename, block_size=1024, total_samples=9000)
+        self.audio_file = AudioFile(self.filename)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def frame_samples(self, i):
+        return [channel[i * 1024:(i + 1) * 1024] for channel in self.samples]
+
+    def test_hits_and_misses(self):
+        cache = BlockCache(read_ahead=0)
+        channels = cache.get(self.audio_file, 3)
+        self.assertEqual([list(channel) for channel in channels], self.frame_samples(3))
+        self.assertIs(cache.get(self.audio_file, 3), channels)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        first_sample, channels = cache.get_sample(self.audio_file, 8999)
+        self.assertEqual(first_sample, 8192)
+        self.assertEqual([list(channel) for channel in channels],
+                         [channel[8192:] for channel in self.samples])
+        with self.assertRaises(ValueError):
+            cache.get_sample(self.audio_file, 9000)
+
+    def test_lru_eviction(self):
+        # два канала по 1024 сэмпла int32 - 8 КиБ на фрейм
+        cache = BlockCache(max_bytes=3 * 8192, read_ahead=0)
+        for i in (0, 1, 2):
+            cache.get(self.audio_file, i)
+        cache.get(self.audio_file, 0)
+        cache.get(self.audio_file, 3)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.size, 3 * 8192)
+        self.assertNotIn((self.filename, 1), cache)
+        self.assertIn((self.filename, 0), cache)
+
+    def test_read_ahead(self):
+        cache = BlockCache(read_ahead=4)
+        try:
+            cache.get(self.audio_file, 2)
+            cache.wait()
+            for i in range(3, 7):
+                self.assertIn((self.filename, i), cache)
+            self.assertEqual(cache.prefetched, 4)
+            channels = cache.get(self.audio_file, 6)
+            self.assertEqual([list(channel) for channel in channels], self.frame_samples(6))
+            self.assertEqual(cache.hits, 1)
+            cache.discard(self.filename)
+            self.assertEqual((len(cache), cache.size), (0, 0))
+        finally:
+            cache.close()
+        self.assertIsNone(cache.thread)
+
+    def test_discard_during_decode(self):
+        cache = BlockCache(read_ahead=0)
+        decode_frame = block_cache.decode_frame
+
+        def decode_and_discard(*args):
+            result = decode_frame(*args)
+            cache.discard(self.filename)
+            return result
+
+        block_cache.decode_frame = decode_and_discard
+        try:
+            channels = cache.get(self.audio_file, 1)
+        finally:
+            block_cache.decode_frame = decode_frame
+        self.assertEqual([list(channel) for channel in channels], self.frame_samples(1))
+        self.assertNotIn((self.filename, 1), cache)
+        self.assertEqual(cache.size, 0)
+
+    def test_two_files_do_not_cancel_each_other(self):
+        other = os.path.join(self.dir.name, 'other.flac')
+        make_flac(other, block_size=1024, total_samples=9000, seed=1)
+        other_file = AudioFile(other)
+        cache = BlockCache(read_ahead=3)
+        decode_frame = block_cache.decode_frame
+        interleaved = []
+
+        def decode_with_other_caller(*args):
+            # пока декодируется фрейм одного файла, другой вызывающий читает свой файл
+            if not interleaved:
+                interleaved.append(other)
+                cache.get(other_file, 0)
+            return decode_frame(*args)
+
+        block_cache.decode_frame = decode_with_other_caller
+        try:
+            cache.get(self.audio_file, 1)
+        finally:
+            block_cache.decode_frame = decode_frame
+        try:
+            cache.wait()
+            cache.get(other_file, 4)
+            cache.wait()
+            for i in range(1, 5):
+                self.assertIn((self.filename, i), cache)
+            for i in range(0, 8):
+                self.assertIn((other, i), cache)
+        finally:
+            cache.close()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from src.main.CRC8 import CRC8
+from src.main.CRC16 import CRC16
+from src.main.flac import AudioFile, OFFSET
+from src.test.fixtures import crc8, crc16, make_flac
+
+
+class TestCRC(unittest.TestCase):
+
+    def test_crc8(self):
+        crc = CRC8()
+        for length in (0, 1, 7, 31, 32, 33, 1000, 5001, 300000):
+            data = os.urandom(length)
+            self.assertEqual(crc.get_crc(data), crc8(data))
+            self.assertEqual(crc.get_crc(memoryview(data)[1:]), crc8(data[1:]))
+            self.assertEqual(crc.get_crc(data[length // 3:],
+                                         crc.get_crc(memoryview(data)[:length // 3])),
+                             crc8(data))
+
+    def test_crc16(self):
+        crc = CRC16()
+        for length in (0, 1, 7, 31, 32, 33, 1000, 5001, 300000):
+            data = os.urandom(length)
+            self.assertEqual(crc.get_crc(data), crc16(data))
+            self.assertEqual(crc.get_crc(data[length // 3:],
+                                         crc.get_crc(memoryview(data)[:length // 3])),
+                             crc16(data))
+
+    def test_verify_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.flac')
+            make_flac(filename, block_size=1024, total_samples=5000)
+            audio_file = AudioFile(filename)
+            self.assertEqual(audio_file.verify_frames(), [])
+            with open(filename, 'r+b') as f:
+                f.seek(audio_file.frames[2][OFFSET] + 100)
+                byte = f.read(1)[0]
+                f.seek(-1, 1)
+                f.write(bytes([byte ^ 0x10]))
+            self.assertEqual(AudioFile(filename).verify_frames(), [2])
+            for workers in (2, 3, 5):
+                self.assertEqual(AudioFile(filename).verify_frames(workers=workers), [2])
@@ -0,0 +1,144 @@
+import os
+import random
+import tempfile
+import unittest
+import hashlib
+from src.main import decoder
+from src.main.decoder import BitReader, decode, decode_frames, pcm_bytes, verify_md5
+from src.main.flac import AudioFile, MD5, OFFSET
+from src.test.fixtures import BitWriter, make_flac, md5_of
+
+
+class TestDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def check(self, name, **options):
+        filename = os.path.join(self.dir.name, name + '.flac')
+        _, samples = make_flac(filename, **options)
+        decoded = decode(AudioFile(filename))
+        self.assertEqual([list(channel) for channel in decoded], samples)
+
+    def test_verbatim(self):
+        self.check('verbatim', channels=3, bits_per_sample=24, block_size=1000,
+                   total_samples=2500)
+        self.check('verbatim_12', channels=1, bits_per_sample=12,
+                   block_sizes=[100, 57, 300])
+
+    def test_constant(self):
+        self.check('constant', subframe='constant', block_size=512,
+                   total_samples=1500)
+
+    def test_fixed(self):
+        for order in range(0, 5):
+            self.check('fixed{}'.format(order), subframe='fixed', order=order,
+                       block_size=576, total_samples=1300, partition_order=2)
+
+    def test_lpc(self):
+        for order in (1, 3, 8):
+            self.check('lpc{}'.format(order), subframe='lpc', order=order,
+                       block_size=1152, total_samples=3000, partition_order=1)
+
+    def test_escape_and_wasted_bits(self):
+        self.check('escape', subframe='fixed', order=1, block_size=256,
+                   total_samples=600, escape=True, partition_order=3)
+        self.check('wasted', subframe='lpc', order=2, block_size=256,
+                   total_samples=600, wasted=3)
+
+    def test_stereo(self):
+        for stereo in ('left_side', 'right_side', 'mid_side'):
+            self.check(stereo, subframe='fixed', order=2, stereo=stereo,
+                       block_size=1024, total_samples=2100)
+
+    def test_corrupted_frame_is_skipped(self):
+        filename = os.path.join(self.dir.name, 'corrupted.flac')
+        make_flac(filename, subframe='fixed', block_size=1024, total_samples=5000)
+        audio_file = AudioFile(filename)
+        audio_file.parse_frames()
+        with open(filename, 'r+b') as f:
+            f.seek(audio_file.frames[1][OFFSET] + 50)
+            f.write(b'\0\0\0\0')
+        first_samples = [first for first, _ in decode_frames(AudioFile(filename))]
+        self.assertEqual(first_samples, [0, 2048, 3072, 4096])
+
+    def test_pcm_bytes(self):
+        for bits_per_sample in (8, 12, 16, 24, 32):
+            channels = [[-(1 << bits_per_sample - 1), 1, -1], [(1 << bits_per_sample - 1) - 1, 0, 7]]
+            self.assertEqual(hashlib.md5(pcm_bytes(channels, bits_per_sample)).digest(),
+                             md5_of(channels, bits_per_sample))
+
+    def test_verify_md5(self):
+        filename = os.path.join(self.dir.name, 'md5.flac')
+        make_flac(filename, bits_per_sample=24, block_size=256, total_samples=20000)
+        audio_file = AudioFile(filename)
+        self.assertNotEqual(int(audio_file.streaminfo[MD5], 16), 0)
+        reports = []
+        self.assertTrue(verify_md5(audio_file, lambda *report: reports.append(report)))
+        # 79 фреймов по FRAMES_PER_CHUNK
+        self.assertEqual(len(reports), -(-79 // decoder.FRAMES_PER_CHUNK))
+        self.assertEqual(reports[-1][:2], (20000, 20000))
+        self.assertGreater(reports[-1][2], 0)
+
+        # звук изменен, но фреймы целы
+        with open(filename, 'r+b') as f:
+            f.seek(26)
+            f.write(bytes(15) + b'\1')
+        self.assertFalse(verify_md5(AudioFile(filename)))
+        with open(filename, 'r+b') as f:
+            f.seek(26)
+            f.write(bytes(16))
+        with self.assertRaises(ValueError):
+            verify_md5(AudioFile(filename))
+
+    def test_verify_md5_with_corrupted_frame(self):
+        filename = os.path.join(self.dir.name, 'md5.flac')
+        make_flac(filename, block_size=1024, total_samples=5000)
+        audio_file = AudioFile(filename)
+        audio_file.parse_frames()
+        with open(filename, 'r+b') as f:
+            f.seek(audio_file.frames[4][OFFSET] + 50)
+            f.write(b'\0\0\0\0')
+        self.assertFalse(verify_md5(AudioFile(filename)))
+
+    def test_bit_reader(self):
+        writer = BitWriter()
+        values = [(5, 3), (0, 1), (1023, 10), (-3, 7), (1, 40)]
+        for value, bits in values:
+            writer.write(value, bits)
+        writer.write(1, 20)
+        writer.write(3, 2)
+        reader = BitReader(writer.to_bytes())
+        self.assertEqual(reader.read(3), 5)
+        self.assertEqual(reader.read(1), 0)
+        self.assertEqual(reader.read(10), 1023)
+        self.assertEqual(reader.read_signed(7), -3)
+        self.assertEqual(reader.read(40), 1)
+        self.assertEqual(reader.read_unary(), 19)
+        self.assertEqual(reader.read(2), 3)
+
+    def test_read_rice(self):
+        generator = random.Random(3)
+        for parameter in (0, 1, 5, 14):
+            values = [generator.randint(-(4 << parameter), 4 << parameter) for _ in range(500)]
+            # длинная унарная часть, которая не помещается в окно из 8 байт
+            values[100] = 300 << parameter
+            writer = BitWriter()
+            writer.write(5, 3)
+            for value in values:
+                folded = value << 1 if value >= 0 else -value * 2 - 1
+                writer.write(1, (folded >> parameter) + 1)
+                writer.write(folded & ((1 << parameter) - 1), parameter)
+            writer.write(1, 1)
+            data = writer.to_bytes()
+            reader = BitReader(data)
+            reader.read(3)
+            self.assertEqual(reader.read_rice(450, parameter), values[:450])
+            self.assertEqual(reader.read_rice(50, parameter), values[450:])
+            self.assertEqual(reader.read(1), 1)
+            reader = BitReader(data[:len(data) // 2])
+            with self.assertRaises(ValueError):
+                reader.read_rice(500, parameter)
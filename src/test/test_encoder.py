@@ -0,0 +1,92 @@
+import math
+import os
+import random
+import tempfile
+import unittest
+import wave
+from src.main import encoder
+from src.main.decoder import decode
+from src.main.flac import AudioFile, BLOCK_SIZE, FIRST_SAMPLE, OFFSET, SAMPLE_NUMBER
+from src.test.fixtures import md5_of
+
+
+def signal(total, seed=0):
+    """
+    Синус с шумом в левом канале и похожий на него правый
+    """
+    rnd = random.Random(seed)
+    left = [int(3000 * math.sin(i / 15) + rnd.randint(-40, 40)) for i in range(total)]
+    right = [(left[i] * 3 >> 2) + rnd.randint(-20, 20) for i in range(total)]
+    return [left, right]
+
+
+class TestEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'encoded.flac')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        samples = signal(10000)
+        encoder.encode(self.filename, samples, 8000, 16, block_size=1152, workers=1,
+                       tags={'TITLE': 'encoded', 'ARTIST': ['a', 'b']}, seek_interval=0.5)
+        self.assertLess(os.path.getsize(self.filename), 10000 * 4 * 0.75)
+
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.tags['TITLE'], {'encoded'})
+        self.assertEqual(audio_file.tags['ARTIST'], {'a', 'b'})
+        with open(self.filename, 'rb') as f:
+            # MD5 - последние 16 байт STREAMINFO
+            self.assertEqual(f.read(42)[26:], md5_of(samples, 16))
+        self.assertEqual([list(channel) for channel in decode(audio_file)], samples)
+        audio_file.parse_frames()
+        self.assertEqual(audio_file.verify_frames(), [])
+        self.assertEqual(audio_file.frames[-1][BLOCK_SIZE], 10000 % 1152)
+        # точки каждые 4000 сэмплов указывают на фреймы с этими сэмплами
+        self.assertEqual([point[FIRST_SAMPLE] for point in audio_file.seektable], [0, 3456, 6912])
+        for point in audio_file.seektable:
+            i = point[FIRST_SAMPLE] // 1152
+            self.assertEqual(point[OFFSET] + audio_file.first_frame, audio_file.frames[i][OFFSET])
+            self.assertEqual(audio_file.frames[i][SAMPLE_NUMBER], point[FIRST_SAMPLE])
+
+    def test_subframe_kinds(self):
+        total = 600
+        rnd = random.Random(1)
+        samples = [[7] * total,
+                   [rnd.randint(-100, 100) << 3 for _ in range(total)],
+                   [rnd.randint(-2048, 2047) for _ in range(total)]]
+        encoder.encode(self.filename, samples, 44100, 12, block_size=256, workers=1, max_lpc_order=2)
+        self.assertEqual([list(channel) for channel in decode(AudioFile(self.filename))], samples)
+
+    def test_workers_give_same_file(self):
+        samples = signal(6000, seed=2)
+        serial = os.path.join(self.dir.name, 'serial.flac')
+        encoder.encode(serial, samples, 44100, 16, block_size=256, workers=1, max_lpc_order=4)
+        encoder.encode(self.filename, samples, 44100, 16, block_size=256, workers=2, max_lpc_order=4)
+        with open(serial, 'rb') as a, open(self.filename, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_wav(self):
+        wav = os.path.join(self.dir.name, 'input.wav')
+        samples = [[-8388608, 8388607, 0, 1, -1] * 40, [i * 1000 for i in range(200)]]
+        with wave.open(wav, 'wb') as f:
+            f.setnchannels(2)
+            f.setsampwidth(3)
+            f.setframerate(96000)
+            f.writeframes(b''.join(sample.to_bytes(3, byteorder='little', signed=True)
+                                   for pair in zip(*samples) for sample in pair))
+        self.assertEqual(encoder.main([wav, self.filename, '-w', '1', '-t', 'TITLE=wav']), 0)
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.tags['TITLE'], {'wav'})
+        self.assertEqual([list(channel) for channel in decode(audio_file)], samples)
+
+    def test_wrong_input(self):
+        with self.assertRaises(ValueError):
+            encoder.encode(self.filename, [[0], [0, 1]], 44100, 16)
+        with self.assertRaises(ValueError):
+            encoder.encode(self.filename, [[128]], 44100, 8)
+        with self.assertRaises(ValueError):
+            encoder.encode(self.filename, [[0]] * 9, 44100, 16)
@@ -0,0 +1,184 @@
+import os
+import tempfile
+import unittest
+from src.main.flac import AudioFile, BLOCK_SIZE, CHANNELS, FIRST_SAMPLE, \
+    NUMBER_OF_SAMPLES, OFFSET, PLACEHOLDER, SAMPLE_NUMBER, SAMPLE_RATE, SAMPLE_SIZE, SAMPLES_IN_FLOW, \
+    decode_utf8_number, find_sync_codes
+from src.main.metadata_writer import MetadataEditor
+from src.test.fixtures import make_flac, utf8_number
+
+
+class TestFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.fixed = os.path.join(self.dir.name, 'fixed.flac')
+        self.variable = os.path.join(self.dir.name, 'variable.flac')
+        make_flac(self.fixed, block_size=1152, total_samples=12000)
+        make_flac(self.variable, channels=1, bits_per_sample=12,
+                  block_sizes=[100, 4096, 300, 17, 2000])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_frames_count(self):
+        audio_file = AudioFile(self.fixed)
+        audio_file.parse_frames()
+        self.assertEqual(len(audio_file.frames), 11)
+        self.assertEqual(audio_file.frames[0][OFFSET], audio_file.first_frame)
+        self.assertEqual(audio_file.frames[10][BLOCK_SIZE], 12000 - 10 * 1152)
+
+    def test_mmap_matches_read(self):
+        for filename in (self.fixed, self.variable):
+            audio_file = AudioFile(filename)
+            audio_file.parse_frames(use_mmap=False)
+            frames = audio_file.frames
+            audio_file.parse_frames(use_mmap=True)
+            self.assertEqual(audio_file.frames, frames)
+
+    def test_parallel_matches_serial(self):
+        seektable = os.path.join(self.dir.name, 'seektable.flac')
+        make_flac(seektable, subframe='fixed', block_size=1000, total_samples=20500,
+                  seekpoints=4)
+        for filename in (self.fixed, self.variable, seektable):
+            audio_file = AudioFile(filename)
+            audio_file.parse_frames()
+            frames = audio_file.frames
+            for workers in (2, 3, 8):
+                audio_file.parse_frames(workers=workers)
+                self.assertEqual(audio_file.frames, frames)
+
+    def test_split_points(self):
+        filename = os.path.join(self.dir.name, 'seektable.flac')
+        make_flac(filename, block_size=1000, total_samples=20500, seekpoints=4)
+        audio_file = AudioFile(filename)
+        size = os.path.getsize(filename)
+        points = [audio_file.first_frame + point[OFFSET] for point in audio_file.seektable]
+        bounds = audio_file.split_points(size, 4)
+        self.assertEqual(bounds, points + [size])
+        audio_file.seektable = []
+        bounds = audio_file.split_points(size, 3)
+        self.assertEqual(len(bounds), 4)
+        self.assertEqual((bounds[0], bounds[-1]), (audio_file.first_frame, size))
+
+    def test_variable_block_size(self):
+        audio_file = AudioFile(self.variable)
+        audio_file.parse_frames()
+        self.assertEqual([frame[BLOCK_SIZE] for frame in audio_file.frames],
+                         [100, 4096, 300, 17, 2000])
+
+    def test_find_sync_codes(self):
+        with open(self.fixed, 'rb') as f:
+            data = f.read()
+        expected = [i for i in range(len(data) - 1)
+                    if data[i] == 0xFF and 0xF8 <= data[i + 1] <= 0xFB]
+        self.assertEqual(list(find_sync_codes(data)), expected)
+        self.assertEqual(list(find_sync_codes(memoryview(data), 100, 5000)),
+                         [i for i in expected if 100 <= i and i + 1 < 5000])
+
+    def test_decode_utf8_number(self):
+        for number in (0, 0x7F, 0x80, 0x7FF, 0x800, 0xFFFF, 0x10000,
+                       0x7FFFFFFF, 0xFFFFFFFFF):
+            data = utf8_number(number)
+            self.assertEqual(decode_utf8_number(data, 0), (len(data), number))
+        with self.assertRaises(ValueError):
+            decode_utf8_number(b'\x80', 0)
+        with self.assertRaises(ValueError):
+            decode_utf8_number(b'\xc2\x41', 0)
+
+    def test_sample_rates(self):
+        for rate, expected in ((44100, 44.1), (96000, 96), (11000, 11),
+                               (11025, 11.025), (500000, 500), (655370, 655.37)):
+            filename = os.path.join(self.dir.name, '{}.flac'.format(rate))
+            make_flac(filename, rate=rate, block_size=1024, total_samples=3000)
+            audio_file = AudioFile(filename)
+            audio_file.parse_frames()
+            self.assertEqual(len(audio_file.frames), 3)
+            self.assertEqual(audio_file.frames[0][SAMPLE_RATE], expected)
+
+    def test_sample_number(self):
+        audio_file = AudioFile(self.variable)
+        audio_file.parse_frames()
+        self.assertEqual([frame[SAMPLE_NUMBER] for frame in audio_file.frames],
+                         [0, 100, 4196, 4496, 4513])
+        audio_file = AudioFile(self.fixed)
+        audio_file.parse_frames()
+        self.assertEqual(audio_file.frames[3][SAMPLE_NUMBER], 3 * 1152)
+
+    def test_frame_index(self):
+        audio_file = AudioFile(self.variable)
+        audio_file.parse_frames()
+        frames = audio_file.frames
+        self.assertEqual(dict(frames[-1]), {OFFSET: frames.offsets[4],
+                                            BLOCK_SIZE: 2000,
+                                            SAMPLE_RATE: 44.1,
+                                            CHANNELS: 1,
+                                            SAMPLE_SIZE: 12,
+                                            SAMPLE_NUMBER: 4513})
+        self.assertEqual(len(frames[1:3]), 2)
+        self.assertEqual(frames[1:3][0], frames[1])
+        self.assertEqual([frame[BLOCK_SIZE] for frame in frames[::2]],
+                         [100, 300, 2000])
+        with self.assertRaises(IndexError):
+            frames[5]
+
+    def test_seek(self):
+        filename = os.path.join(self.dir.name, 'seektable.flac')
+        make_flac(filename, block_size=1000, total_samples=20500,
+                  seekpoints=4, placeholders=2)
+        for name in (filename, self.fixed, self.variable):
+            audio_file = AudioFile(name)
+            total = audio_file.streaminfo[SAMPLES_IN_FLOW]
+            samples = [sample for sample in (0, 1, 999, 1000, 4195, 4196, 10001, total - 1)
+                       if sample < total]
+            positions = [audio_file.seek(sample) for sample in samples]
+            audio_file.parse_frames()
+            for sample, (offset, first_sample) in zip(samples, positions):
+                self.assertEqual((offset, first_sample), audio_file.seek(sample))
+                i = list(audio_file.frames.offsets).index(offset)
+                self.assertEqual(audio_file.frames[i][SAMPLE_NUMBER], first_sample)
+                self.assertLessEqual(first_sample, sample)
+                self.assertLess(sample, first_sample + audio_file.frames[i][BLOCK_SIZE])
+            with self.assertRaises(ValueError):
+                audio_file.seek(total)
+
+    def test_seek_with_wrong_seekpoint(self):
+        filename = os.path.join(self.dir.name, 'seektable.flac')
+        make_flac(filename, block_size=1000, total_samples=20500, seekpoints=4, padding=64)
+        points = AudioFile(filename).seektable
+        # третья точка смещена внутрь фрейма, четвертая - за конец файла
+        points[2][OFFSET] += 7
+        points[3][OFFSET] += 1 << 30
+        editor = MetadataEditor(filename)
+        editor.set_seektable(points)
+        editor.save()
+        expected = AudioFile(filename)
+        expected.parse_frames()
+        for sample in (11000, 10000, 16000, 20499):
+            self.assertEqual(AudioFile(filename).seek(sample), expected.seek(sample))
+
+    def test_seektable_values(self):
+        filename = os.path.join(self.dir.name, 'seektable.flac')
+        make_flac(filename, block_size=1000, total_samples=20500, seekpoints=4)
+        audio_file = AudioFile(filename)
+        self.assertEqual([point[FIRST_SAMPLE] for point in audio_file.seektable],
+                         [0, 5000, 10000, 15000])
+        audio_file.parse_frames()
+        self.assertEqual(audio_file.seektable[1][OFFSET] + audio_file.first_frame,
+                         audio_file.frames[5][OFFSET])
+
+    def test_build_seektable(self):
+        audio_file = AudioFile(self.variable)
+        seektable = audio_file.build_seektable(count=3, placeholders=2)
+        # цели 0, 2171, 4342 - фреймы с первыми сэмплами 0, 100, 4196
+        self.assertEqual([point[FIRST_SAMPLE] for point in seektable],
+                         [0, 100, 4196, PLACEHOLDER, PLACEHOLDER])
+        self.assertEqual(seektable[2][OFFSET] + audio_file.first_frame, audio_file.frames[2][OFFSET])
+        self.assertEqual(seektable[2][NUMBER_OF_SAMPLES], 300)
+
+        # по одной точке на 0.05 с при 44100 Гц, соседние цели в одном фрейме не повторяются
+        seektable = AudioFile(self.fixed).build_seektable(seconds=0.05)
+        self.assertEqual([point[FIRST_SAMPLE] for point in seektable],
+                         [0, 1152, 3456, 5760, 8064, 10368])
+        with self.assertRaises(ValueError):
+            audio_file.build_seektable()
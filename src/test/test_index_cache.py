@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src.main.flac import AudioFile
+from src.main.index_cache import IndexCache
+from src.test.fixtures import make_flac
+
+
+class TestIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.dir.name, 'cache')
+        self.filename = os.path.join(self.dir.name, 'cached.flac')
+        make_flac(self.filename, block_size=1152, total_samples=12000,
+                  tags=[('TITLE', 't')], seekpoints=2, pictures=[b'cover' * 10])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.cache_dir) if name.endswith('.idx'))
+
+    def test_hit_after_parse(self):
+        cache = IndexCache(self.cache_dir)
+        audio_file = AudioFile(self.filename, cache)
+        audio_file.parse_frames()
+        self.assertEqual(len(self.entries()), 1)
+
+        with mock.patch('src.main.flac.open', create=True,
+                        side_effect=AssertionError('file is read')):
+            cached = AudioFile(self.filename, cache)
+        self.assertEqual(cached.frames.columns(), audio_file.frames.columns())
+        self.assertEqual(cached.metadata, audio_file.metadata)
+        self.assertEqual(cached.tags, audio_file.tags)
+        self.assertEqual(cached.seektable, audio_file.seektable)
+        self.assertEqual(cached.first_frame, audio_file.first_frame)
+        self.assertEqual(cached.blocking_strategy, audio_file.blocking_strategy)
+        self.assertEqual(cached.picture_payloads, audio_file.picture_payloads)
+        self.assertEqual(cached.picture[0]['pic'], b'cover' * 10)
+        frames = cached.frames
+        cached.parse_frames()
+        self.assertIs(cached.frames, frames)
+
+    def test_miss_after_change(self):
+        cache = IndexCache(self.cache_dir)
+        AudioFile(self.filename, cache).parse_frames()
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        audio_file = AudioFile(self.filename, cache)
+        self.assertEqual(len(audio_file.frames), 0)
+        audio_file.parse_frames()
+        self.assertEqual(len(audio_file.frames), 11)
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_md5_check(self):
+        cache = IndexCache(self.cache_dir, check_md5=True)
+        AudioFile(self.filename, cache).parse_frames()
+        stat = os.stat(self.filename)
+        with open(self.filename, 'r+b') as f:
+            f.seek(30)
+            f.write(b'\0')
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(len(AudioFile(self.filename, cache).frames), 0)
+        self.assertEqual(len(AudioFile(self.filename, IndexCache(self.cache_dir)).frames), 11)
+
+    def test_corrupted_entry(self):
+        cache = IndexCache(self.cache_dir)
+        AudioFile(self.filename, cache).parse_frames()
+        path = os.path.join(self.cache_dir, self.entries()[0])
+        with open(path, 'r+b') as f:
+            f.truncate(100)
+        self.assertEqual(len(AudioFile(self.filename, cache).frames), 0)
+        self.assertEqual(self.entries(), [])
+
+    def test_lru_eviction(self):
+        names = []
+        for i in range(3):
+            name = os.path.join(self.dir.name, '{}.flac'.format(i))
+            make_flac(name, block_size=1152, total_samples=12000, seed=i)
+            names.append(name)
+        cache = IndexCache(self.cache_dir)
+        for i, name in enumerate(names):
+            AudioFile(name, cache).parse_frames()
+            os.utime(cache.entry_path(name), ns=(i, i))
+        entry_size = os.path.getsize(cache.entry_path(names[0]))
+        # попадание делает первую запись самой свежей
+        AudioFile(names[0], cache)
+        cache.max_bytes = 2 * entry_size
+        cache.evict()
+        self.assertTrue(os.path.exists(cache.entry_path(names[0])))
+        self.assertFalse(os.path.exists(cache.entry_path(names[1])))
+        self.assertTrue(os.path.exists(cache.entry_path(names[2])))
+
+    def test_eviction_on_store_is_amortized(self):
+        names = []
+        for i in range(6):
+            name = os.path.join(self.dir.name, '{}.flac'.format(i))
+            make_flac(name, block_size=1152, total_samples=12000, seed=i)
+            names.append(name)
+        cache = IndexCache(self.cache_dir)
+        AudioFile(names[0], cache).parse_frames()
+        entry_size = os.path.getsize(cache.entry_path(names[0]))
+        self.assertEqual(cache.total, entry_size)
+        cache.max_bytes = 4 * entry_size
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            for name in names[1:4]:
+                AudioFile(name, cache).parse_frames()
+            self.assertEqual(scandir.call_count, 0)
+            self.assertEqual(cache.total, 4 * entry_size)
+            # превышение: один просмотр каталога и запас до EVICT_TO
+            AudioFile(names[4], cache).parse_frames()
+            self.assertEqual(scandir.call_count, 1)
+        self.assertEqual(len(self.entries()), 3)
+        self.assertEqual(cache.total, 3 * entry_size)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from src.main import instrumentation
+from src.main.flac import AudioFile, OFFSET
+from src.main.index_cache import IndexCache
+from src.test.fixtures import make_flac
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'stats.flac')
+        make_flac(self.filename, block_size=1024, total_samples=5000,
+                  tags=[('TITLE', 't')], pictures=[b'p' * 1000], seekpoints=2)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_phases_and_counters(self):
+        stats = instrumentation.Stats()
+        audio_file = AudioFile(self.filename, stats=stats)
+        self.assertEqual(audio_file.tags['TITLE'], {'t'})
+        audio_file.parse_frames()
+        self.assertEqual(audio_file.verify_frames(), [])
+        audio_file.picture[0]['pic']
+
+        for phase in ('open', 'parse_metadata', 'parse_vorbis_comment', 'parse_picture',
+                      'parse_frames', 'verify_frames'):
+            self.assertEqual(stats.calls[phase], 1)
+            self.assertGreaterEqual(stats.timers[phase], 0)
+        counters = stats.counters
+        self.assertEqual(counters[instrumentation.BYTES_READ], len(audio_file.metadata) + 1000)
+        self.assertEqual(counters[instrumentation.BYTES_SKIPPED], 1000)
+        self.assertEqual(counters[instrumentation.FRAMES_ACCEPTED], 5)
+        self.assertEqual(counters[instrumentation.SYNC_CANDIDATES],
+                         5 + counters[instrumentation.CANDIDATES_IN_HEADER]
+                         + counters[instrumentation.HEADER_ERRORS])
+        self.assertEqual(counters[instrumentation.CRC_FAILURES], 0)
+        self.assertEqual(counters[instrumentation.CRC_BYTES],
+                         os.path.getsize(self.filename) - audio_file.first_frame)
+
+    def test_header_errors(self):
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        with open(self.filename, 'r+b') as f:
+            f.seek(audio_file.frames[2][OFFSET] + 4)
+            f.write(b'\xff')
+        stats = instrumentation.Stats()
+        audio_file = AudioFile(self.filename, stats=stats)
+        audio_file.parse_frames()
+        self.assertEqual(len(audio_file.frames), 2)
+        self.assertGreaterEqual(stats.counters[instrumentation.HEADER_ERRORS], 3)
+
+    def test_parallel_counters_match_serial(self):
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        with open(self.filename, 'r+b') as f:
+            f.seek(audio_file.frames[2][OFFSET] + 4)
+            f.write(b'\xff')
+        names = (instrumentation.BYTES_SCANNED, instrumentation.SYNC_CANDIDATES,
+                 instrumentation.CANDIDATES_IN_HEADER, instrumentation.HEADER_ERRORS,
+                 instrumentation.FRAMES_ACCEPTED)
+        counters = []
+        for workers in (None, 3):
+            stats = instrumentation.Stats()
+            AudioFile(self.filename, stats=stats).parse_frames(workers=workers)
+            counters.append([stats.counters[name] for name in names])
+        self.assertEqual(counters[0], counters[1])
+        self.assertGreater(counters[1][1], 0)
+
+    def test_callbacks_logging_and_cache(self):
+        events = []
+        stats = instrumentation.Stats(callback=lambda *event: events.append(event), log=True)
+        cache = IndexCache(os.path.join(self.dir.name, 'cache'))
+        with self.assertLogs('flac', level='DEBUG') as logs:
+            AudioFile(self.filename, cache, stats).parse_frames()
+            AudioFile(self.filename, cache, stats)
+        self.assertEqual(stats.counters[instrumentation.CACHE_MISSES], 1)
+        self.assertEqual(stats.counters[instrumentation.CACHE_STORES], 1)
+        self.assertEqual(stats.counters[instrumentation.CACHE_HITS], 1)
+        self.assertIn((instrumentation.COUNT, instrumentation.CACHE_HITS, 1), events)
+        self.assertIn(instrumentation.PHASE, [event for event, _, _ in events])
+        self.assertTrue(any('cache hits' in line for line in logs.output))
+        stats.reset()
+        self.assertEqual(stats.as_dict(), {'timers': {}, 'calls': {}, 'counters': {}})
+
+    def test_disabled(self):
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        self.assertIsNone(audio_file.stats)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from src.main.flac import AudioFile, BITS_PER_SAMPLE, CHANNELS, \
+    CORRESPONDS_TO_CD, IS_AUDIO, OFFSET, PRE_EMPHASIS, RATE, \
+    SAMPLES_IN_FLOW, TRACK_INDEX, TRACKS
+from src.test.fixtures import make_flac
+
+
+class TestMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'tagged.flac')
+        self.data, _ = make_flac(self.filename, rate=48000, channels=2,
+                                 bits_per_sample=24, total_samples=10000,
+                                 tags=[('ARTIST', 'a'), ('ARTIST', 'b'),
+                                       ('TITLE', 't')],
+                                 pictures=[b'\x89PNG' * 100, b'x' * 10],
+                                 seekpoints=2, padding=64)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_streaminfo(self):
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.streaminfo[RATE], 48000)
+        self.assertEqual(audio_file.streaminfo[CHANNELS], 2)
+        self.assertEqual(audio_file.streaminfo[BITS_PER_SAMPLE], 24)
+        self.assertEqual(audio_file.streaminfo[SAMPLES_IN_FLOW], 10000)
+
+    def test_blocks(self):
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.tags['ARTIST'], {'a', 'b'})
+        self.assertEqual(audio_file.tags['vendor'], 'fixtures')
+        self.assertEqual(len(audio_file.picture), 2)
+        self.assertEqual(audio_file.picture[0]['pic'], b'\x89PNG' * 100)
+        self.assertEqual(audio_file.picture[1]['extension'], 'png')
+        self.assertEqual(len(audio_file.seektable), 2)
+
+    def test_only_metadata_is_read(self):
+        audio_file = AudioFile(self.filename)
+        # в буфере метаданных нет изображений из блоков PICTURE
+        expected = self.data[:audio_file.first_frame]
+        for offset, length in reversed(audio_file.picture_payloads):
+            expected = expected[:offset] + expected[offset + length:]
+        self.assertEqual(audio_file.metadata, expected)
+        self.assertEqual(len(audio_file.metadata), audio_file.first_frame - 410)
+
+    def test_lazy_blocks(self):
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.tags['TITLE'], {'t'})
+        self.assertNotIn('picture', audio_file.__dict__)
+        self.assertNotIn('cuesheet', audio_file.__dict__)
+        picture = audio_file.picture[0]
+        self.assertEqual(picture['mime type'], 'image/png')
+        offset, length = audio_file.picture_range(0)
+        self.assertEqual(self.data[offset:offset + length], b'\x89PNG' * 100)
+        self.assertEqual(dict(picture)['pic'], b'\x89PNG' * 100)
+        self.assertEqual(audio_file.read_picture(1), b'x' * 10)
+
+    def test_truncated_metadata(self):
+        with open(self.filename, 'wb') as f:
+            f.write(self.data[:100])
+        with self.assertRaises(ValueError):
+            AudioFile(self.filename)
+
+    def test_cuesheet(self):
+        filename = os.path.join(self.dir.name, 'cuesheet.flac')
+        make_flac(filename, cuesheet=[(0, 1, 'ISRC00000001', True, False,
+                                       [(0, 1)]),
+                                      (588, 2, '', False, True,
+                                       [(0, 0), (588, 1)]),
+                                      (10000, 170, '', True, False, [])])
+        cuesheet = AudioFile(filename).cuesheet
+        self.assertEqual(cuesheet[CORRESPONDS_TO_CD], 1)
+        self.assertEqual(len(cuesheet[TRACKS]), 3)
+        self.assertEqual(cuesheet[TRACKS][0][IS_AUDIO], 0)
+        self.assertEqual(cuesheet[TRACKS][1][IS_AUDIO], 1)
+        self.assertEqual(cuesheet[TRACKS][1][PRE_EMPHASIS], 1)
+        self.assertEqual(cuesheet[TRACKS][1][TRACK_INDEX][1][OFFSET], 588)
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from src.main.flac import AudioFile, BLOCK_SIZE, FIRST_SAMPLE, NUMBER_OF_SAMPLES, OFFSET, \
+    PLACEHOLDER, SAMPLE_NUMBER
+from src.main.metadata_writer import COMPARE_SIZE, MAX_BLOCK_SIZE, MetadataEditor, common_prefix, \
+    padding_blocks, write_seektable
+from src.test.fixtures import make_flac
+
+
+class TestMetadataWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'edit.flac')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def audio(self):
+        with open(self.filename, 'rb') as f:
+            f.seek(AudioFile(self.filename).first_frame)
+            return f.read()
+
+    def test_tags_fit_into_padding(self):
+        make_flac(self.filename, tags=[('TITLE', 'old')], padding=4096)
+        size = os.path.getsize(self.filename)
+        audio = self.audio()
+        editor = MetadataEditor(self.filename)
+        editor.set_tags({'TITLE': 'new', 'ARTIST': {'a', 'b'}})
+        self.assertTrue(editor.save())
+
+        self.assertEqual(os.path.getsize(self.filename), size)
+        self.assertEqual(self.audio(), audio)
+        tags = AudioFile(self.filename).tags
+        self.assertEqual(tags['TITLE'], {'new'})
+        self.assertEqual(tags['ARTIST'], {'a', 'b'})
+        self.assertEqual(tags['vendor'], 'fixtures')
+
+    def test_rewrite_when_padding_is_small(self):
+        make_flac(self.filename, tags=[('TITLE', 'old')], padding=10)
+        size = os.path.getsize(self.filename)
+        audio = self.audio()
+        editor = MetadataEditor(self.filename)
+        editor.set_tags({'TITLE': 'x' * 100})
+        self.assertFalse(editor.save(padding=1000))
+
+        self.assertGreater(os.path.getsize(self.filename), size + 1000)
+        self.assertEqual(self.audio(), audio)
+        self.assertEqual(AudioFile(self.filename).tags['TITLE'], {'x' * 100})
+        self.assertEqual(os.listdir(self.dir.name), ['edit.flac'])
+
+        # теперь места хватает
+        editor.set_tags({'TITLE': 'y' * 200})
+        size = os.path.getsize(self.filename)
+        self.assertTrue(editor.save())
+        self.assertEqual(os.path.getsize(self.filename), size)
+
+    def test_exact_fit_without_padding(self):
+        make_flac(self.filename, tags=[('TITLE', 'abc')])
+        editor = MetadataEditor(self.filename)
+        editor.set_tags({'TITLE': 'xyz'})
+        self.assertTrue(editor.save())
+        audio_file = AudioFile(self.filename)
+        self.assertEqual(audio_file.tags['TITLE'], {'xyz'})
+        self.assertEqual([block.type for block in MetadataEditor(self.filename).blocks], [0, 4])
+
+    def test_pictures(self):
+        make_flac(self.filename, pictures=[b'first', b'second'], padding=1024)
+        editor = MetadataEditor(self.filename)
+        editor.replace_picture(0, b'replaced', mime_type='image/png', description='cover')
+        editor.remove_picture(1)
+        editor.add_picture(b'added', picture_type=4)
+        self.assertTrue(editor.save())
+
+        audio_file = AudioFile(self.filename)
+        self.assertEqual([picture['pic'] for picture in audio_file.picture], [b'replaced', b'added'])
+        self.assertEqual(audio_file.picture[0]['mime type'], 'image/png')
+        self.assertEqual(audio_file.picture[0]['description'], 'cover')
+
+    def test_large_padding_is_split(self):
+        picture = bytes(10 << 20)
+        make_flac(self.filename, pictures=[picture, picture])
+        size = os.path.getsize(self.filename)
+        audio = self.audio()
+        editor = MetadataEditor(self.filename)
+        editor.remove_picture(1)
+        editor.remove_picture(0)
+        self.assertTrue(editor.save())
+
+        self.assertEqual(os.path.getsize(self.filename), size)
+        self.assertEqual(self.audio(), audio)
+        blocks = MetadataEditor(self.filename).blocks
+        self.assertEqual([block.type for block in blocks], [0, 1, 1])
+        self.assertEqual(blocks[1].size, MAX_BLOCK_SIZE)
+        # остаток меньше заголовка не остается без блока
+        for free in (0, 4, MAX_BLOCK_SIZE + 4, MAX_BLOCK_SIZE + 6, MAX_BLOCK_SIZE + 8):
+            sizes = [block.size for block in padding_blocks(free)]
+            self.assertEqual(sum(sizes) + 4 * len(sizes), free)
+            self.assertLessEqual(max(sizes, default=0), MAX_BLOCK_SIZE)
+
+    def test_common_prefix(self):
+        data = bytes(range(256)) * (3 * COMPARE_SIZE // 256)
+        for position in (0, 1, COMPARE_SIZE - 1, COMPARE_SIZE, 2 * COMPARE_SIZE + 77, len(data) - 1):
+            changed = bytearray(data)
+            changed[position] ^= 0xFF
+            self.assertEqual(common_prefix(data, changed), position)
+        self.assertEqual(common_prefix(data, data), len(data))
+        self.assertEqual(common_prefix(data, data[:100]), 100)
+
+    def test_seektable(self):
+        make_flac(self.filename, seekpoints=2, padding=1024)
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        points = [{FIRST_SAMPLE: frame[SAMPLE_NUMBER], OFFSET: frame[OFFSET] - audio_file.first_frame,
+                   NUMBER_OF_SAMPLES: frame[BLOCK_SIZE]} for frame in audio_file.frames]
+        editor = MetadataEditor(self.filename)
+        editor.set_seektable(points)
+        self.assertTrue(editor.save())
+        self.assertEqual(AudioFile(self.filename).seektable, points)
+
+    def test_write_seektable(self):
+        make_flac(self.filename, block_size=1000, total_samples=20500)
+        self.assertEqual(AudioFile(self.filename).seektable, [])
+        self.assertFalse(write_seektable(self.filename, count=4, placeholders=1))
+        audio_file = AudioFile(self.filename)
+        self.assertEqual([point[FIRST_SAMPLE] for point in audio_file.seektable],
+                         [0, 5000, 10000, 15000, PLACEHOLDER])
+        offset = audio_file.seek(12345)
+        audio_file.parse_frames()
+        self.assertEqual(offset, audio_file.seek(12345))
+        # точки на месте заполнителя и PADDING, файл не переписывается
+        self.assertTrue(write_seektable(self.filename, seconds=0.1, placeholders=1))
+        self.assertEqual(len(AudioFile(self.filename).seektable), 6)
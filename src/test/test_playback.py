@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from src.main.block_cache import BlockCache
+from src.main.encoder import read_wav
+from src.main.playback import NullSink, PlaybackEngine, RingBuffer, WavSink
+from src.test.fixtures import make_flac
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_wraparound(self):
+        ring = RingBuffer(8)
+        self.assertEqual(ring.write(b'abcdef'), 6)
+        self.assertEqual(ring.read(4), b'abcd')
+        self.assertEqual(ring.write(b'ghijklm'), 6)
+        self.assertEqual(ring.free, 0)
+        self.assertEqual(ring.read(100), b'efghijkl')
+        self.assertEqual(ring.available, 0)
+
+
+class TestPlaybackEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.first = os.path.join(self.dir.name, 'first.flac')
+        self.second = os.path.join(self.dir.name, 'second.flac')
+        _, self.first_samples = make_flac(self.first, block_size=1024, total_samples=5000, seed=1)
+        _, self.second_samples = make_flac(self.second, block_sizes=[700, 333, 1024], seed=2)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def play(self, engine, *filenames):
+        for filename in filenames:
+            engine.enqueue(filename)
+        try:
+            engine.play()
+            self.assertTrue(engine.wait(timeout=60))
+        finally:
+            engine.close()
+
+    def test_gapless(self):
+        output = os.path.join(self.dir.name, 'out.wav')
+        tracks = []
+        engine = PlaybackEngine(WavSink(output), buffer_size=4096, period=1000, on_track=tracks.append)
+        self.play(engine, self.first, self.second)
+        samples, rate, bits_per_sample = read_wav(output)
+        self.assertEqual((rate, bits_per_sample), (44100, 16))
+        self.assertEqual([list(channel) for channel in samples],
+                         [first + second for first, second in zip(self.first_samples, self.second_samples)])
+        self.assertEqual(tracks, [self.first, self.second])
+        self.assertEqual(engine.written, (5000 + 2057) * 4)
+        self.assertEqual(engine.position(), (self.second, 2057))
+        self.assertEqual(engine.errors, [])
+
+    def test_format_change_and_errors(self):
+        mono = os.path.join(self.dir.name, 'mono.flac')
+        make_flac(mono, channels=1, bits_per_sample=8, block_size=512, total_samples=1000)
+        bad = os.path.join(self.dir.name, 'bad.flac')
+        with open(bad, 'wb') as f:
+            f.write(b'not flac')
+        sink = WavSink(os.path.join(self.dir.name, 'out{}.wav'))
+        engine = PlaybackEngine(sink)
+        self.play(engine, self.first, bad, mono)
+        self.assertEqual(len(sink.files), 2)
+        samples, _, bits_per_sample = read_wav(sink.files[1])
+        self.assertEqual((len(samples), len(samples[0]), bits_per_sample), (1, 1000, 8))
+        self.assertEqual([filename for filename, _ in engine.errors], [bad])
+
+    def test_seek(self):
+        for cache in (None, BlockCache(read_ahead=0)):
+            output = os.path.join(self.dir.name, 'seek.wav')
+            engine = PlaybackEngine(WavSink(output), cache=cache)
+            engine.enqueue(self.first)
+            engine.enqueue(self.second)
+            engine.seek(1500, index=1)
+            self.play(engine)
+            samples, _, _ = read_wav(output)
+            self.assertEqual([list(channel) for channel in samples],
+                             [channel[1500:] for channel in self.second_samples])
+            self.assertIsNotNone(engine.seek_latency)
+            with self.assertRaises(ValueError):
+                engine.seek(2057)
+
+    def test_frames_come_through_cache(self):
+        cache = BlockCache(read_ahead=2)
+        output = os.path.join(self.dir.name, 'cached.wav')
+        engine = PlaybackEngine(WavSink(output), cache=cache)
+        try:
+            self.play(engine, self.first)
+            samples, _, _ = read_wav(output)
+            self.assertEqual([list(channel) for channel in samples], self.first_samples)
+            # каждый из 5 фреймов взят из кэша ровно один раз
+            self.assertEqual(cache.hits + cache.misses, 5)
+            cache.wait()
+            self.assertEqual(len(cache), 5)
+        finally:
+            cache.close()
+
+    def test_null_sink_pause(self):
+        sink = NullSink()
+        engine = PlaybackEngine(sink, buffer_size=4096)
+        engine.enqueue(self.first)
+        engine.pause()
+        engine.play()
+        engine.pause()
+        self.assertFalse(engine.wait(timeout=0.2))
+        self.play(engine)
+        self.assertEqual(sink.written, 5000 * 4)
+        self.assertEqual(sink.opened, 1)
+        self.assertEqual(engine.latency(), 0.0)
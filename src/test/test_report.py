@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from src.main import constants
+from src.main.flac import AudioFile, BLOCK_SIZE, CHANNELS, FRAME_RECORD, \
+    FRAME_REPORT_MAGIC, OFFSET, SAMPLE_NUMBER, SAMPLE_RATE, SAMPLE_SIZE, \
+    write_frames_report
+from src.test.fixtures import make_flac
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.fixed = os.path.join(self.dir.name, 'fixed.flac')
+        self.variable = os.path.join(self.dir.name, 'variable.flac')
+        make_flac(self.fixed, block_size=1152, total_samples=12000)
+        make_flac(self.variable, channels=1, block_sizes=[100, 4096, 300, 17])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    @staticmethod
+    def old_text(audio_file):
+        text = ''
+        for i in range(0, len(audio_file.frames)):
+            text += constants.frames_text.format(i,
+                                                 audio_file.frames[i][OFFSET],
+                                                 audio_file.frames[i][BLOCK_SIZE],
+                                                 audio_file.frames[i][SAMPLE_RATE],
+                                                 audio_file.frames[i][CHANNELS],
+                                                 audio_file.frames[i][SAMPLE_SIZE])
+            if audio_file.blocking_strategy:
+                text += constants.sample_number_text.format(audio_file.frames[i][SAMPLE_NUMBER])
+            text += '\n\n'
+        return text
+
+    def test_text_matches_template(self):
+        for filename in (self.fixed, self.variable):
+            audio_file = AudioFile(filename)
+            audio_file.parse_frames()
+            audio_file.save_frames_text()
+            with open(filename.split('.')[0] + ' frames.txt') as f:
+                self.assertEqual(f.read(), self.old_text(audio_file))
+
+    def test_streams_without_index(self):
+        audio_file = AudioFile(self.variable)
+        out = io.StringIO()
+        audio_file.save_frames_report(out, 'jsonl')
+        self.assertEqual(len(audio_file.frames), 0)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record[BLOCK_SIZE] for record in records], [100, 4096, 300, 17])
+        self.assertEqual([record[SAMPLE_NUMBER] for record in records], [0, 100, 4196, 4496])
+        self.assertEqual(records[0][SAMPLE_RATE], 44100)
+
+    def test_csv_and_binary(self):
+        audio_file = AudioFile(self.fixed)
+        audio_file.parse_frames()
+        out = io.StringIO()
+        audio_file.save_frames_report(out, 'csv')
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([int(row[OFFSET]) for row in rows], list(audio_file.frames.offsets))
+        self.assertEqual(rows[3]['frame'], '3')
+
+        out = io.BytesIO()
+        audio_file.save_frames_report(out, 'binary')
+        data = out.getvalue()
+        self.assertTrue(data.startswith(FRAME_REPORT_MAGIC))
+        frames = list(FRAME_RECORD.iter_unpack(data[len(FRAME_REPORT_MAGIC):]))
+        self.assertEqual(frames, list(zip(*audio_file.frames.columns())))
+
+    def test_writes_in_chunks(self):
+        class Counter:
+            writes = 0
+
+            def write(self, data):
+                self.writes += 1
+
+        out = Counter()
+        frames = ((i, 4096, 44100, 1, 16, i * 4096) for i in range(5000))
+        write_frames_report(frames, out, 'jsonl')
+        self.assertEqual(out.writes, 5)
+        with self.assertRaises(ValueError):
+            write_frames_report([], out, 'xml')
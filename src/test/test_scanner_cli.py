@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from src.main.scanner_cli import CHUNKS_PER_WORKER, ERROR, FRAMES, CORRUPTED_FRAMES, MD5_OK, PATH, TAGS, \
+    find_flac_files, main, scan
+from src.test.fixtures import make_flac
+
+
+class TestScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.dir.name, 'album', 'disc 2'))
+        self.good = [os.path.join(self.dir.name, 'album', '01.flac'),
+                     os.path.join(self.dir.name, 'album', 'disc 2', '02.FLAC')]
+        for i, filename in enumerate(self.good):
+            make_flac(filename, block_size=1024, total_samples=5000, seed=i,
+                      tags=[('TITLE', str(i))])
+        self.bad = os.path.join(self.dir.name, 'album', 'broken.flac')
+        with open(self.bad, 'wb') as f:
+            f.write(b'RIFF' + bytes(100))
+        with open(os.path.join(self.dir.name, 'album', 'cover.jpg'), 'wb') as f:
+            f.write(b'jpeg')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_find_flac_files(self):
+        self.assertEqual(list(find_flac_files([self.dir.name])),
+                         [self.good[0], self.bad, self.good[1]])
+
+    def test_errors_are_isolated(self):
+        for workers in (1, 2):
+            results = list(scan([self.good[0], self.bad, self.good[1]], workers,
+                                verify=True, md5=True))
+            self.assertEqual([result[PATH] for result in results],
+                             [self.good[0], self.bad, self.good[1]])
+            self.assertIsNone(results[0][ERROR])
+            self.assertEqual(results[0][FRAMES], 5)
+            self.assertEqual(results[0][CORRUPTED_FRAMES], 0)
+            self.assertTrue(results[0][MD5_OK])
+            self.assertEqual(results[0][TAGS]['TITLE'], ['0'])
+            self.assertIn('not flac', results[1][ERROR])
+            self.assertIsNone(results[2][ERROR])
+
+    def test_walk_is_consumed_lazily(self):
+        consumed = 0
+
+        def walk():
+            nonlocal consumed
+            for _ in range(1000):
+                consumed += 1
+                yield self.good[0]
+
+        results = scan(walk(), workers=2, chunksize=2)
+        self.assertIsNone(next(results)[ERROR])
+        # не больше CHUNKS_PER_WORKER пачек на процесс и одна читаемая
+        self.assertLessEqual(consumed, (CHUNKS_PER_WORKER * 2 + 1) * 2)
+        results.close()
+
+    def test_output_formats(self):
+        output = os.path.join(self.dir.name, 'report')
+        with redirect_stderr(io.StringIO()) as stderr:
+            code = main([self.dir.name, '-w', '2', '--frames', '-o', output])
+        self.assertEqual(code, 1)
+        self.assertIn('3 files, 1 errors', stderr.getvalue())
+        self.assertIn('MB/s', stderr.getvalue())
+        with open(output) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line[FRAMES] for line in lines], [5, None, 5])
+
+        with redirect_stderr(io.StringIO()):
+            code = main([self.good[0], '-w', '1', '--format', 'csv', '-o', output])
+        self.assertEqual(code, 0)
+        with open(output, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][PATH], self.good[0])
+        self.assertEqual(rows[0]['rate'], '44100')
@@ -0,0 +1,103 @@
+import io
+import os
+import tempfile
+import unittest
+from src.main.decoder import decode
+from src.main.flac import AudioFile, OFFSET, SAMPLE_NUMBER
+from src.main.stream import FlacStream
+from src.test.fixtures import make_flac
+
+
+class SlowReader(io.RawIOBase):
+    """
+    Поток, отдающий данные кусками не больше size байт, как канал или сокет
+    """
+    def __init__(self, data, size):
+        self.data = data
+        self.pos = 0
+        self.size = size
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        n = self.size if n < 0 else min(n, self.size)
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'stream.flac')
+        self.data, self.samples = make_flac(self.filename, subframe='fixed', order=2,
+                                            block_size=1152, total_samples=12000,
+                                            tags=[('TITLE', 't')], padding=100)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_frames_match_parse_frames(self):
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        for source in (io.BytesIO(self.data), SlowReader(self.data, 7)):
+            stream = FlacStream(source, read_size=100)
+            self.assertEqual(stream.tags['TITLE'], {'t'})
+            self.assertEqual(len(list(stream.iter_frames())), len(audio_file.frames))
+            self.assertEqual(stream.frames.columns(), audio_file.frames.columns())
+
+    def test_pictures_are_skipped(self):
+        data, _ = make_flac(block_size=1152, total_samples=5000,
+                            pictures=[b'\x89PNG' * 5000], padding=10)
+        stream = FlacStream(SlowReader(data, 999), read_size=100)
+        self.assertEqual(stream.picture[0]['width'], 1)
+        offset, length = stream.picture_range(0)
+        self.assertEqual(data[offset:offset + length], b'\x89PNG' * 5000)
+        self.assertLess(len(stream.metadata), 200)
+        self.assertEqual(len(list(stream.iter_frames())), 5)
+
+    def test_decoded_frames(self):
+        stream = FlacStream(SlowReader(self.data, 1000), read_size=300)
+        decoded = decode(AudioFile(self.filename))
+        offsets = []
+        blocks = []
+        for record, channels in stream.iter_frames(decode=True):
+            offsets.append(record[OFFSET])
+            blocks.append(channels)
+            self.assertLessEqual(len(stream.buffer), stream.max_frame_size + 1000)
+        self.assertEqual(offsets, list(stream.frames.offsets))
+        for i, channel in enumerate(decoded):
+            self.assertEqual([s for block in blocks for s in block[i]], list(channel))
+
+    def test_pcm_chunks(self):
+        chunks = list(FlacStream(io.BytesIO(self.data)).iter_pcm(chunk_samples=5000))
+        self.assertEqual([len(chunk[0]) for chunk in chunks], [5000, 5000, 2000])
+        for i, channel in enumerate(self.samples):
+            self.assertEqual([s for chunk in chunks for s in chunk[i]], channel)
+
+    def test_garbage_between_frames(self):
+        audio_file = AudioFile(self.filename)
+        audio_file.parse_frames()
+        second = audio_file.frames[1][OFFSET]
+        data = self.data[:second] + b'\xff\xf8\x00' * 10 + self.data[second:]
+        stream = FlacStream(io.BytesIO(data), read_size=64)
+        first_samples = [record[SAMPLE_NUMBER] for record, _ in stream.iter_frames(decode=True)]
+        self.assertEqual(first_samples, [1152 * i for i in range(11)])
+        self.assertEqual(stream.frames.offsets[1], second + 30)
+
+    def test_filename_only_for_existing_path(self):
+        for name in ('<stdin>', 5):
+            source = io.BytesIO(self.data)
+            source.name = name
+            stream = FlacStream(source)
+            self.assertIsNone(stream.filename)
+            with self.assertRaises(ValueError):
+                stream.seek(5000)
+            with self.assertRaises(ValueError):
+                stream.verify_frames()
+        with open(self.filename, 'rb') as f:
+            stream = FlacStream(f)
+            self.assertEqual(stream.filename, self.filename)
+            self.assertEqual(stream.seek(5000), AudioFile(self.filename).seek(5000))
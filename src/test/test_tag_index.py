@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src.main import tag_index
+from src.main.flac import MD5, RATE, SAMPLES_IN_FLOW
+from src.main.metadata_writer import MetadataEditor
+from src.main.tag_index import TagIndex
+from src.test.fixtures import make_flac
+
+
+class TestTagIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.library = os.path.join(self.dir.name, 'library')
+        os.makedirs(os.path.join(self.library, 'b'))
+        self.files = [os.path.join(self.library, 'a.flac'),
+                      os.path.join(self.library, 'b', 'c.flac'),
+                      os.path.join(self.library, 'b', 'd.flac')]
+        make_flac(self.files[0], total_samples=1000, tags=[('ARTIST', 'One'), ('title', 'First')],
+                  pictures=[b'cover'])
+        make_flac(self.files[1], total_samples=2000, rate=48000,
+                  tags=[('ARTIST', 'Two'), ('ARTIST', 'One'), ('TITLE', 'Second')])
+        make_flac(self.files[2], total_samples=3000, tags=[('ARTIST', 'Three')], padding=1024)
+        self.index = TagIndex(os.path.join(self.dir.name, 'tags.sqlite'))
+
+    def tearDown(self):
+        self.index.close()
+        self.dir.cleanup()
+
+    def test_queries(self):
+        self.assertEqual(self.index.refresh([self.library], workers=2), (3, 0, 0))
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.find({'artist': 'One'}), self.files[:2])
+        self.assertEqual(self.index.find({'ARTIST': 'One', 'TITLE': 'Second'}), [self.files[1]])
+        self.assertEqual(self.index.find({'ARTIST': 'One'}, rate=48000), [self.files[1]])
+        self.assertEqual(self.index.find(rate=44100), [self.files[0], self.files[2]])
+        self.assertEqual(self.index.search('title', '%sec%'), [self.files[1]])
+        self.assertEqual(self.index.values('ARTIST'), [('One', 2), ('Three', 1), ('Two', 1)])
+        with self.assertRaises(ValueError):
+            self.index.find(tempo=120)
+
+        self.assertEqual(self.index.tags(self.files[0]),
+                         {'vendor': 'fixtures', 'ARTIST': {'One'}, 'TITLE': {'First'}})
+        streaminfo = self.index.streaminfo(self.files[1])
+        self.assertEqual(streaminfo[SAMPLES_IN_FLOW], 2000)
+        self.assertEqual(streaminfo[RATE], 48000)
+        self.assertEqual(len(streaminfo[MD5]), 32)
+        pictures = self.index.pictures(self.files[0])
+        self.assertEqual(len(pictures), 1)
+        self.assertEqual(pictures[0]['mime type'], 'image/png')
+        self.assertEqual(pictures[0]['length'], 5)
+        with self.assertRaises(KeyError):
+            self.index.tags(os.path.join(self.library, 'missing.flac'))
+
+    def test_incremental_refresh(self):
+        self.index.refresh([self.library])
+        with mock.patch.object(tag_index, 'read_entry', wraps=tag_index.read_entry) as read_entry:
+            self.assertEqual(self.index.refresh([self.library]), (0, 3, 0))
+            read_entry.assert_not_called()
+
+        editor = MetadataEditor(self.files[2])
+        editor.set_tags({'ARTIST': 'Four'})
+        editor.save()
+        stat = os.stat(self.files[2])
+        os.utime(self.files[2], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        os.remove(self.files[0])
+        with open(os.path.join(self.library, 'b', 'broken.flac'), 'wb') as f:
+            f.write(b'RIFF')
+        self.assertEqual(self.index.refresh([self.library]), (2, 1, 1))
+        self.assertEqual(self.index.find({'ARTIST': 'Four'}), [self.files[2]])
+        self.assertEqual(self.index.find({'ARTIST': 'Three'}), [])
+        self.assertEqual([path for path, _ in self.index.errors()],
+                         [os.path.join(self.library, 'b', 'broken.flac')])
+
+        # обновление подкаталога не трогает остальные записи
+        os.remove(self.files[1])
+        self.assertEqual(self.index.refresh([os.path.join(self.library, 'b')]), (0, 2, 1))
+        self.assertEqual(len(self.index), 2)
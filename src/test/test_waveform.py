@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from math import sqrt
+from src.main.flac import AudioFile
+from src.main.index_cache import IndexCache, PEAKS_SUFFIX
+from src.main.waveform import build_pyramid, load_pyramid, pyramid_of
+from src.test.fixtures import make_flac
+
+
+class TestWaveform(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'wave.flac')
+        _, self.samples = make_flac(self.filename, block_size=1000, total_samples=5000)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def expected(self, start, stop):
+        values = [sample / 32768 for channel in self.samples for sample in channel[start:stop]]
+        return min(values), max(values), sqrt(sum(value * value for value in values) / len(values))
+
+    def test_levels(self):
+        pyramid = build_pyramid(AudioFile(self.filename), bucket=512, factor=4)
+        self.assertEqual(pyramid.total_samples, 5000)
+        self.assertEqual([(level.bucket, len(level)) for level in pyramid.levels],
+                         [(512, 10), (2048, 3), (8192, 1)])
+        for level in pyramid.levels:
+            for i in range(len(level)):
+                expected = self.expected(i * level.bucket, (i + 1) * level.bucket)
+                for column, value in zip(level.columns(), expected):
+                    self.assertAlmostEqual(column[i], value, places=5)
+        mins, maxs, rms = pyramid.view(1)
+        self.assertAlmostEqual(mins[0], pyramid.levels[-1].mins[0], places=5)
+        self.assertAlmostEqual(maxs[0], pyramid.levels[-1].maxs[0], places=5)
+        # пиксель на корзину нижнего уровня
+        mins, maxs, rms = pyramid.view(4, 1024, 3072)
+        self.assertEqual(mins, list(pyramid.levels[0].mins[2:6]))
+        self.assertEqual(rms, [sqrt(value * value) for value in pyramid.levels[0].rms[2:6]])
+
+    def test_cache(self):
+        cache = IndexCache(os.path.join(self.dir.name, 'cache'))
+        audio_file = AudioFile(self.filename)
+        self.assertIsNone(load_pyramid(cache, self.filename))
+        built = pyramid_of(audio_file, cache)
+        loaded = load_pyramid(cache, self.filename)
+        self.assertEqual(loaded.total_samples, 5000)
+        self.assertEqual([level.columns() for level in loaded.levels],
+                         [level.columns() for level in built.levels])
+        self.assertEqual([level.bucket for level in loaded.levels],
+                         [level.bucket for level in built.levels])
+        path = cache.entry_path(self.filename, PEAKS_SUFFIX)
+        with open(path, 'r+b') as f:
+            f.truncate(40)
+        self.assertIsNone(load_pyramid(cache, self.filename))
+        self.assertFalse(os.path.exists(path))